@@ -0,0 +1,46 @@
+import time
+
+from python_utils.auth import Auth
+
+
+PRINCIPAL_COUNT = 10_000
+
+
+def get_token_datas() -> list[dict[str, str]]:
+    return [{"username": f"user_{index}"} for index in range(PRINCIPAL_COUNT)]
+
+
+def bench_per_token_calls(auth: Auth) -> float:
+    token_datas = get_token_datas()
+    start_time = time.perf_counter()
+    for token_data in token_datas:
+        auth.create_access_token(token_data)
+        auth.create_refresh_token(token_data)
+    return time.perf_counter() - start_time
+
+
+def bench_issue_token_pair(auth: Auth) -> float:
+    token_datas = get_token_datas()
+    start_time = time.perf_counter()
+    for token_data in token_datas:
+        auth.issue_token_pair(token_data)
+    return time.perf_counter() - start_time
+
+
+def bench_issue_many(auth: Auth) -> float:
+    token_datas = get_token_datas()
+    start_time = time.perf_counter()
+    for _ in auth.issue_many(token_datas):
+        pass
+    return time.perf_counter() - start_time
+
+
+if __name__ == "__main__":
+    auth = Auth("secret_key", "public_key")
+    for name, bench in [
+        ("create_access_token + create_refresh_token", bench_per_token_calls),
+        ("issue_token_pair", bench_issue_token_pair),
+        ("issue_many", bench_issue_many),
+    ]:
+        duration = bench(auth)
+        print(f"{name:<45} {PRINCIPAL_COUNT / duration:>10.0f} pairs/s ({duration:.3f}s)")
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Union, cast
+
+import httpx
+from fastapi import FastAPI, Request, Response, status
+from fastapi.responses import JSONResponse
+from starlette.responses import StreamingResponse
+
+from python_utils import fastapi_middleware
+from python_utils.fastapi_middleware import (
+    ResponseBodyCapture,
+    get_request_route_pattern,
+    logger,
+    should_log_path,
+)
+from python_utils.loggers import LazyTraceback, logger_handlers, request_log_buffer, set_log_level
+
+
+REQUEST_COUNT = 5_000
+
+
+async def tee_body_iterator(
+    body_iterator: AsyncIterable[Union[str, bytes, memoryview]],
+    body_capture: ResponseBodyCapture,
+    on_complete: Callable[[], None],
+) -> AsyncIterator[Union[str, bytes, memoryview]]:
+    try:
+        async for chunk in body_iterator:
+            body_capture.capture(chunk)
+            yield chunk
+    finally:
+        on_complete()
+
+
+# The BaseHTTPMiddleware implementation replaced by RequestLoggingMiddleware, kept as a baseline
+def add_base_http_middleware(fastapi_app: FastAPI, max_logged_body_bytes: int = 64 * 1024) -> None:
+    @fastapi_app.middleware("http")
+    async def catch_exceptions(  # pyright: ignore[reportUnusedFunction]
+        request: Request, call_next: Callable[[Request], Awaitable[Response]]
+    ):
+        log_path = logger.isEnabledFor(logging.INFO) and should_log_path(request.url.path)
+        request_path_pattern = get_request_route_pattern(fastapi_app, request) if log_path else None
+
+        if log_path:
+            logger.info(
+                "Request received",
+                extra={
+                    "request_path": request.url.path,
+                    "request_path_pattern": request_path_pattern,
+                    "request_method": request.method,
+                    "query_params": request.query_params,
+                    "headers": request.headers,
+                },
+            )
+
+        start_time = time.time()
+
+        with request_log_buffer() as log_buffer:
+            try:
+                response = cast(StreamingResponse, await call_next(request))
+            except Exception as error:
+                if log_buffer is not None:
+                    log_buffer.flush()
+                logger.critical("Request failed", extra={"error": error, "traceback": LazyTraceback(error)})
+                return JSONResponse(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    content={"message": "Unexpected server error"},
+                )
+
+        processing_time = time.time() - start_time
+        response.headers["X-Process-Time"] = str(processing_time)
+        if log_buffer is not None:
+            log_buffer.finish(response.status_code >= status.HTTP_500_INTERNAL_SERVER_ERROR, processing_time)
+
+        if not log_path:
+            return response
+
+        def log_request_processed(response_body: Any) -> None:
+            logger.info(
+                "Request processed",
+                extra={
+                    "request_path": request.url.path,
+                    "request_path_pattern": request_path_pattern,
+                    "request_method": request.method,
+                    "processing_time": processing_time,
+                    "status_code": response.status_code,
+                    "response_body": response_body,
+                },
+            )
+
+        content_type = response.headers.get("content-type")
+        if content_type is None or content_type.startswith("application/json"):
+            body_capture = ResponseBodyCapture(max_logged_body_bytes)
+            response.body_iterator = tee_body_iterator(
+                response.body_iterator,
+                body_capture,
+                lambda: log_request_processed(body_capture.get_parsed_body()),
+            )
+        else:
+            log_request_processed("<streaming response - not logged>")
+
+        return response
+
+
+def create_app(add_middleware: Callable[[FastAPI], None]) -> FastAPI:
+    fastapi_app = FastAPI()
+    add_middleware(fastapi_app)
+
+    @fastapi_app.get("/ressource/{ressource_id}")
+    async def some_route(ressource_id: str):  # pyright: ignore[reportUnusedFunction]
+        return {"ressource_id": ressource_id}
+
+    return fastapi_app
+
+
+async def bench_app(fastapi_app: FastAPI) -> float:
+    transport = httpx.ASGITransport(app=fastapi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start_time = time.perf_counter()
+        for index in range(REQUEST_COUNT):
+            await client.get(f"/ressource/{index}")
+        return time.perf_counter() - start_time
+
+
+if __name__ == "__main__":
+    # Request logs are written, to a null stream, so that the log path is part of the measure
+    with open(os.devnull, "w") as null_stream:
+        for handler in logger_handlers[fastapi_middleware.__name__]:
+            if isinstance(handler, logging.StreamHandler):
+                cast(logging.StreamHandler[Any], handler).setStream(null_stream)
+
+        for log_level, log_label in [(logging.INFO, "logged"), (logging.WARNING, "not logged")]:
+            set_log_level(log_level, fastapi_middleware.__name__)
+            for name, add_middleware in [
+                ("BaseHTTPMiddleware", add_base_http_middleware),
+                ("RequestLoggingMiddleware", fastapi_middleware.add_middleware),
+            ]:
+                duration = asyncio.run(bench_app(create_app(add_middleware)))
+                label = f"{name} ({log_label})"
+                print(f"{label:<40} {REQUEST_COUNT / duration:>10.0f} requests/s ({duration:.3f}s)")
@@ -0,0 +1,42 @@
+import logging
+import time
+import uuid
+
+from starlette.datastructures import Headers, QueryParams
+
+from python_utils.loggers import CustomJsonFormatter
+
+
+RECORD_COUNT = 100_000
+
+
+def get_log_records() -> list[logging.LogRecord]:
+    log_records: list[logging.LogRecord] = []
+    for index in range(RECORD_COUNT):
+        record = logging.LogRecord(__name__, logging.INFO, __file__, 0, "Request received", None, None)
+        record.created = 1_700_000_000 + index / 1000
+        record.request_path = f"/ressource/{index}"
+        record.request_method = "GET"
+        record.request_id = uuid.uuid4()
+        record.query_params = QueryParams({"page": "1"})
+        record.headers = Headers({"content-type": "application/json", "user-agent": "bench"})
+        log_records.append(record)
+    return log_records
+
+
+def bench_formatter(log_formatter: logging.Formatter) -> float:
+    log_records = get_log_records()
+    start_time = time.perf_counter()
+    for record in log_records:
+        log_formatter.format(record)
+    return time.perf_counter() - start_time
+
+
+if __name__ == "__main__":
+    for name, log_formatter in [
+        ("default", CustomJsonFormatter()),
+        ("fast", CustomJsonFormatter(fast=True)),
+        ("fast + compact", CustomJsonFormatter(fast=True, compact=True)),
+    ]:
+        duration = bench_formatter(log_formatter)
+        print(f"{name:<20} {RECORD_COUNT / duration:>10.0f} records/s ({duration:.3f}s)")
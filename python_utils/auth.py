@@ -1,31 +1,285 @@
-from datetime import datetime, timedelta, timezone
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor
+from datetime import datetime
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from jwt import decode, encode  # pyright: ignore
+from jwt import PyJWK, decode, get_unverified_header  # pyright: ignore
+from jwt.algorithms import get_default_algorithms
+from jwt.utils import base64url_encode
 from jwt.exceptions import ExpiredSignatureError, PyJWTError
-from typing import Annotated, Any
+from typing import Annotated, Any, Iterable, Iterator, NamedTuple, Optional
+
+from python_utils.metrics import Histogram
+from python_utils.token_revocation import TokenRevocationList
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Relative cost of a signature verification per algorithm family, HMAC being the reference
+VERIFICATION_COSTS = {"HS": 1, "RS": 20, "PS": 20, "Ed": 30, "ES": 40}
+
 
 class AuthException(Exception):
     def __init__(self, message: str = "Auth exception") -> None:
         self.message = message
 
 
+def get_token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+def get_token_expiration_timestamp(payload: dict[str, Any]) -> Optional[float]:
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        return float(exp)
+
+    # Tokens issued before exp claims were used carry an ISO-8601 "expire" string
+    expire = payload.get("expire")
+    if not isinstance(expire, str):
+        return None
+    try:
+        return datetime.fromisoformat(expire).timestamp()
+    except ValueError:
+        return None
+
+
+class TokenCache:
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 300) -> None:
+        if max_size <= 0:
+            raise ValueError("Token cache max size must be positive")
+
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        # Entries are kept in least recently used order: token digest -> (expiration timestamp, payload)
+        self._entries: OrderedDict[bytes, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, digest: bytes) -> Optional[dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, payload = entry
+            if expires_at <= time.time():
+                del self._entries[digest]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return payload
+
+    def set(self, digest: bytes, payload: dict[str, Any], token_expires_at: Optional[float] = None) -> None:
+        # A cached payload never outlives the token it was verified from
+        expires_at = time.time() + self.ttl_seconds
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        if expires_at <= time.time():
+            return
+
+        with self._lock:
+            self._entries[digest] = (expires_at, payload)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+class AuthKey:
+    def __init__(
+        self,
+        kid: str,
+        algorithm: str,
+        signing_key: Optional[str | bytes] = None,
+        verifying_key: Optional[str | bytes] = None,
+    ) -> None:
+        algorithms = get_default_algorithms()
+        if algorithm == "none" or algorithm not in algorithms:
+            raise AuthException(f"Unsupported algorithm {algorithm}")
+        if signing_key is None and verifying_key is None:
+            raise AuthException("Missing signing or verifying key")
+
+        self.kid = kid
+        self.algorithm = algorithm
+
+        # Keys are parsed once here, so that signing and verifying tokens never re-parse key material
+        algorithm_object = algorithms[algorithm]
+        self._algorithm_object = algorithm_object
+        # The JWS header is the same for every token signed with this key, it is encoded once
+        header = {"alg": algorithm, "kid": kid, "typ": "JWT"}
+        self._header_segment = base64url_encode(json.dumps(header, separators=(",", ":"), sort_keys=True).encode())
+        self.signing_key: Any = None
+        if signing_key is not None:
+            self.signing_key = algorithm_object.prepare_key(signing_key)
+
+        if verifying_key is not None:
+            prepared_verifying_key = algorithm_object.prepare_key(verifying_key)
+        elif algorithm.startswith("HS"):
+            prepared_verifying_key = self.signing_key
+        else:
+            prepared_verifying_key = self.signing_key.public_key()
+
+        verifying_jwk = algorithm_object.to_jwk(  # pyright: ignore[reportUnknownMemberType]
+            prepared_verifying_key, as_dict=True
+        )
+        self.verifying_key = PyJWK(verifying_jwk, algorithm)
+
+    @property
+    def can_sign(self) -> bool:
+        return self.signing_key is not None
+
+    def sign(self, claims: dict[str, Any]) -> str:
+        if self.signing_key is None:
+            raise AuthException(f"Key {self.kid} cannot sign tokens")
+
+        payload_segment = base64url_encode(json.dumps(claims, separators=(",", ":")).encode())
+        signing_input = self._header_segment + b"." + payload_segment
+        signature = self._algorithm_object.sign(signing_input, self.signing_key)
+        return (signing_input + b"." + base64url_encode(signature)).decode()
+
+
+class KeyRing:
+    def __init__(
+        self,
+        keys: list[AuthKey] = [],
+        active_kid: Optional[str] = None,
+        default_kid: Optional[str] = None,  # key used to verify tokens without kid header
+    ) -> None:
+        self._keys: dict[str, AuthKey] = {key.kid: key for key in keys}
+        self._lock = threading.Lock()
+        self.active_kid: Optional[str] = None
+        self.default_kid = default_kid
+        # Incremented each time a key is removed or replaced, so that payloads verified with it can be discarded
+        self.generation = 0
+
+        if active_kid is not None:
+            self.activate_key(active_kid)
+
+    def __contains__(self, kid: str) -> bool:
+        return kid in self._keys
+
+    def get_key(self, kid: Optional[str]) -> AuthKey:
+        if kid is None:
+            kid = self.default_kid
+        key = self._keys.get(kid) if kid is not None else None
+        if key is None:
+            raise AuthException("Unknown key id")
+        return key
+
+    def get_active_key(self) -> AuthKey:
+        if self.active_kid is None:
+            raise AuthException("No active signing key")
+        return self._keys[self.active_kid]
+
+    def add_key(self, key: AuthKey, activate: bool = False) -> None:
+        # Keys are replaced by a new dict instead of being mutated in place, so readers never need the lock
+        with self._lock:
+            if key.kid in self._keys:
+                self.generation += 1
+            self._keys = {**self._keys, key.kid: key}
+        if activate:
+            self.activate_key(key.kid)
+
+    def activate_key(self, kid: str) -> None:
+        key = self.get_key(kid)
+        if not key.can_sign:
+            raise AuthException(f"Key {kid} cannot sign tokens")
+        self.active_kid = kid
+
+    def remove_key(self, kid: str) -> None:
+        with self._lock:
+            if kid not in self._keys:
+                raise AuthException("Unknown key id")
+            self._keys = {key_id: key for key_id, key in self._keys.items() if key_id != kid}
+            if self.active_kid == kid:
+                self.active_kid = None
+            if self.default_kid == kid:
+                self.default_kid = None
+            self.generation += 1
+
+
+class VerificationStats:
+    def __init__(self) -> None:
+        self.inline_latency = Histogram()
+        # Offloaded latency includes the time spent waiting for a free worker
+        self.offloaded_latency = Histogram()
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self._lock = threading.Lock()
+
+    def increment_queue_depth(self) -> None:
+        with self._lock:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def decrement_queue_depth(self) -> None:
+        with self._lock:
+            self.queue_depth -= 1
+
+    def get_stats(self) -> dict[str, Any]:
+        inline_latency = self.inline_latency.snapshot()
+        offloaded_latency = self.offloaded_latency.snapshot()
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "inline_count": inline_latency.count,
+            "inline_latency_p50": inline_latency.quantile(0.5),
+            "inline_latency_p99": inline_latency.quantile(0.99),
+            "offloaded_count": offloaded_latency.count,
+            "offloaded_latency_p50": offloaded_latency.quantile(0.5),
+            "offloaded_latency_p99": offloaded_latency.quantile(0.99),
+        }
+
+
+class TokenPair(NamedTuple):
+    access_token: str
+    refresh_token: str
+
+
 class Auth:
     def __init__(
         self,
-        secret_key: str,
+        secret_key: Optional[str],
         public_key: str,
         token_data_keys: list[str] = ["username"],
         access_token_expire_seconds: int = 86400,  # 1 day
         refresh_token_expire_days: int = 30,  # 30 days
+        token_cache_size: int = 1024,  # 0 disables the verified token cache
+        token_cache_ttl_seconds: int = 300,  # 5 minutes
+        key_ring: Optional[KeyRing] = None,
+        revocation_list: Optional[TokenRevocationList] = None,
+        leeway_seconds: int = 5,  # tolerated clock skew between issuing and verifying hosts
+        accept_legacy_expire: bool = False,  # also accept tokens carrying an ISO-8601 "expire" instead of "exp"
+        verification_executor: Optional[Executor] = None,  # bounded thread pool used by get_current_user
+        offload_cost_threshold: int = 10,  # algorithms costing at least this much are verified in the executor
     ) -> None:
         self.secret_key = secret_key
         self.public_key = public_key
-        self.algorithm = "HS256"
+
+        if key_ring is None:
+            if secret_key is None:
+                raise AuthException("Missing secret key or key ring")
+            key_ring = KeyRing([AuthKey("default", "HS256", secret_key)], active_kid="default", default_kid="default")
+        self.key_ring = key_ring
+        self.revocation_list = revocation_list
 
         if len(token_data_keys) == 0 or "username" not in token_data_keys:
             raise AuthException("Invalid token data keys")
@@ -33,43 +287,179 @@ class Auth:
         self.token_data_keys = token_data_keys
         self.access_token_expire_seconds = access_token_expire_seconds
         self.refresh_token_expire_days = refresh_token_expire_days
+        self.leeway_seconds = leeway_seconds
+        self.accept_legacy_expire = accept_legacy_expire
+        self._decode_options: dict[str, Any] = {"require": [] if accept_legacy_expire else ["exp"]}
+        self.verification_executor = verification_executor
+        self.offload_cost_threshold = offload_cost_threshold
+        self.verification_stats = VerificationStats()
+
+        self.token_cache: Optional[TokenCache] = None
+        if token_cache_size > 0:
+            self.token_cache = TokenCache(token_cache_size, token_cache_ttl_seconds)
+        self._token_cache_generation = self.key_ring.generation
+
+    @property
+    def algorithm(self) -> str:
+        return self.key_ring.get_active_key().algorithm
+
+    @property
+    def refresh_token_expire_seconds(self) -> int:
+        return self.refresh_token_expire_days * 86400
+
+    def _validate_token_data(self, token_data: dict[str, Any]) -> None:
+        if all(key not in token_data for key in self.token_data_keys):
+            raise AuthException("Missing required data in token")
+
+    def _get_claims(self, token_data: dict[str, Any], expire_seconds: int) -> dict[str, Any]:
+        now = int(time.time())
+        return {**token_data, "iat": now, "nbf": now, "exp": now + expire_seconds}
+
+    def _encode(self, token_data: dict[str, Any], key: Optional[AuthKey] = None) -> str:
+        if key is None:
+            key = self.key_ring.get_active_key()
+        return key.sign(token_data)
+
+    def _issue_token_pair(self, token_data: dict[str, Any], now: int, key: AuthKey) -> TokenPair:
+        self._validate_token_data(token_data)
+
+        # Both tokens share a single claim set, only their expiration differs
+        claims = {**token_data, "iat": now, "nbf": now, "exp": now + self.access_token_expire_seconds}
+        access_token = self._encode(claims, key)
+        claims["exp"] = now + self.refresh_token_expire_seconds
+        refresh_token = self._encode(claims, key)
+        return TokenPair(access_token, refresh_token)
 
     def validate_public_key(self, public_key: str) -> None:
         if public_key != self.public_key:
             raise AuthException("Invalid public key")
 
     def create_access_token(self, token_data: dict[str, Any]) -> str:
-        if all(key not in token_data for key in self.token_data_keys):
-            raise AuthException("Missing required data in token")
+        self._validate_token_data(token_data)
 
-        expire = datetime.now(timezone.utc) + timedelta(seconds=self.access_token_expire_seconds)
-        token_data.update({"expire": expire.isoformat()})
-        access_token = encode(token_data, self.secret_key, algorithm=self.algorithm)
+        access_token = self._encode(self._get_claims(token_data, self.access_token_expire_seconds))
         return access_token
 
     def create_refresh_token(self, token_data: dict[str, Any]) -> str:
-        if all(key not in token_data for key in self.token_data_keys):
-            raise AuthException("Missing required data in token")
+        self._validate_token_data(token_data)
 
-        expire = datetime.now(timezone.utc) + timedelta(days=self.refresh_token_expire_days)
-        token_data.update({"expire": expire.isoformat()})
-        refresh_token = encode(token_data, self.secret_key, algorithm=self.algorithm)
+        refresh_token = self._encode(self._get_claims(token_data, self.refresh_token_expire_seconds))
         return refresh_token
 
-    def validate_token(self, token: str) -> None:
+    def issue_token_pair(self, token_data: dict[str, Any]) -> TokenPair:
+        return self._issue_token_pair(token_data, int(time.time()), self.key_ring.get_active_key())
+
+    def issue_many(self, token_datas: Iterable[dict[str, Any]]) -> Iterator[TokenPair]:
+        # Pairs are yielded one by one, so that large batches never need to be held in memory. The clock is read for
+        # each pair, as consumers may wait between two pairs.
+        key = self.key_ring.get_active_key()
+        for token_data in token_datas:
+            yield self._issue_token_pair(token_data, int(time.time()), key)
+
+    def _check_revocation(self, digest: bytes) -> None:
+        if self.revocation_list is not None and self.revocation_list.is_revoked(digest):
+            raise AuthException("Token revoked")
+
+    async def _check_revocation_async(self, digest: bytes) -> None:
+        # The store lookup may query a database: it runs off the event loop, only the bloom filter check stays on it
+        revocation_list = self.revocation_list
+        if revocation_list is None or not revocation_list.may_be_revoked(digest):
+            return
+        if await asyncio.get_running_loop().run_in_executor(
+            self.verification_executor, revocation_list.store.is_revoked, digest
+        ):
+            raise AuthException("Token revoked")
+
+    def _get_cached_payload(self, digest: bytes) -> Optional[dict[str, Any]]:
+        if self.token_cache is None:
+            return None
+        if self._token_cache_generation != self.key_ring.generation:
+            self.token_cache.clear()
+            self._token_cache_generation = self.key_ring.generation
+        return self.token_cache.get(digest)
+
+    def _get_verification_key(self, token: str) -> AuthKey:
+        try:
+            return self.key_ring.get_key(get_unverified_header(token).get("kid"))
+        except (AuthException, PyJWTError):
+            raise AuthException("Invalid token")
+
+    def _verify_token(self, token: str, digest: bytes, key: AuthKey) -> dict[str, Any]:
         try:
-            decode(token, self.secret_key, algorithms=[self.algorithm])
+            payload: dict[str, Any] = decode(
+                token,
+                key.verifying_key,
+                algorithms=[key.algorithm],
+                leeway=self.leeway_seconds,
+                options=self._decode_options,
+            )
         except ExpiredSignatureError:
             raise AuthException("Token expired")
         except PyJWTError:
             raise AuthException("Invalid token")
 
-    def refresh_access_token(self, refresh_token: str) -> str:
+        if "exp" not in payload:
+            self._validate_legacy_expire(payload)
+
+        if self.token_cache is not None:
+            self.token_cache.set(digest, payload, get_token_expiration_timestamp(payload))
+
+        return payload
+
+    def decode_token(self, token: str) -> dict[str, Any]:
+        # The returned payload may be shared with the token cache, it must not be mutated
+        digest = get_token_digest(token)
+        self._check_revocation(digest)
+        cached_payload = self._get_cached_payload(digest)
+        if cached_payload is not None:
+            return cached_payload
+        return self._verify_token(token, digest, self._get_verification_key(token))
+
+    async def decode_token_async(self, token: str) -> dict[str, Any]:
+        digest = get_token_digest(token)
+        await self._check_revocation_async(digest)
+        cached_payload = self._get_cached_payload(digest)
+        if cached_payload is not None:
+            return cached_payload
+
+        key = self._get_verification_key(token)
+        start_time = time.perf_counter()
+
+        # Cheap verifications stay on the event loop, a thread hop would cost more than the verification itself
+        cost = VERIFICATION_COSTS.get(key.algorithm[:2], self.offload_cost_threshold)
+        if self.verification_executor is None or cost < self.offload_cost_threshold:
+            try:
+                return self._verify_token(token, digest, key)
+            finally:
+                self.verification_stats.inline_latency.observe(time.perf_counter() - start_time)
+
+        self.verification_stats.increment_queue_depth()
         try:
-            self.validate_token(refresh_token)
-        except AuthException:
-            raise
-        payload = decode(refresh_token, self.secret_key, algorithms=[self.algorithm])
+            return await asyncio.get_running_loop().run_in_executor(
+                self.verification_executor, self._verify_token, token, digest, key
+            )
+        finally:
+            self.verification_stats.decrement_queue_depth()
+            self.verification_stats.offloaded_latency.observe(time.perf_counter() - start_time)
+
+    def revoke_token(self, token: str) -> None:
+        if self.revocation_list is None:
+            raise AuthException("Token revocation is not enabled")
+        payload = self.decode_token(token)
+        self.revocation_list.revoke(get_token_digest(token), get_token_expiration_timestamp(payload))
+
+    def _validate_legacy_expire(self, payload: dict[str, Any]) -> None:
+        expires_at = get_token_expiration_timestamp(payload)
+        if expires_at is None:
+            raise AuthException("Invalid token")
+        if expires_at <= time.time() - self.leeway_seconds:
+            raise AuthException("Token expired")
+
+    def validate_token(self, token: str) -> None:
+        self.decode_token(token)
+
+    def refresh_access_token(self, refresh_token: str) -> str:
+        payload = self.decode_token(refresh_token)
         token_data: dict[str, Any] = {}
         for key in self.token_data_keys:
             if key not in payload:
@@ -83,12 +473,11 @@ class Auth:
         self, token: Annotated[str, Depends(oauth2_scheme)]
     ) -> str:
         try:
-            self.validate_token(token)
+            payload = await self.decode_token_async(token)
         except AuthException:
             raise HTTPException(
                 status_code=401, detail="Invalid authentication credentials"
             )
-        payload = decode(token, self.secret_key, algorithms=[self.algorithm])
         username = payload.get("username")
         if username is None:
             raise HTTPException(
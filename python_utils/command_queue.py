@@ -0,0 +1,197 @@
+import asyncio
+import contextlib
+import itertools
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Generator, Literal, Optional, ParamSpec, TypeVar
+
+from python_utils.loggers import get_logger
+
+
+logger = get_logger(__name__)
+
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+Backpressure = Literal["block", "reject"]
+
+
+class _WorkItem:
+    def __init__(self, command: Callable[..., Any], args: Any, kwargs: Any, future: "Future[Any]") -> None:
+        self.command = command
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+
+
+# Queue entries: (priority, sequence, work item), a None work item stops the worker reading it
+_QueueEntry = tuple[float, int, Optional[_WorkItem]]
+
+
+class CommandQueue:
+    def __init__(
+        self,
+        worker_count: int = 4,
+        max_size: int = 1000,
+        backpressure: Backpressure = "block",
+        block_timeout_seconds: Optional[float] = None,  # wait forever by default
+    ) -> None:
+        if worker_count <= 0:
+            raise ValueError("Command queue worker count must be positive")
+
+        self.worker_count = worker_count
+        self.max_size = max_size
+        self.backpressure = backpressure
+        self.block_timeout_seconds = block_timeout_seconds
+
+        self._queue: queue.PriorityQueue[_QueueEntry] = queue.PriorityQueue(max_size)
+        # Keeps FIFO order between commands of the same priority
+        self._sequence = itertools.count()
+        self._workers: list[threading.Thread] = []
+        self._lock = threading.Lock()
+        # Shutdown waits for the submissions in progress, so that no command is queued after the stop entries
+        self._submissions = threading.Condition()
+        self._submission_count = 0
+        self._started = False
+        self._shut_down = False
+        self.running_count = 0
+        self.completed_count = 0
+        self.failed_count = 0
+        self.rejected_count = 0
+
+    def __enter__(self) -> "CommandQueue":
+        self.start()
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.shutdown()
+
+    def start(self) -> None:
+        with self._submissions:
+            if self._shut_down:
+                raise RuntimeError("Cannot start a command queue after shutdown")
+            if self._started:
+                return
+            self._started = True
+        for index in range(self.worker_count):
+            worker = threading.Thread(target=self._work, name=f"command-queue-worker-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def shutdown(self) -> None:
+        with self._submissions:
+            if self._shut_down:
+                return
+            self._shut_down = True
+            self._submissions.wait_for(lambda: self._submission_count == 0)
+        # Stop entries have the lowest priority, so that workers drain the queued commands first
+        for _ in self._workers:
+            self._queue.put((float("inf"), next(self._sequence), None))
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def _work(self) -> None:
+        while True:
+            _, _, work_item = self._queue.get()
+            if work_item is None:
+                return
+            if not work_item.future.set_running_or_notify_cancel():
+                continue
+
+            # Bound commands create their own CommandContext, in the worker thread
+            with self._lock:
+                self.running_count += 1
+            try:
+                result = work_item.command(*work_item.args, **work_item.kwargs)
+            except BaseException as exception:
+                with self._lock:
+                    self.running_count -= 1
+                    self.failed_count += 1
+                work_item.future.set_exception(exception)
+            else:
+                with self._lock:
+                    self.running_count -= 1
+                    self.completed_count += 1
+                work_item.future.set_result(result)
+
+    def _create_entry(
+        self, priority: float, command: Callable[..., Any], args: Any, kwargs: Any
+    ) -> tuple["Future[Any]", _QueueEntry]:
+        future: Future[Any] = Future()
+        return future, (priority, next(self._sequence), _WorkItem(command, args, kwargs, future))
+
+    @contextlib.contextmanager
+    def _submission(self) -> Generator[None, None, None]:
+        with self._submissions:
+            if self._shut_down:
+                raise RuntimeError("Cannot submit commands to a command queue after shutdown")
+            if not self._started:
+                raise RuntimeError("Cannot submit commands to a command queue before it is started")
+            self._submission_count += 1
+        try:
+            yield
+        finally:
+            with self._submissions:
+                self._submission_count -= 1
+                self._submissions.notify_all()
+
+    def _reject(self, command: Callable[..., Any]) -> "CommandQueueFullException":
+        with self._lock:
+            self.rejected_count += 1
+        logger.warning("Command queue is full, command rejected", extra={"command_name": command.__name__})
+        return CommandQueueFullException()
+
+    # Lower priorities run first
+    def submit_with_priority(
+        self, priority: float, command: Callable[P, R], *args: P.args, **kwargs: P.kwargs
+    ) -> "Future[R]":
+        future, entry = self._create_entry(priority, command, args, kwargs)
+        with self._submission():
+            try:
+                if self.backpressure == "block":
+                    self._queue.put(entry, timeout=self.block_timeout_seconds)
+                else:
+                    self._queue.put_nowait(entry)
+            except queue.Full:
+                raise self._reject(command)
+        return future
+
+    def submit(self, command: Callable[P, R], *args: P.args, **kwargs: P.kwargs) -> "Future[R]":
+        return self.submit_with_priority(0, command, *args, **kwargs)
+
+    async def submit_with_priority_async(
+        self, priority: float, command: Callable[P, R], *args: P.args, **kwargs: P.kwargs
+    ) -> R:
+        future, entry = self._create_entry(priority, command, args, kwargs)
+        with self._submission():
+            try:
+                self._queue.put_nowait(entry)
+            except queue.Full:
+                if self.backpressure == "reject":
+                    raise self._reject(command)
+                # Waiting for a free slot must not block the event loop
+                try:
+                    await asyncio.to_thread(self._queue.put, entry, True, self.block_timeout_seconds)
+                except queue.Full:
+                    raise self._reject(command)
+        return await asyncio.wrap_future(future)
+
+    async def submit_async(self, command: Callable[P, R], *args: P.args, **kwargs: P.kwargs) -> R:
+        return await self.submit_with_priority_async(0, command, *args, **kwargs)
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            "queue_size": self._queue.qsize(),
+            "running": self.running_count,
+            "completed": self.completed_count,
+            "failed": self.failed_count,
+            "rejected": self.rejected_count,
+        }
+
+
+class CommandQueueFullException(Exception):
+    def __init__(self):
+        super().__init__("The command queue is full")
@@ -1,9 +1,28 @@
+import contextlib
+import logging
+import random
+import threading
 import time
-import traceback
 
-from typing import Callable, Concatenate, Generic, ParamSpec, Protocol, TypeVar
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Concatenate,
+    Generator,
+    Generic,
+    Optional,
+    ParamSpec,
+    Protocol,
+    TypeVar,
+    cast,
+)
 
-from python_utils.loggers import get_logger
+from python_utils.idempotency import IdempotencyStore
+from python_utils.loggers import LazyTraceback, get_logger
+from python_utils.metrics import Counter, Histogram, HistogramSnapshot
 
 logger = get_logger(__name__, indent=4)
 
@@ -14,118 +33,618 @@ class CommandContext(Protocol):
     def commit(self) -> None: ...
 
 
+class AsyncCommandContext(Protocol):
+    async def rollback(self) -> None: ...
+
+    async def commit(self) -> None: ...
+
+
 CC = TypeVar("CC", bound=CommandContext)
+ACC = TypeVar("ACC", bound=AsyncCommandContext)
 P = ParamSpec("P")
 R = TypeVar("R")
 
 CommandContextCreator = Callable[[], CC]
+AsyncCommandContextCreator = Callable[[], ACC]
+
+
+@dataclass(frozen=True)
+class CommandMetricsSnapshot:
+    command_name: str
+    success_count: int
+    rollback_count: int
+    commit_failure_count: int
+    retry_count: int
+    idempotency_hit_count: int
+    latency: HistogramSnapshot
+
+
+class CommandMetrics:
+    def __init__(self, command_name: str) -> None:
+        self.command_name = command_name
+        self.success_count = Counter()
+        self.rollback_count = Counter()
+        self.commit_failure_count = Counter()
+        self.retry_count = Counter()
+        self.idempotency_hit_count = Counter()
+        self.latency = Histogram()
+
+    def snapshot(self) -> CommandMetricsSnapshot:
+        return CommandMetricsSnapshot(
+            self.command_name,
+            self.success_count.value,
+            self.rollback_count.value,
+            self.commit_failure_count.value,
+            self.retry_count.value,
+            self.idempotency_hit_count.value,
+            self.latency.snapshot(),
+        )
+
+
+class DomainMetrics:
+    def __init__(self) -> None:
+        self._command_metrics: dict[str, CommandMetrics] = {}
+        self._lock = threading.Lock()
+
+    def get_command_metrics(self, command_name: str) -> CommandMetrics:
+        with self._lock:
+            if command_name not in self._command_metrics:
+                self._command_metrics[command_name] = CommandMetrics(command_name)
+            return self._command_metrics[command_name]
+
+    def snapshot(self) -> dict[str, CommandMetricsSnapshot]:
+        return {
+            command_name: command_metrics.snapshot()
+            for command_name, command_metrics in list(self._command_metrics.items())
+        }
+
+
+def _log_command_call(command: Callable[..., Any], args: Any, kwargs: Any) -> None:
+    logger.debug(
+        "Command about to be called",
+        extra={
+            "command_name": command.__name__,
+            "command_args": args,
+            "command_kwargs": kwargs,
+        },
+    )
+
+
+def _log_command_error(message: str, exception: Exception) -> None:
+    logger.error(
+        message,
+        extra={
+            "error": str(exception),
+            "error_class": exception.__class__.__name__,
+            "traceback": LazyTraceback(exception),
+        },
+    )
+
+
+def _log_command_result(command: Callable[..., Any], result: Any, duration: float) -> None:
+    logger.debug(
+        "Command returned",
+        extra={
+            "command_name": command.__name__,
+            "result": result,
+            "duration": duration,
+        },
+    )
+
+
+def _rollback_command_context(command_context: CommandContext, original_exception: Exception, message: str) -> None:
+    # Attempt to rollback the command
+    try:
+        command_context.rollback()
+
+    # Catch any exception raised during command rollback
+    except Exception as original_rollback_exception:
+        _log_command_error(message, original_rollback_exception)
+
+        # Set the original exception as context of the original_rollback_exception
+        original_rollback_exception.__cause__ = original_exception
+        # Raise a new CommandRollbackException, using the original_rollback_exception as context
+        raise CommandRollbackException() from original_rollback_exception
+
+
+def _commit_command_context(command_context: CommandContext) -> None:
+    # Attempt to commit the command
+    try:
+        command_context.commit()
+    # Catch any exception raised during command commit
+    except Exception as original_commit_exception:
+        _log_command_error("An unexpected error occurred during command commit", original_commit_exception)
+
+        _rollback_command_context(
+            command_context,
+            original_commit_exception,
+            "An unexpected error occurred during command rollback after a commit failed",
+        )
+
+        # Create a new CommandCommitException to be raised, using the original exception as context
+        raise CommandCommitException() from original_commit_exception
+
+
+# Postgres SQLSTATE codes of serialization failures and deadlocks
+TRANSIENT_PGCODES = {"40001", "40P01"}
+
+
+def is_transient_database_error(exception: BaseException) -> bool:
+    # Database errors may be wrapped by SQLAlchemy (as `orig`) or by CommandCommitException (as `__cause__`)
+    current_exception: Optional[BaseException] = exception
+    while current_exception is not None:
+        pgcode = getattr(current_exception, "pgcode", None) or getattr(
+            getattr(current_exception, "orig", None), "pgcode", None
+        )
+        if pgcode in TRANSIENT_PGCODES:
+            return True
+        current_exception = current_exception.__cause__
+    return False
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay_seconds: float = 0.05,
+        max_delay_seconds: float = 2.0,
+        is_retryable: Callable[[BaseException], bool] = is_transient_database_error,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        if max_attempts < 1:
+            raise ValueError("Retry policy max attempts must be at least 1")
+
+        self.max_attempts = max_attempts
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.is_retryable = is_retryable
+        self.sleep = sleep
+
+    def get_delay(self, attempt: int) -> float:
+        # Exponential backoff with full jitter, so that conflicting commands do not retry in lockstep
+        return random.uniform(0, min(self.max_delay_seconds, self.base_delay_seconds * 2 ** (attempt - 1)))
+
+
+class CommandBatch(Generic[CC]):
+    def __init__(self, command_context: CC, chunk_size: Optional[int]) -> None:
+        if chunk_size is not None and chunk_size <= 0:
+            raise ValueError("Command batch chunk size must be positive")
+
+        self.command_context = command_context
+        # Without chunk size, the batch is all-or-nothing: it is committed once, when it exits
+        self.chunk_size = chunk_size
+        self.pending_count = 0
+        self.committed_count = 0
+        self.aborted = False
+
+    def commit(self) -> None:
+        if self.pending_count == 0:
+            return
+        try:
+            _commit_command_context(self.command_context)
+        except Exception:
+            self._discard_pending()
+            raise
+        self.committed_count += self.pending_count
+        self.pending_count = 0
+
+    def rollback(self, original_exception: Exception) -> None:
+        try:
+            _rollback_command_context(
+                self.command_context, original_exception, "An unexpected error occurred during command batch rollback"
+            )
+        finally:
+            self._discard_pending()
+
+    def _discard_pending(self) -> None:
+        self.pending_count = 0
+        if self.chunk_size is None:
+            self.aborted = True
+
+
+class _InFlightCall:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.succeeded = False
+        self.result: Any = None
 
 
 class Domain(Generic[CC]):
-    def __init__(self, command_context_creator: CommandContextCreator[CC]) -> None:
+    def __init__(
+        self,
+        command_context_creator: CommandContextCreator[CC],
+        retry_policy: Optional[RetryPolicy] = None,
+        # Contexts used by queries, e.g. read-only sessions on a replica, defaults to command_context_creator
+        query_context_creator: Optional[CommandContextCreator[CC]] = None,
+        idempotency_store: Optional[IdempotencyStore] = None,
+    ) -> None:
         self.command_context_creator = command_context_creator
+        self.retry_policy = retry_policy
+        self.query_context_creator = query_context_creator or command_context_creator
+        self.idempotency_store = idempotency_store
+        self.metrics = DomainMetrics()
+        self._current_batch: ContextVar[Optional[CommandBatch[CC]]] = ContextVar(
+            f"command_batch_{id(self)}", default=None
+        )
+        self._idempotency_key: ContextVar[Optional[str]] = ContextVar(f"idempotency_key_{id(self)}", default=None)
+        self._in_flight_calls: dict[str, _InFlightCall] = {}
+        self._in_flight_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def batch(self, chunk_size: Optional[int] = None) -> Generator[CommandBatch[CC], None, None]:
+        # Nested batches join the outermost one
+        current_batch = self._current_batch.get()
+        if current_batch is not None:
+            yield current_batch
+            return
+
+        command_batch = CommandBatch(self.command_context_creator(), chunk_size)
+        token = self._current_batch.set(command_batch)
+        try:
+            yield command_batch
+        except Exception as original_exception:
+            # Failed batched commands have already rolled back their own work
+            if command_batch.pending_count > 0:
+                command_batch.rollback(original_exception)
+            raise
+        finally:
+            self._current_batch.reset(token)
+
+        if command_batch.aborted:
+            raise CommandBatchAbortedException()
+        command_batch.commit()
+
+    def _run_in_batch(
+        self,
+        command_batch: CommandBatch[CC],
+        command: Callable[Concatenate[CC, P], R],
+        command_metrics: CommandMetrics,
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> R:
+        if command_batch.aborted:
+            raise CommandBatchAbortedException()
+
+        start_time = time.perf_counter()
+        try:
+            result = command(command_batch.command_context, *args, **kwargs)
+        except Exception as original_execution_exception:
+            _log_command_error(
+                "An unexpected error occurred during batched command execution, rollback will be applied.",
+                original_execution_exception,
+            )
+            command_metrics.rollback_count.increment()
+            command_metrics.latency.observe(time.perf_counter() - start_time)
+
+            command_batch.rollback(original_execution_exception)
+            raise original_execution_exception
+
+        command_batch.pending_count += 1
+        if command_batch.chunk_size is not None and command_batch.pending_count >= command_batch.chunk_size:
+            try:
+                command_batch.commit()
+            except Exception:
+                command_metrics.commit_failure_count.increment()
+                command_metrics.latency.observe(time.perf_counter() - start_time)
+                raise
+
+        duration = time.perf_counter() - start_time
+        command_metrics.success_count.increment()
+        command_metrics.latency.observe(duration)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            _log_command_result(command, result, duration)
+        return result
+
+    def _execute_command(
+        self,
+        command: Callable[Concatenate[CC, P], R],
+        command_metrics: CommandMetrics,
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> R:
+        start_time = time.perf_counter()
+
+        command_context = self.command_context_creator()
+
+        # Attempt to execute the command
+        try:
+            result = command(command_context, *args, **kwargs)
+
+        # Catch any exception raised during command execution
+        except Exception as original_execution_exception:
+            _log_command_error(
+                "An unexpected error occurred during command execution, rollback will be applied.",
+                original_execution_exception,
+            )
+            command_metrics.rollback_count.increment()
+            command_metrics.latency.observe(time.perf_counter() - start_time)
+
+            _rollback_command_context(
+                command_context, original_execution_exception, "An unexpected error occurred during command rollback"
+            )
+            raise original_execution_exception
+
+        try:
+            _commit_command_context(command_context)
+        except Exception:
+            command_metrics.commit_failure_count.increment()
+            command_metrics.latency.observe(time.perf_counter() - start_time)
+            raise
+
+        duration = time.perf_counter() - start_time
+        command_metrics.success_count.increment()
+        command_metrics.latency.observe(duration)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            _log_command_result(command, result, duration)
+        return result
+
+    def _execute_command_with_retries(
+        self,
+        command: Callable[Concatenate[CC, P], R],
+        command_metrics: CommandMetrics,
+        retry_policy: Optional[RetryPolicy],
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> R:
+        attempt = 1
+        while True:
+            try:
+                return self._execute_command(command, command_metrics, *args, **kwargs)
+            except Exception as exception:
+                if (
+                    retry_policy is None
+                    or attempt >= retry_policy.max_attempts
+                    or not retry_policy.is_retryable(exception)
+                ):
+                    raise
+
+                delay = retry_policy.get_delay(attempt)
+                logger.warning(
+                    "Transient error during command execution, it will be retried",
+                    extra={
+                        "command_name": command.__name__,
+                        "attempt": attempt,
+                        "delay": delay,
+                        "error_class": exception.__class__.__name__,
+                    },
+                )
+                command_metrics.retry_count.increment()
+                retry_policy.sleep(delay)
+                attempt += 1
+
+    @contextlib.contextmanager
+    def idempotency_key(self, key: str) -> Generator[None, None, None]:
+        token = self._idempotency_key.set(key)
+        try:
+            yield
+        finally:
+            self._idempotency_key.reset(token)
+
+    def _run_idempotent(
+        self,
+        idempotency_store: IdempotencyStore,
+        key: str,
+        command_metrics: CommandMetrics,
+        execute: Callable[[], R],
+    ) -> R:
+        while True:
+            found, result = idempotency_store.get(key)
+            if found:
+                command_metrics.idempotency_hit_count.increment()
+                return cast(R, result)
+
+            with self._in_flight_lock:
+                in_flight_call = self._in_flight_calls.get(key)
+                is_owner = in_flight_call is None
+                if in_flight_call is None:
+                    in_flight_call = _InFlightCall()
+                    self._in_flight_calls[key] = in_flight_call
+
+            # Concurrent duplicates wait for the first call and reuse its result, or run again if it failed
+            if not is_owner:
+                in_flight_call.done.wait()
+                if in_flight_call.succeeded:
+                    command_metrics.idempotency_hit_count.increment()
+                    return cast(R, in_flight_call.result)
+                continue
+
+            try:
+                # The first call may have completed between the store lookup and the in-flight registration
+                found, result = idempotency_store.get(key)
+                if found:
+                    command_metrics.idempotency_hit_count.increment()
+                    return cast(R, result)
+
+                result = execute()
+                in_flight_call.result = result
+                in_flight_call.succeeded = True
+                # The command is already committed, a result that can not be stored must not fail the call
+                try:
+                    idempotency_store.set(key, result)
+                except Exception as exception:
+                    logger.error(
+                        "Failed to store idempotent command result",
+                        extra={
+                            "idempotency_key": key,
+                            "error": str(exception),
+                            "error_class": exception.__class__.__name__,
+                            "traceback": LazyTraceback(exception),
+                        },
+                    )
+                return result
+            finally:
+                with self._in_flight_lock:
+                    del self._in_flight_calls[key]
+                in_flight_call.done.set()
 
     def _bind_command(
         self,
         command: Callable[Concatenate[CC, P], R],
+        retry_policy: Optional[RetryPolicy] = None,  # overrides the domain retry policy for this command
+        # Reuse the result of a previous call made with the same idempotency key. Results must be supported by the
+        # idempotency store, e.g. JSON serializable for SqlAlchemyPostgresqlIdempotencyStore.
+        idempotent: bool = False,
     ) -> Callable[P, R]:
+        command_metrics = self.metrics.get_command_metrics(command.__name__)
+        idempotency_store = self.idempotency_store
+        if idempotent and idempotency_store is None:
+            raise ValueError("Idempotent commands require an idempotency store")
+
         def bound_command(*args: P.args, **kwargs: P.kwargs) -> R:
-            logger.debug(
-                "Command about to be called",
-                extra={
-                    "command_name": command.__name__,
-                    "command_args": args,
-                    "command_kwargs": kwargs,
-                },
-            )
+            if logger.isEnabledFor(logging.DEBUG):
+                _log_command_call(command, args, kwargs)
+
+            # Batched commands share a context, so they can not be retried on their own. Their results are not
+            # stored for idempotency either, as they are only committed when the batch is.
+            command_batch = self._current_batch.get()
+            if command_batch is not None:
+                return self._run_in_batch(command_batch, command, command_metrics, *args, **kwargs)
+
+            policy = retry_policy or self.retry_policy
+
+            idempotency_key = self._idempotency_key.get()
+            if idempotency_store is not None and idempotent and idempotency_key is not None:
+                return self._run_idempotent(
+                    idempotency_store,
+                    f"{command.__name__}:{idempotency_key}",
+                    command_metrics,
+                    lambda: self._execute_command_with_retries(command, command_metrics, policy, *args, **kwargs),
+                )
+
+            return self._execute_command_with_retries(command, command_metrics, policy, *args, **kwargs)
 
-            start_time = time.time()
+        return bound_command
+
+    def _bind_query(
+        self,
+        query: Callable[Concatenate[CC, P], R],
+    ) -> Callable[P, R]:
+        query_metrics = self.metrics.get_command_metrics(query.__name__)
+
+        def bound_query(*args: P.args, **kwargs: P.kwargs) -> R:
+            if logger.isEnabledFor(logging.DEBUG):
+                _log_command_call(query, args, kwargs)
+
+            # Queries run in a batch read its uncommitted writes
+            command_batch = self._current_batch.get()
+            if command_batch is not None:
+                return query(command_batch.command_context, *args, **kwargs)
+
+            start_time = time.perf_counter()
+
+            query_context = self.query_context_creator()
+
+            try:
+                result = query(query_context, *args, **kwargs)
+            except Exception as original_execution_exception:
+                _log_command_error("An unexpected error occurred during query execution", original_execution_exception)
+                query_metrics.rollback_count.increment()
+                query_metrics.latency.observe(time.perf_counter() - start_time)
+
+                _rollback_command_context(
+                    query_context, original_execution_exception, "An unexpected error occurred during query rollback"
+                )
+                raise original_execution_exception
+
+            # Queries never commit: a rollback ends their transaction without a commit round trip to the primary
+            try:
+                query_context.rollback()
+            except Exception as original_rollback_exception:
+                _log_command_error(
+                    "An unexpected error occurred during query rollback, result is returned anyway",
+                    original_rollback_exception,
+                )
+
+            duration = time.perf_counter() - start_time
+            query_metrics.success_count.increment()
+            query_metrics.latency.observe(duration)
+
+            if logger.isEnabledFor(logging.DEBUG):
+                _log_command_result(query, result, duration)
+            return result
+
+        return bound_query
+
+
+class AsyncDomain(Generic[ACC]):
+    def __init__(self, command_context_creator: AsyncCommandContextCreator[ACC]) -> None:
+        self.command_context_creator = command_context_creator
+        self.metrics = DomainMetrics()
+
+    def _bind_command(
+        self,
+        command: Callable[Concatenate[ACC, P], Awaitable[R]],
+    ) -> Callable[P, Awaitable[R]]:
+        command_metrics = self.metrics.get_command_metrics(command.__name__)
+
+        async def bound_command(*args: P.args, **kwargs: P.kwargs) -> R:
+            if logger.isEnabledFor(logging.DEBUG):
+                _log_command_call(command, args, kwargs)
+
+            start_time = time.perf_counter()
 
             command_context = self.command_context_creator()
 
             # Attempt to execute the command
             try:
-                result = command(command_context, *args, **kwargs)
+                result = await command(command_context, *args, **kwargs)
 
             # Catch any exception raised during command execution
             except Exception as original_execution_exception:
-                logger.error(
+                _log_command_error(
                     "An unexpected error occurred during command execution, rollback will be applied.",
-                    extra={
-                        "error": str(original_execution_exception),
-                        "error_class": original_execution_exception.__class__.__name__,
-                        "traceback": traceback.format_exc(),
-                    },
+                    original_execution_exception,
                 )
+                command_metrics.rollback_count.increment()
+                command_metrics.latency.observe(time.perf_counter() - start_time)
 
                 # Attempt to rollback the command
                 try:
-                    command_context.rollback()
+                    await command_context.rollback()
 
                 # Catch any exception raised during command rollback
                 except Exception as original_rollback_exception:
-                    logger.error(
-                        "An unexpected error occurred during command rollback",
-                        extra={
-                            "error": str(original_rollback_exception),
-                            "error_class": original_rollback_exception.__class__.__name__,
-                            "traceback": traceback.format_exc(),
-                        },
+                    _log_command_error(
+                        "An unexpected error occurred during command rollback", original_rollback_exception
                     )
 
-                    # Set the CommandExecutionException as context of the original_rollback_exception
                     original_rollback_exception.__cause__ = original_execution_exception
-                    # Raise a new CommandRollbackException, using the original_rollback_exception as context
                     raise CommandRollbackException() from original_rollback_exception
 
                 raise original_execution_exception
 
             # Attempt to commit the command
             try:
-                command_context.commit()
+                await command_context.commit()
             # Catch any exception raised during command commit
             except Exception as original_commit_exception:
-                logger.error(
-                    "An unexpected error occurred during command commit",
-                    extra={
-                        "error": str(original_commit_exception),
-                        "error_class": original_commit_exception.__class__.__name__,
-                        "traceback": traceback.format_exc(),
-                    },
-                )
+                _log_command_error("An unexpected error occurred during command commit", original_commit_exception)
+                command_metrics.commit_failure_count.increment()
+                command_metrics.latency.observe(time.perf_counter() - start_time)
 
                 # Attempt to rollback the command
                 try:
-                    command_context.rollback()
+                    await command_context.rollback()
                     # Catch any exception raised during command rollback
                 except Exception as original_rollback_exception:
-                    logger.error(
+                    _log_command_error(
                         "An unexpected error occurred during command rollback after a commit failed",
-                        extra={
-                            "error": str(original_rollback_exception),
-                            "error_class": original_rollback_exception.__class__.__name__,
-                            "traceback": traceback.format_exc(),
-                        },
+                        original_rollback_exception,
                     )
 
-                    # Set the CommandExecutionException as context of the original_rollback_exception
                     original_rollback_exception.__cause__ = original_commit_exception
-                    # Raise a new CommandRollbackException, using the original_rollback_exception as context
                     raise CommandRollbackException() from original_rollback_exception
 
-                # Create a new CommandCommitException to be raised, using the original exception as context
                 raise CommandCommitException() from original_commit_exception
 
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
+            command_metrics.success_count.increment()
+            command_metrics.latency.observe(duration)
 
-            logger.debug(
-                "Command returned",
-                extra={
-                    "command_name": command.__name__,
-                    "result": result,
-                    "duration": duration,
-                },
-            )
+            if logger.isEnabledFor(logging.DEBUG):
+                _log_command_result(command, result, duration)
             return result
 
         return bound_command
@@ -139,3 +658,8 @@ class CommandRollbackException(Exception):
 class CommandCommitException(Exception):
     def __init__(self):
         super().__init__("Error during the commit of a command")
+
+
+class CommandBatchAbortedException(Exception):
+    def __init__(self):
+        super().__init__("The command batch has been rolled back")
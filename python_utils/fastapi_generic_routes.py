@@ -1,4 +1,7 @@
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
+
+from python_utils.metrics import MetricsRegistry
 
 
 def load_routes(fastapi_app: FastAPI, application_name: str, version: str) -> None:
@@ -21,3 +24,11 @@ def load_routes(fastapi_app: FastAPI, application_name: str, version: str) -> No
     @fastapi_app.get("/force_exception", include_in_schema=False)
     async def force_error():  # pyright: ignore[reportUnusedFunction]
         raise Exception("This always fails")
+
+
+def load_metrics_route(fastapi_app: FastAPI, metrics_registry: MetricsRegistry, path: str = "/metrics") -> None:
+    @fastapi_app.get(path, include_in_schema=False)
+    async def metrics():  # pyright: ignore[reportUnusedFunction]
+        return PlainTextResponse(
+            metrics_registry.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8"
+        )
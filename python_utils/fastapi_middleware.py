@@ -1,118 +1,344 @@
 import json
+import logging
+import random
 import re
 import time
-import traceback
-from typing import Awaitable, Callable, Optional, cast
+from typing import Any, Literal, Optional, Sequence, Union
 
-from fastapi import FastAPI, Request, Response, status
+from fastapi import FastAPI, Request, status
 from fastapi.responses import JSONResponse
-from starlette.concurrency import iterate_in_threadpool
-from starlette.responses import StreamingResponse
-from starlette.routing import Route
+from starlette.datastructures import MutableHeaders
+from starlette.routing import BaseRoute, Route
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from python_utils.loggers import get_logger
+from python_utils.loggers import LazyTraceback, get_logger, request_log_buffer
+from python_utils.metrics import DEFAULT_SIZE_BUCKETS, MetricsRegistry
 
 
 logger = get_logger(__name__)
 
 
-not_logged_path_checkers: list[Callable[[str], bool]] = [
-    lambda path: path.endswith("/healthz"),
-]
+class PathMatcher:
+    def __init__(self, prefixes: Sequence[str] = (), suffixes: Sequence[str] = ()) -> None:
+        self.prefixes = tuple(prefixes)
+        self.suffixes = tuple(suffixes)
+
+    def match(self, path: str) -> bool:
+        # str.startswith and str.endswith check all the tuple entries in a single call
+        return (len(self.prefixes) > 0 and path.startswith(self.prefixes)) or (
+            len(self.suffixes) > 0 and path.endswith(self.suffixes)
+        )
+
+
+not_logged_path_matcher = PathMatcher(suffixes=["/healthz", "/metrics"])
 
 
 def should_log_path(path: str) -> bool:
-    return not any(path_checker(path) for path_checker in not_logged_path_checkers)
+    return not not_logged_path_matcher.match(path)
+
+
+ROOT_PATH_REGEX = r"\/[a-zA-Z0-9\-\_]+"
+
+
+class RouteIndex:
+    def __init__(self, routes: Sequence[BaseRoute], has_root_path: bool = False) -> None:
+        self.routes = routes
+        self.route_count = len(routes)
+        self.route_paths: list[str] = []
+
+        # All routes are matched by a single regex, with one group per route. Alternatives are tried in order, so
+        # that the first matching route wins. Route groups are renamed, as path parameters repeat across routes.
+        route_regexes: list[str] = []
+        for route in routes:
+            if not isinstance(route, Route):
+                continue
+            route_regex = route.path_regex.pattern.removeprefix("^").removesuffix("$")
+            route_regex = re.sub(r"\(\?P<[^>]+>", "(?:", route_regex)
+            route_regexes.append(f"(?P<route_{len(self.route_paths)}>{route_regex})")
+            self.route_paths.append(route.path)
+
+        prefix_regex = ROOT_PATH_REGEX if has_root_path else ""
+        self.regex = re.compile(f"{prefix_regex}(?:{'|'.join(route_regexes)})") if len(route_regexes) > 0 else None
+
+    def get_route_pattern(self, path: str) -> Optional[str]:
+        if self.regex is None:
+            return None
+        path_match = self.regex.fullmatch(path)
+        if path_match is None or path_match.lastgroup is None:
+            return None
+        return self.route_paths[int(path_match.lastgroup.removeprefix("route_"))]
+
+
+def get_route_index(fastapi_app: FastAPI, *, has_root_path: bool = False) -> RouteIndex:
+    # Indexes are kept in the app state, and rebuilt when the router routes change
+    route_indexes: Optional[dict[bool, RouteIndex]] = getattr(fastapi_app.state, "route_indexes", None)
+    if route_indexes is None:
+        route_indexes = {}
+        fastapi_app.state.route_indexes = route_indexes
+
+    routes = fastapi_app.router.routes
+    route_index = route_indexes.get(has_root_path)
+    if route_index is None or route_index.routes is not routes or route_index.route_count != len(routes):
+        route_index = RouteIndex(routes, has_root_path)
+        route_indexes[has_root_path] = route_index
+    return route_index
 
 
 def get_request_route_pattern(
     fastapi_app: FastAPI, request: Request, *, has_root_path: bool = False
 ) -> Optional[str]:
-    for route in fastapi_app.router.routes:
+    return get_route_index(fastapi_app, has_root_path=has_root_path).get_route_pattern(request.url.path)
+
+
+class ResponseBodyCapture:
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.chunks: list[bytes] = []
+        self.size = 0
+        self.truncated = False
+
+    def capture(self, chunk: Union[str, bytes, memoryview]) -> None:
+        if self.truncated:
+            return
+        chunk_bytes = chunk.encode() if isinstance(chunk, str) else bytes(chunk)
+        if self.size + len(chunk_bytes) > self.max_bytes:
+            # A truncated JSON body can not be parsed, so that nothing more is kept
+            self.truncated = True
+            self.chunks = []
+            return
+        self.chunks.append(chunk_bytes)
+        self.size += len(chunk_bytes)
+
+    def get_parsed_body(self) -> Any:
+        if self.truncated:
+            return "<response body too large - not logged>"
+        if self.size == 0:
+            return None
+        try:
+            return json.loads(b"".join(self.chunks))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None
+
+
+class RequestMetrics:
+    def __init__(self, metrics_registry: MetricsRegistry) -> None:
+        self.request_count = metrics_registry.counter(
+            "http_requests_total", "HTTP requests", ("method", "route", "status")
+        )
+        self.request_duration = metrics_registry.histogram(
+            "http_request_duration_seconds",
+            "HTTP request duration in seconds, until the response body is sent",
+            ("method", "route"),
+        )
+        self.requests_in_flight = metrics_registry.gauge(
+            "http_requests_in_flight", "HTTP requests being processed", ("method", "route")
+        )
+        self.response_size = metrics_registry.histogram(
+            "http_response_size_bytes", "HTTP response body size in bytes", ("method", "route"), DEFAULT_SIZE_BUCKETS
+        )
+
+    def record(self, method: str, route: str, status_code: int, duration: float, response_size: int) -> None:
+        self.request_count.labels(method, route, str(status_code)).increment()
+        self.request_duration.labels(method, route).observe(duration)
+        self.response_size.labels(method, route).observe(response_size)
+
+
+# always: every request, sampled: a random ratio of the requests, slow: requests slower than a threshold,
+# errors: requests answered with a 4xx or 5xx status code
+RequestLogMode = Literal["always", "sampled", "slow", "errors"]
 
-        if not isinstance(route, Route):
-            continue
 
-        url_regex = route.path.replace("{", "(?P<").replace("}", ">[^/]+)")
-        if has_root_path:
-            root_path_regex = r"\/[a-zA-Z0-9\-\_]+"
-            url_regex = root_path_regex + url_regex
+# Route label of the requests matching no route, so that unknown paths do not create new label values
+UNMATCHED_ROUTE = "<unmatched>"
+# Method label of the requests using a non standard HTTP method, for the same reason
+OTHER_METHOD = "OTHER"
+HTTP_METHODS = frozenset(["GET", "HEAD", "POST", "PUT", "DELETE", "CONNECT", "OPTIONS", "TRACE", "PATCH"])
 
-        request_match_url_pattern = re.fullmatch(url_regex, request.url.path)
 
-        if request_match_url_pattern:
-            return route.path
+class RequestLoggingMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        fastapi_app: FastAPI,
+        has_root_path: bool = False,
+        max_logged_body_bytes: int = 64 * 1024,
+        metrics_registry: Optional[MetricsRegistry] = None,
+        log_mode: RequestLogMode = "always",
+        log_sample_ratio: float = 0.01,
+        slow_request_threshold_seconds: float = 1.0,
+    ) -> None:
+        self.app = app
+        self.fastapi_app = fastapi_app
+        self.has_root_path = has_root_path
+        self.max_logged_body_bytes = max_logged_body_bytes
+        self.request_metrics = RequestMetrics(metrics_registry) if metrics_registry is not None else None
+        self.log_mode = log_mode
+        self.log_sample_ratio = log_sample_ratio
+        self.slow_request_threshold_seconds = slow_request_threshold_seconds
 
+    def _should_log_response(self, status_code: int, processing_time: float) -> bool:
+        if self.log_mode == "slow":
+            return processing_time >= self.slow_request_threshold_seconds
+        if self.log_mode == "errors":
+            return status_code >= status.HTTP_400_BAD_REQUEST
+        return True
 
-def add_middleware(fastapi_app: FastAPI, has_root_path: bool = False) -> None:
-    @fastapi_app.middleware("http")
-    async def catch_exceptions(  # pyright: ignore[reportUnusedFunction]
-        request: Request, call_next: Callable[[Request], Awaitable[Response]]
-    ):
-        log_path = should_log_path(request.url.path)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        if log_path:
+        request = Request(scope)
+        # Request logs, and the response body capture they need, are skipped when INFO is disabled
+        log_path = logger.isEnabledFor(logging.INFO) and should_log_path(request.url.path)
+        if log_path and self.log_mode == "sampled":
+            log_path = random.random() < self.log_sample_ratio
+        # In the slow and errors modes, requests are only logged once the response starts, when the status code and
+        # the processing time are known
+        request_log_deferred = log_path and self.log_mode in ("slow", "errors")
+
+        request_path_pattern = (
+            get_request_route_pattern(self.fastapi_app, request, has_root_path=self.has_root_path)
+            if log_path or self.request_metrics is not None
+            else None
+        )
+
+        def log_request_received() -> None:
             logger.info(
                 "Request received",
                 extra={
                     "request_path": request.url.path,
-                    "request_path_pattern": get_request_route_pattern(
-                        fastapi_app, request, has_root_path=has_root_path
-                    ),
+                    "request_path_pattern": request_path_pattern,
                     "request_method": request.method,
                     "query_params": request.query_params,
                     "headers": request.headers,
                 },
             )
 
-        start_time = time.time()
-
-        try:
-            response = cast(StreamingResponse, await call_next(request))
-        except Exception as error:
-            logger.critical(
-                "Request failed",
-                extra={"error": error, "traceback": traceback.format_exc()},
-            )
+        if log_path and not request_log_deferred:
+            log_request_received()
 
-            return JSONResponse(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                content={"message": "Unexpected server error"},
-            )
-
-        processing_time = time.time() - start_time
-        response.headers["X-Process-Time"] = str(processing_time)
-
-        if log_path:
-            content_type = response.headers.get("content-type")
-            if content_type is None or content_type.startswith("application/json"):
-                # as `response` is a stream, we must deal with an iterator and reconstruct the body_iterator after it has been browsed
-                # more details about the following code: https://github.com/encode/starlette/issues/874#issuecomment-1027743996
-                response_body = [chunk async for chunk in response.body_iterator]
-                response.body_iterator = iterate_in_threadpool(iter(response_body))
-                if len(response_body) == 0:
-                    parsed_response_body = None
-                else:
-                    response_bytes = cast(bytes, response_body[0])
-                    try:
-                        parsed_response_body = json.loads(response_bytes.decode())
-                    except json.JSONDecodeError:
-                        parsed_response_body = None
-            else:
-                parsed_response_body = "<streaming response - not logged>"
+        start_time = time.time()
+        processing_time = 0.0
+        status_code = 0
+        response_started = False
+        response_size = 0
+        body_capture: Optional[ResponseBodyCapture] = None
+        pending_request_log = False
 
+        def log_request_processed(response_body: Any) -> None:
             logger.info(
                 "Request processed",
                 extra={
                     "request_path": request.url.path,
-                    "request_path_pattern": get_request_route_pattern(
-                        fastapi_app, request, has_root_path=has_root_path
-                    ),
+                    "request_path_pattern": request_path_pattern,
                     "request_method": request.method,
                     "processing_time": processing_time,
-                    "status_code": response.status_code,
-                    "response_body": parsed_response_body,
+                    "status_code": status_code,
+                    "response_body": response_body,
                 },
             )
 
-        return response
+        async def send_with_logs(message: Message) -> None:
+            nonlocal processing_time, status_code, response_started, response_size, body_capture, pending_request_log
+            nonlocal log_path
+
+            if message["type"] == "http.response.start":
+                response_started = True
+                processing_time = time.time() - start_time
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers["X-Process-Time"] = str(processing_time)
+
+                # Requests that are not logged skip the body capture entirely
+                if request_log_deferred:
+                    log_path = self._should_log_response(status_code, processing_time)
+                    if log_path:
+                        log_request_received()
+
+                if log_path:
+                    content_type = headers.get("content-type")
+                    if content_type is None or content_type.startswith("application/json"):
+                        # Chunks are sent as they come, the request is logged once the body has been sent
+                        body_capture = ResponseBodyCapture(self.max_logged_body_bytes)
+                        pending_request_log = True
+                    else:
+                        log_request_processed("<streaming response - not logged>")
+
+                await send(message)
+                return
+
+            await send(message)
+
+            if message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            if message["type"] == "http.response.body" and body_capture is not None:
+                body_capture.capture(message.get("body", b""))
+                if not message.get("more_body", False) and pending_request_log:
+                    pending_request_log = False
+                    log_request_processed(body_capture.get_parsed_body())
+
+        route = request_path_pattern or UNMATCHED_ROUTE
+        method = request.method if request.method in HTTP_METHODS else OTHER_METHOD
+        if self.request_metrics is not None:
+            self.request_metrics.requests_in_flight.labels(method, route).increment()
+
+        try:
+            # Records below the output levels are only written for failing or slow requests
+            with request_log_buffer() as log_buffer:
+                try:
+                    await self.app(scope, receive, send_with_logs)
+                except Exception as error:
+                    if log_buffer is not None:
+                        log_buffer.flush()
+                    if request_log_deferred and not response_started:
+                        log_request_received()
+                    logger.critical(
+                        "Request failed",
+                        extra={"error": error, "traceback": LazyTraceback(error)},
+                    )
+
+                    # Once the response has started, the server can only close the connection
+                    if response_started:
+                        raise
+                    error_response = JSONResponse(
+                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        content={"message": "Unexpected server error"},
+                    )
+                    status_code = error_response.status_code
+                    response_size = len(error_response.body)
+                    await error_response(scope, receive, send)
+                    return
+
+            if log_buffer is not None:
+                log_buffer.finish(status_code >= status.HTTP_500_INTERNAL_SERVER_ERROR, processing_time)
+            # e.g. when the client disconnected before the end of the body
+            if pending_request_log and body_capture is not None:
+                log_request_processed(body_capture.get_parsed_body())
+        finally:
+            if self.request_metrics is not None:
+                self.request_metrics.requests_in_flight.labels(method, route).decrement()
+                self.request_metrics.record(
+                    method, route, status_code or 500, time.time() - start_time, response_size
+                )
+
+
+def add_middleware(
+    fastapi_app: FastAPI,
+    has_root_path: bool = False,
+    max_logged_body_bytes: int = 64 * 1024,
+    metrics_registry: Optional[MetricsRegistry] = None,  # request metrics are only recorded with a registry
+    log_mode: RequestLogMode = "always",
+    log_sample_ratio: float = 0.01,  # ratio of the requests logged in the sampled mode
+    slow_request_threshold_seconds: float = 1.0,  # requests logged in the slow mode
+) -> None:
+    fastapi_app.add_middleware(
+        RequestLoggingMiddleware,
+        fastapi_app=fastapi_app,
+        has_root_path=has_root_path,
+        max_logged_body_bytes=max_logged_body_bytes,
+        metrics_registry=metrics_registry,
+        log_mode=log_mode,
+        log_sample_ratio=log_sample_ratio,
+        slow_request_threshold_seconds=slow_request_threshold_seconds,
+    )
@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import JSON, Column, Float, MetaData, String, Table, delete, select
+from sqlalchemy.dialects.postgresql import insert
+from typing import Any, Optional, Protocol
+
+from python_utils.sqlalchemy_postgresql_engine_wrapper import SqlAlchemyPostgresqlEngineWrapper
+
+
+class IdempotencyStore(Protocol):
+    # Returns whether a result is stored for the key, and the result itself, which may be None
+    def get(self, key: str) -> tuple[bool, Any]: ...
+
+    def set(self, key: str, result: Any) -> None: ...
+
+
+class SqlAlchemyPostgresqlIdempotencyStore:
+    def __init__(
+        self,
+        engine_wrapper: SqlAlchemyPostgresqlEngineWrapper,
+        ttl_seconds: float = 86400,  # 1 day
+        table_name: str = "idempotency_results",
+    ) -> None:
+        self.engine_wrapper = engine_wrapper
+        self.ttl_seconds = ttl_seconds
+        self.table = Table(
+            table_name,
+            MetaData(),
+            Column("key", String, primary_key=True),
+            Column("result", JSON, nullable=True),
+            Column("expires_at", Float[float](), nullable=False),
+        )
+
+    def create_table(self) -> None:
+        self.table.metadata.create_all(self.engine_wrapper.engine)
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        statement = select(self.table.c.result).where(self.table.c.key == key, self.table.c.expires_at > time.time())
+        with self.engine_wrapper.create_session() as session:
+            row = session.execute(statement).first()
+        if row is None:
+            return False, None
+        return True, row.result
+
+    def set(self, key: str, result: Any) -> None:
+        # Results must be JSON serializable. The first stored result wins, until it expires and can be replaced.
+        now = time.time()
+        statement = insert(self.table).values(key=key, result=result, expires_at=now + self.ttl_seconds)
+        statement = statement.on_conflict_do_update(
+            index_elements=[self.table.c.key],
+            set_={"result": statement.excluded.result, "expires_at": statement.excluded.expires_at},
+            where=self.table.c.expires_at <= now,
+        )
+        with self.engine_wrapper.create_session() as session:
+            session.execute(statement)
+            session.commit()
+
+    def purge_expired(self) -> None:
+        statement = delete(self.table).where(self.table.c.expires_at <= time.time())
+        with self.engine_wrapper.create_session() as session:
+            session.execute(statement)
+            session.commit()
+
+
+class InMemoryIdempotencyStore:
+    def __init__(
+        self,
+        max_size: int = 10_000,
+        ttl_seconds: float = 86400,  # 1 day
+        backing_store: Optional[IdempotencyStore] = None,  # shared store, e.g. Postgres, looked up on misses
+    ) -> None:
+        if max_size <= 0:
+            raise ValueError("Idempotency store max size must be positive")
+
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.backing_store = backing_store
+        # Entries are kept in least recently used order: key -> (expiration timestamp, result)
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get_local(self, key: str) -> tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+
+            expires_at, result = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return False, None
+
+            self._entries.move_to_end(key)
+            return True, result
+
+    def _set_local(self, key: str, result: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        found, result = self._get_local(key)
+        if found or self.backing_store is None:
+            return found, result
+
+        found, result = self.backing_store.get(key)
+        if found:
+            self._set_local(key, result)
+        return found, result
+
+    def set(self, key: str, result: Any) -> None:
+        if self.backing_store is not None:
+            self.backing_store.set(key, result)
+        self._set_local(key, result)
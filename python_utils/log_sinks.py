@@ -0,0 +1,263 @@
+import abc
+import gzip
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+import traceback
+from typing import Literal, Optional, Union
+
+
+SocketTransport = Literal["udp", "tcp", "unix"]
+
+
+class BatchingHandler(logging.Handler, abc.ABC):
+    def __init__(
+        self,
+        buffer_size_bytes: int = 64 * 1024,
+        flush_interval_seconds: float = 1.0,
+        level: int = logging.NOTSET,
+    ) -> None:
+        super().__init__(level)
+        self.buffer_size_bytes = buffer_size_bytes
+        self.flush_interval_seconds = flush_interval_seconds
+        self._buffer: list[bytes] = []
+        self._buffered_bytes = 0
+        # Records that could not be written
+        self.dropped_count = 0
+        self._closed = threading.Event()
+        # Flushes the buffer during quiet periods, when no record fills it
+        self._flusher = threading.Thread(target=self._flush_periodically, name="log-sink-flusher", daemon=True)
+        self._flusher.start()
+
+    def _flush_periodically(self) -> None:
+        while not self._closed.wait(self.flush_interval_seconds):
+            self._flush_and_report_errors()
+
+    def _flush_and_report_errors(self) -> None:
+        # Outside of emit, there is no record for handleError: errors are reported the same way, without it
+        try:
+            self.flush()
+        except Exception:
+            if logging.raiseExceptions:
+                traceback.print_exc()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            chunk = (self.format(record) + "\n").encode()
+        except Exception:
+            self.handleError(record)
+            return
+
+        # Called with the handler lock held
+        self._buffer.append(chunk)
+        self._buffered_bytes += len(chunk)
+        if self._buffered_bytes >= self.buffer_size_bytes:
+            try:
+                self._flush_buffer()
+            except Exception:
+                self.handleError(record)
+
+    def _flush_buffer(self) -> None:
+        if len(self._buffer) == 0:
+            return
+        chunks = self._buffer
+        self._buffer = []
+        self._buffered_bytes = 0
+        try:
+            self._write(chunks)
+        except Exception:
+            self.dropped_count += len(chunks)
+            raise
+
+    @abc.abstractmethod
+    def _write(self, chunks: list[bytes]) -> None: ...
+
+    def flush(self) -> None:
+        with self.lock:  # pyright: ignore[reportOptionalContextManager]
+            self._flush_buffer()
+
+    def close(self) -> None:
+        self._closed.set()
+        self._flusher.join()
+        self._flush_and_report_errors()
+        super().close()
+
+
+class BufferedFileHandler(BatchingHandler):
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 100 * 1024 * 1024,  # 0 to disable size based rotation
+        rotation_interval_seconds: Optional[float] = None,
+        backup_count: int = 5,
+        compress_rotated: bool = False,
+        buffer_size_bytes: int = 64 * 1024,
+        flush_interval_seconds: float = 1.0,
+        level: int = logging.NOTSET,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotation_interval_seconds = rotation_interval_seconds
+        self.backup_count = backup_count
+        self.compress_rotated = compress_rotated
+        self._file = open(path, "ab")
+        self._file_size = self._file.tell()
+        self._opened_at = time.time()
+        self._compression: Optional[threading.Thread] = None
+        super().__init__(buffer_size_bytes, flush_interval_seconds, level)
+
+    def _get_rotated_path(self, index: int) -> str:
+        return f"{self.path}.{index}.gz" if self.compress_rotated else f"{self.path}.{index}"
+
+    def _should_rotate(self, size: int) -> bool:
+        if self.max_bytes > 0 and self._file_size > 0 and self._file_size + size > self.max_bytes:
+            return True
+        if self.rotation_interval_seconds is not None:
+            return time.time() - self._opened_at >= self.rotation_interval_seconds
+        return False
+
+    def _compress(self, path: str, compressed_path: str) -> None:
+        with open(path, "rb") as source, gzip.open(f"{compressed_path}.tmp", "wb") as destination:
+            shutil.copyfileobj(source, destination)
+        os.replace(f"{compressed_path}.tmp", compressed_path)
+        os.remove(path)
+
+    def _wait_for_compression(self) -> None:
+        if self._compression is not None:
+            self._compression.join()
+            self._compression = None
+
+    def _rotate(self) -> None:
+        # Called with the handler lock held: files are only renamed here, the compression runs on its own thread
+        self._file.close()
+        # Only waits when rotations happen faster than the compression of the rotated files
+        self._wait_for_compression()
+
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                rotated_path = self._get_rotated_path(index)
+                if os.path.exists(rotated_path):
+                    os.replace(rotated_path, self._get_rotated_path(index + 1))
+            os.replace(self.path, f"{self.path}.1")
+            if self.compress_rotated:
+                self._compression = threading.Thread(
+                    target=self._compress,
+                    args=(f"{self.path}.1", self._get_rotated_path(1)),
+                    name="log-sink-compression",
+                    daemon=True,
+                )
+                self._compression.start()
+        else:
+            os.remove(self.path)
+
+        self._file = open(self.path, "ab")
+        self._file_size = 0
+        self._opened_at = time.time()
+
+    def _write(self, chunks: list[bytes]) -> None:
+        data = b"".join(chunks)
+        if self._should_rotate(len(data)):
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._file_size += len(data)
+
+    def close(self) -> None:
+        super().close()
+        self._file.close()
+        self._wait_for_compression()
+
+
+class BatchedSocketHandler(BatchingHandler):
+    def __init__(
+        self,
+        address: Union[str, tuple[str, int]],  # a path for unix sockets
+        transport: SocketTransport = "udp",
+        max_datagram_bytes: int = 65_000,
+        # Connections and sends run under the handler lock, a collector that stops reading must not block logging
+        timeout_seconds: float = 5.0,
+        buffer_size_bytes: int = 64 * 1024,
+        flush_interval_seconds: float = 1.0,
+        level: int = logging.NOTSET,
+    ) -> None:
+        self.address = address
+        self.transport = transport
+        self.max_datagram_bytes = max_datagram_bytes
+        self.timeout_seconds = timeout_seconds
+        self._socket: Optional[socket.socket] = None
+        self.sent_count = 0
+        super().__init__(buffer_size_bytes, flush_interval_seconds, level)
+
+    def _connect(self) -> socket.socket:
+        if self.transport == "udp":
+            return socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        if self.transport == "tcp":
+            connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        else:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(self.timeout_seconds)
+        try:
+            connection.connect(self.address)
+        except OSError:
+            connection.close()
+            raise
+        return connection
+
+    def _get_datagrams(self, chunks: list[bytes]) -> list[tuple[bytes, int]]:
+        # Newline delimited records are packed in as few datagrams as possible, with their record count
+        datagrams: list[tuple[bytes, int]] = []
+        datagram_chunks: list[bytes] = []
+        datagram_size = 0
+        for chunk in chunks:
+            # Records that can not fit in a datagram are dropped on their own
+            if len(chunk) > self.max_datagram_bytes:
+                self.dropped_count += 1
+                continue
+            if datagram_size + len(chunk) > self.max_datagram_bytes and len(datagram_chunks) > 0:
+                datagrams.append((b"".join(datagram_chunks), len(datagram_chunks)))
+                datagram_chunks = []
+                datagram_size = 0
+            datagram_chunks.append(chunk)
+            datagram_size += len(chunk)
+        if len(datagram_chunks) > 0:
+            datagrams.append((b"".join(datagram_chunks), len(datagram_chunks)))
+        return datagrams
+
+    def _close_socket(self) -> None:
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _write(self, chunks: list[bytes]) -> None:
+        # Records are dropped when the collector can not be reached or times out, the connection is retried on the next
+        # flush
+        if self.transport == "udp":
+            for datagram, record_count in self._get_datagrams(chunks):
+                try:
+                    if self._socket is None:
+                        self._socket = self._connect()
+                    self._socket.sendto(datagram, self.address)
+                except OSError:
+                    self.dropped_count += record_count
+                    self._close_socket()
+                    continue
+                self.sent_count += record_count
+            return
+
+        try:
+            if self._socket is None:
+                self._socket = self._connect()
+            self._socket.sendall(b"".join(chunks))
+        except OSError:
+            self.dropped_count += len(chunks)
+            self._close_socket()
+            return
+        self.sent_count += len(chunks)
+
+    def close(self) -> None:
+        super().close()
+        self._close_socket()
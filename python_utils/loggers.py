@@ -1,12 +1,36 @@
+import atexit
 import contextlib
+import dataclasses
+import datetime
+import enum
 import functools
+import hashlib
+import json
 import logging
+import queue
+import sys
+import threading
+import time
 import traceback
+import types
+import uuid
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from pythonjsonlogger import defaults as json_defaults
 from pythonjsonlogger.json import JsonFormatter
-from typing import Any, Generator, Optional
+from typing import Any, Callable, Generator, Literal, Mapping, Optional
 
 
 global_stdout_log_level: Optional[int] = None
+global_fast_log_formatting: bool = False
+global_compact_log_formatting: bool = False
+# Number of innermost frames rendered in tracebacks, None for all of them
+global_traceback_frame_limit: Optional[int] = None
+# Tracebacks already rendered are replaced by their fingerprint
+global_traceback_dedup: bool = False
+global_traceback_dedup_max_fingerprints: int = 10_000
+
+LogOverflowPolicy = Literal["drop", "block"]
 
 
 @functools.cache
@@ -18,16 +42,193 @@ def get_stdout_handler(log_level: int, log_formatter: logging.Formatter):
     return handler
 
 
+_rendered_traceback_fingerprints: OrderedDict[str, None] = OrderedDict()
+_rendered_traceback_fingerprints_lock = threading.Lock()
+
+
+def _is_rendered_traceback(fingerprint: str) -> bool:
+    with _rendered_traceback_fingerprints_lock:
+        if fingerprint in _rendered_traceback_fingerprints:
+            _rendered_traceback_fingerprints.move_to_end(fingerprint)
+            return True
+        _rendered_traceback_fingerprints[fingerprint] = None
+        while len(_rendered_traceback_fingerprints) > global_traceback_dedup_max_fingerprints:
+            _rendered_traceback_fingerprints.popitem(last=False)
+        return False
+
+
+class LazyTraceback:
+    # Keeps the exception and renders its traceback only when a handler formats the record
+    def __init__(self, exception: Optional[BaseException] = None, frame_limit: Optional[int] = None) -> None:
+        self.exception = exception if exception is not None else sys.exc_info()[1]
+        # Frames are added to __traceback__ as the exception propagates: the traceback is the one at log time
+        self.traceback = self.exception.__traceback__ if self.exception is not None else None
+        self.frame_limit = frame_limit if frame_limit is not None else global_traceback_frame_limit
+        self._rendered: Optional[str] = None
+
+    @functools.cached_property
+    def fingerprint(self) -> Optional[str]:
+        # Exception class and code locations, so that the same failure has the same fingerprint
+        if self.exception is None:
+            return None
+        fingerprint = hashlib.sha1(self.exception.__class__.__qualname__.encode())
+        for frame, line_number in traceback.walk_tb(self.traceback):
+            fingerprint.update(f"{frame.f_code.co_filename}:{line_number}:{frame.f_code.co_name}".encode())
+        return fingerprint.hexdigest()[:16]
+
+    def __str__(self) -> str:
+        if self._rendered is not None:
+            return self._rendered
+        if self.exception is None:
+            rendered = "NoneType: None\n"
+        elif global_traceback_dedup and _is_rendered_traceback(str(self.fingerprint)):
+            rendered = f"Traceback already logged, fingerprint {self.fingerprint}\n"
+        else:
+            limit = -self.frame_limit if self.frame_limit is not None else None
+            rendered = "".join(
+                traceback.format_exception(type(self.exception), self.exception, self.traceback, limit=limit)
+            )
+        self._rendered = rendered
+        return rendered
+
+    def __repr__(self) -> str:
+        return f"LazyTraceback({self.exception!r})"
+
+
+def _get_mapping_json(obj: Any) -> Any:
+    return dict(obj)
+
+
+def _get_multi_mapping_json(obj: Any) -> Any:
+    # Repeated keys, e.g. in query params or headers, are logged with the list of their values
+    json_obj: dict[Any, Any] = {}
+    for key in dict.fromkeys(obj.keys()):
+        values = obj.getlist(key)
+        json_obj[key] = values[0] if len(values) == 1 else values
+    return json_obj
+
+
+def _get_sequence_json(obj: Any) -> Any:
+    return list(obj)
+
+
+# JSON conversions of the non JSON types commonly passed in `extra`, resolved once per type
+_json_default_by_type: dict[type[Any], Callable[[Any], Any]] = {
+    uuid.UUID: str,
+    LazyTraceback: str,
+    datetime.datetime: json_defaults.datetime_any,
+    datetime.date: json_defaults.datetime_any,
+    datetime.time: json_defaults.datetime_any,
+    set: _get_sequence_json,
+    frozenset: _get_sequence_json,
+}
+
+
+def _resolve_json_default(obj_type: type[Any]) -> Callable[[Any], Any]:
+    if issubclass(obj_type, BaseException):
+        return json_defaults.exception_default
+    if issubclass(obj_type, types.TracebackType):
+        return json_defaults.traceback_default
+    if issubclass(obj_type, enum.Enum):
+        return json_defaults.enum_default
+    if issubclass(obj_type, (bytes, bytearray)):
+        return json_defaults.bytes_default
+    # Headers, QueryParams and other read-only mappings
+    if hasattr(obj_type, "getlist") and issubclass(obj_type, Mapping):
+        return _get_multi_mapping_json
+    if issubclass(obj_type, Mapping):
+        return _get_mapping_json
+    if issubclass(obj_type, (datetime.date, datetime.time)):
+        return json_defaults.datetime_any
+    if issubclass(obj_type, uuid.UUID):
+        return str
+    if dataclasses.is_dataclass(obj_type):
+        return json_defaults.dataclass_default  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+    if issubclass(obj_type, type):
+        return json_defaults.type_default
+    return json_defaults.unknown_default
+
+
+def fast_json_default(obj: Any) -> Any:
+    obj_type: type[Any] = type(obj)  # pyright: ignore[reportUnknownVariableType]
+    json_default = _json_default_by_type.get(obj_type)
+    if json_default is None:
+        json_default = _resolve_json_default(obj_type)
+        _json_default_by_type[obj_type] = json_default
+    return json_default(obj)
+
+
 class CustomJsonFormatter(JsonFormatter):
     def __init__(
         self,
         *args: Any,
         add_context_fields: bool = True,
         indent: Optional[int] = None,
+        fast: bool = False,
+        compact: bool = False,
         **kwargs: Any,
     ):
         super().__init__(*args, **kwargs, json_indent=indent)  # pyright: ignore
         self.add_context_fields = add_context_fields
+        self.compact = compact
+
+        separators = (",", ":") if compact else None
+        if compact:
+            self.json_serializer = functools.partial(json.dumps, separators=separators)
+
+        # The fast mode only handles the default fields, without renaming
+        self.fast = (
+            fast and self._required_fields == ["message"] and not self.rename_fields and not self.timestamp
+        )
+        self._static_fields: dict[str, Any] = {**self.defaults, **self.static_fields}
+        self._encoder = json.JSONEncoder(
+            default=fast_json_default,
+            indent=indent,
+            separators=separators,
+            ensure_ascii=self.json_ensure_ascii,
+        )
+        # Formatted time of the last second seen: (second, formatted time without milliseconds)
+        self._cached_time: tuple[int, str] = (-1, "")
+
+    def _format_time(self, record: logging.LogRecord) -> str:
+        # Same output as formatTime without a date format, strftime only runs once per second
+        second = int(record.created)
+        cached_second, formatted_time = self._cached_time
+        if cached_second != second:
+            formatted_time = time.strftime(self.default_time_format, self.converter(record.created))
+            self._cached_time = (second, formatted_time)
+        return f"{formatted_time},{int(record.msecs):03d}"
+
+    def _add_context_fields(self, log_record: dict[str, Any], record: logging.LogRecord) -> None:
+        log_record["time"] = self._format_time(record)
+        log_record["timestamp"] = record.created
+
+        if self.add_context_fields:
+            log_record["level"] = record.levelname
+            log_record["logger_name"] = record.name
+            log_record["line"] = record.lineno
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not self.fast or isinstance(record.msg, dict):
+            return super().format(record)
+
+        record.message = record.getMessage()
+        log_record: dict[str, Any] = {"message": record.message, **self._static_fields}
+
+        if record.exc_info:
+            log_record["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            log_record["exc_info"] = record.exc_text
+        if record.stack_info:
+            log_record["stack_info"] = self.formatStack(record.stack_info)
+
+        skip_fields = self._skip_fields
+        for key, value in record.__dict__.items():
+            if key not in skip_fields and not key.startswith("_"):
+                log_record[key] = value
+
+        self._add_context_fields(log_record, record)
+        return self.prefix + self._encoder.encode(self.process_log_record(log_record))
 
     def add_fields(
         self,
@@ -36,21 +237,452 @@ class CustomJsonFormatter(JsonFormatter):
         message_dict: dict[str, Any],
     ):
         super().add_fields(log_record, record, message_dict)
+        self._add_context_fields(log_record, record)
+
+
+class AsyncLogPipeline:
+    def __init__(
+        self,
+        queue_size: int = 10_000,
+        overflow_policy: LogOverflowPolicy = "drop",
+        block_timeout_seconds: Optional[float] = None,  # wait forever by default
+    ) -> None:
+        if queue_size <= 0:
+            raise ValueError("Log queue size must be positive")
+
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.block_timeout_seconds = block_timeout_seconds
+        # Queue entries: (target handler, record), a None entry stops the listener
+        self._queue: queue.Queue[Optional[tuple[logging.Handler, logging.LogRecord]]] = queue.Queue(queue_size)
+        self._listener: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.enqueued_count = 0
+        self.dropped_count = 0
+        self.handled_count = 0
+
+    def start(self) -> None:
+        if self._listener is not None:
+            return
+        self._listener = threading.Thread(target=self._listen, name="async-log-listener", daemon=True)
+        self._listener.start()
+
+    def stop(self) -> None:
+        # Records queued before the stop entry are still written, then the target handlers are flushed
+        if self._listener is None:
+            return
+        self._queue.put(None)
+        self._listener.join()
+        self._listener = None
 
-        log_data = {
-            "time": self.formatTime(record),
-            "timestamp": record.created,
+    def _listen(self) -> None:
+        handlers: set[logging.Handler] = set()
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                break
+            handler, record = entry
+            # A failing handler must not stop the listener, or stop would wait forever
+            try:
+                handler.handle(record)
+            except Exception:
+                handler.handleError(record)
+            handlers.add(handler)
+            self.handled_count += 1
+        for handler in handlers:
+            handler.flush()
+
+    def enqueue(self, handler: logging.Handler, record: logging.LogRecord) -> None:
+        try:
+            if self.overflow_policy == "block":
+                self._queue.put((handler, record), timeout=self.block_timeout_seconds)
+            else:
+                self._queue.put_nowait((handler, record))
+        except queue.Full:
+            with self._lock:
+                self.dropped_count += 1
+            return
+        with self._lock:
+            self.enqueued_count += 1
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            "queue_size": self._queue.qsize(),
+            "max_queue_size": self.queue_size,
+            "enqueued": self.enqueued_count,
+            "dropped": self.dropped_count,
+            "handled": self.handled_count,
         }
 
-        if self.add_context_fields:
-            log_data.update(
-                {
-                    "level": record.levelname,
-                    "logger_name": record.name,
-                    "line": record.lineno,
-                }
+
+class AsyncLogHandler(logging.Handler):
+    def __init__(self, pipeline: AsyncLogPipeline, target_handler: logging.Handler) -> None:
+        # The target handler level is checked on each record, so that it can be changed at runtime
+        super().__init__()
+        self.pipeline = pipeline
+        self.target_handler = target_handler
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.levelno < self.target_handler.level:
+            return
+        # Arguments are merged on the calling thread, as they may be mutated once the call returns,
+        # formatting and writing happen on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        self.pipeline.enqueue(self.target_handler, record)
+
+
+class RequestLogBuffer:
+    def __init__(self, max_records: int = 1000, latency_threshold_seconds: float = 1.0) -> None:
+        # The oldest records are dropped once the buffer is full
+        self.records: deque[tuple[Callable[[logging.LogRecord], Any], logging.LogRecord]] = deque(maxlen=max_records)
+        self.latency_threshold_seconds = latency_threshold_seconds
+
+    def append(self, forward: Callable[[logging.LogRecord], Any], record: logging.LogRecord) -> None:
+        self.records.append((forward, record))
+
+    def flush(self) -> None:
+        while len(self.records) > 0:
+            forward, record = self.records.popleft()
+            forward(record)
+
+    def discard(self) -> None:
+        self.records.clear()
+
+    def finish(self, failed: bool, duration: float) -> None:
+        if failed or duration >= self.latency_threshold_seconds:
+            self.flush()
+        else:
+            self.discard()
+
+
+current_request_log_buffer: ContextVar[Optional[RequestLogBuffer]] = ContextVar(
+    "current_request_log_buffer", default=None
+)
+
+
+class RequestLogBufferingHandler(logging.Handler):
+    def __init__(self, handler: logging.Handler, target_handler: logging.Handler, capture_level: int) -> None:
+        super().__init__()
+        self.handler = handler
+        self.target_handler = target_handler
+        self.capture_level = capture_level
+        # Buffered records are below the target handler level, so they are forwarded without level checks
+        if isinstance(handler, AsyncLogHandler):
+            self._forward = functools.partial(handler.pipeline.enqueue, target_handler)
+        else:
+            self._forward = target_handler.handle
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.levelno >= self.target_handler.level:
+            self.handler.handle(record)
+            return
+
+        request_log_buffer = current_request_log_buffer.get()
+        if request_log_buffer is None or record.levelno < self.capture_level:
+            return
+        record.msg = record.getMessage()
+        record.args = None
+        request_log_buffer.append(self._forward, record)
+
+
+@dataclasses.dataclass(frozen=True)
+class RequestLogBuffering:
+    capture_level: int
+    max_records: int
+    latency_threshold_seconds: float
+
+
+@contextlib.contextmanager
+def request_log_buffer() -> Generator[Optional[RequestLogBuffer], None, None]:
+    # Records below the output levels, logged within the block, are kept until flushed or discarded
+    if request_log_buffering is None:
+        yield None
+        return
+
+    buffer = RequestLogBuffer(request_log_buffering.max_records, request_log_buffering.latency_threshold_seconds)
+    token = current_request_log_buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        current_request_log_buffer.reset(token)
+
+
+@dataclasses.dataclass(frozen=True)
+class LogRateLimit:
+    rate_per_second: float
+    burst: float
+
+
+class _LogBucket:
+    def __init__(self, tokens: float, updated_at: float) -> None:
+        self.tokens = tokens
+        self.updated_at = updated_at
+        self.suppressed_count = 0
+
+
+class LogRateLimitFilter(logging.Filter):
+    def __init__(
+        self,
+        default_limit: Optional[LogRateLimit] = LogRateLimit(rate_per_second=10, burst=100),  # None for no limit
+        level_limits: Mapping[int, Optional[LogRateLimit]] = {},
+        summary_interval_seconds: float = 10,
+        max_keys: int = 10_000,
+    ) -> None:
+        super().__init__()
+        self.default_limit = default_limit
+        self.level_limits = dict(level_limits)
+        self.summary_interval_seconds = summary_interval_seconds
+        self.max_keys = max_keys
+        # Buckets are keyed by logger name, level and message template, in least recently used order
+        self._buckets: OrderedDict[tuple[str, int, str], _LogBucket] = OrderedDict()
+        self._next_summary_at = time.monotonic() + summary_interval_seconds
+        self._lock = threading.Lock()
+        self.passed_count = 0
+        self.suppressed_count = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "suppressed_count", None) is not None:
+            return True
+
+        now = time.monotonic()
+        if now >= self._next_summary_at:
+            self.emit_summaries()
+
+        limit = self.level_limits.get(record.levelno, self.default_limit)
+        if limit is None:
+            return True
+
+        key = (record.name, record.levelno, str(record.msg))
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = _LogBucket(limit.burst, now)
+                self._buckets[key] = bucket
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket.tokens = min(limit.burst, bucket.tokens + (now - bucket.updated_at) * limit.rate_per_second)
+                bucket.updated_at = now
+
+            if bucket.tokens < 1:
+                bucket.suppressed_count += 1
+                self.suppressed_count += 1
+                return False
+
+            bucket.tokens -= 1
+            self.passed_count += 1
+            return True
+
+    def emit_summaries(self) -> None:
+        with self._lock:
+            self._next_summary_at = time.monotonic() + self.summary_interval_seconds
+            summaries: list[tuple[str, int, str, int]] = []
+            for (name, level, message), bucket in self._buckets.items():
+                if bucket.suppressed_count > 0:
+                    summaries.append((name, level, message, bucket.suppressed_count))
+                    bucket.suppressed_count = 0
+
+        # Summaries are logged outside of the lock, as they go through this filter again
+        for name, level, message, suppressed_count in summaries:
+            logging.getLogger(name).log(
+                level,
+                "Suppressed %d similar records",
+                suppressed_count,
+                extra={"suppressed_count": suppressed_count, "suppressed_message": message},
             )
-        log_record.update(log_data)
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            "passed": self.passed_count,
+            "suppressed": self.suppressed_count,
+            "keys": len(self._buckets),
+        }
+
+
+async_log_pipeline: Optional[AsyncLogPipeline] = None
+log_rate_limit_filter: Optional[LogRateLimitFilter] = None
+request_log_buffering: Optional[RequestLogBuffering] = None
+# Output handlers added to every logger besides stdout, e.g. file or socket sinks
+global_log_sinks: list[logging.Handler] = []
+
+# Output handlers of the loggers created through get_logger, by logger name
+logger_handlers: dict[str, list[logging.Handler]] = {}
+# Stdout handlers among them, the only ones whose level is set by set_log_level, as sinks keep their own level
+logger_stdout_handlers: dict[str, list[logging.Handler]] = {}
+
+
+def _attach_handlers(logger: logging.Logger, handlers: list[logging.Handler]) -> None:
+    for target_handler in handlers:
+        handler = target_handler
+        if async_log_pipeline is not None:
+            handler = AsyncLogHandler(async_log_pipeline, handler)
+        if request_log_buffering is not None:
+            handler = RequestLogBufferingHandler(handler, target_handler, request_log_buffering.capture_level)
+        logger.addHandler(handler)
+
+
+def _detach_handlers(logger: logging.Logger, handlers: list[logging.Handler]) -> None:
+    for handler in list(logger.handlers):
+        target_handler = handler
+        if isinstance(handler, (AsyncLogHandler, RequestLogBufferingHandler)):
+            target_handler = handler.target_handler
+        if target_handler in handlers:
+            logger.removeHandler(handler)
+
+
+def _reattach_handlers() -> None:
+    for name, handlers in logger_handlers.items():
+        logger = logging.getLogger(name)
+        _detach_handlers(logger, handlers)
+        _attach_handlers(logger, handlers)
+        _update_logger_level(logger, handlers)
+
+
+def _update_logger_level(logger: logging.Logger, handlers: list[logging.Handler]) -> None:
+    # The logger level is the lowest level of its handlers, so that isEnabledFor rejects a disabled level
+    # before any record is built. Records to buffer are built as well. Handlers without level accept any record,
+    # and a NOTSET logger level would defer to the root logger level instead.
+    log_level = min((handler.level or logging.DEBUG for handler in handlers), default=logging.NOTSET)
+    if request_log_buffering is not None:
+        log_level = min(log_level, request_log_buffering.capture_level)
+    logger.setLevel(log_level)
+
+
+def set_log_level(log_level: int, name: Optional[str] = None) -> None:
+    global global_stdout_log_level
+
+    # Without a name, the level applies to every logger, including the ones created later
+    if name is None:
+        global_stdout_log_level = log_level
+        names = list(logger_handlers)
+    else:
+        names = [name]
+
+    for logger_name in names:
+        for handler in logger_stdout_handlers.get(logger_name, []):
+            handler.setLevel(log_level)
+        _update_logger_level(logging.getLogger(logger_name), logger_handlers.get(logger_name, []))
+
+
+def enable_async_logging(
+    queue_size: int = 10_000,
+    overflow_policy: LogOverflowPolicy = "drop",
+    block_timeout_seconds: Optional[float] = None,
+) -> AsyncLogPipeline:
+    global async_log_pipeline
+
+    disable_async_logging()
+    pipeline = AsyncLogPipeline(queue_size, overflow_policy, block_timeout_seconds)
+    pipeline.start()
+    async_log_pipeline = pipeline
+
+    # Loggers already created, e.g. at import time, are moved to the pipeline as well
+    _reattach_handlers()
+
+    atexit.register(pipeline.stop)
+    return pipeline
+
+
+def disable_async_logging() -> None:
+    global async_log_pipeline
+
+    pipeline = async_log_pipeline
+    if pipeline is None:
+        return
+
+    async_log_pipeline = None
+    _reattach_handlers()
+
+    pipeline.stop()
+    atexit.unregister(pipeline.stop)
+
+
+def add_log_sink(handler: logging.Handler) -> None:
+    # Sinks are shared by every logger, including the ones created later
+    if handler.formatter is None:
+        handler.setFormatter(
+            CustomJsonFormatter(fast=global_fast_log_formatting, compact=global_compact_log_formatting)
+        )
+    if handler.level == logging.NOTSET:
+        handler.setLevel(global_stdout_log_level or logging.INFO)
+    global_log_sinks.append(handler)
+
+    for name, handlers in logger_handlers.items():
+        handlers.append(handler)
+        logger = logging.getLogger(name)
+        _attach_handlers(logger, [handler])
+        _update_logger_level(logger, handlers)
+
+
+def remove_log_sink(handler: logging.Handler) -> None:
+    if handler in global_log_sinks:
+        global_log_sinks.remove(handler)
+
+    for name, handlers in logger_handlers.items():
+        if handler not in handlers:
+            continue
+        handlers.remove(handler)
+        logger = logging.getLogger(name)
+        _detach_handlers(logger, [handler])
+        _update_logger_level(logger, handlers)
+    handler.flush()
+
+
+def enable_request_log_buffering(
+    capture_level: int = logging.DEBUG,
+    max_records: int = 1000,
+    latency_threshold_seconds: float = 1.0,
+) -> RequestLogBuffering:
+    global request_log_buffering
+
+    # Records between the capture level and the output levels are built, and kept per request by the middleware.
+    # They are only written for failing requests, or requests slower than the latency threshold.
+    request_log_buffering = RequestLogBuffering(capture_level, max_records, latency_threshold_seconds)
+    _reattach_handlers()
+    return request_log_buffering
+
+
+def disable_request_log_buffering() -> None:
+    global request_log_buffering
+
+    request_log_buffering = None
+    _reattach_handlers()
+
+
+def enable_log_rate_limiting(
+    default_limit: Optional[LogRateLimit] = LogRateLimit(rate_per_second=10, burst=100),
+    level_limits: Mapping[int, Optional[LogRateLimit]] = {},
+    summary_interval_seconds: float = 10,
+) -> LogRateLimitFilter:
+    global log_rate_limit_filter
+
+    disable_log_rate_limiting()
+    rate_limit_filter = LogRateLimitFilter(default_limit, level_limits, summary_interval_seconds)
+    log_rate_limit_filter = rate_limit_filter
+
+    # Filters are set on loggers, so that suppressed records never reach the handlers
+    for name in logger_handlers:
+        logging.getLogger(name).addFilter(rate_limit_filter)
+
+    atexit.register(rate_limit_filter.emit_summaries)
+    return rate_limit_filter
+
+
+def disable_log_rate_limiting() -> None:
+    global log_rate_limit_filter
+
+    rate_limit_filter = log_rate_limit_filter
+    if rate_limit_filter is None:
+        return
+
+    log_rate_limit_filter = None
+    for name in logger_handlers:
+        logging.getLogger(name).removeFilter(rate_limit_filter)
+
+    rate_limit_filter.emit_summaries()
+    atexit.unregister(rate_limit_filter.emit_summaries)
 
 
 @functools.cache
@@ -58,17 +690,23 @@ def get_logger(
     name: str,
     stdout_log_level: Optional[int] = None,
     indent: Optional[int] = None,
+    sinks: tuple[logging.Handler, ...] = (),  # output handlers of this logger only, besides the global ones
 ) -> logging.Logger:
-    stdout_log_level = global_stdout_log_level or logging.INFO
+    stdout_log_level = stdout_log_level or global_stdout_log_level or logging.INFO
 
     logger = logging.getLogger(name)
 
-    # As log levels are set on handlers directly, logger log level is set
-    # to DEBUG to make sure log events reach the handlers
-    logger.setLevel("DEBUG")
-
-    stdout_handler = get_stdout_handler(stdout_log_level, CustomJsonFormatter(indent=indent))
-    logger.addHandler(stdout_handler)
+    log_formatter = CustomJsonFormatter(
+        indent=indent, fast=global_fast_log_formatting, compact=global_compact_log_formatting
+    )
+    stdout_handler = get_stdout_handler(stdout_log_level, log_formatter)
+    handlers: list[logging.Handler] = [stdout_handler, *global_log_sinks, *sinks]
+    logger_handlers.setdefault(name, []).extend(handlers)
+    logger_stdout_handlers.setdefault(name, []).append(stdout_handler)
+    _attach_handlers(logger, handlers)
+    _update_logger_level(logger, logger_handlers[name])
+    if log_rate_limit_filter is not None:
+        logger.addFilter(log_rate_limit_filter)
 
     return logger
 
@@ -89,7 +727,7 @@ def log_and_raise(
             extra={
                 "raw_error_message": str(exception),
                 "raw_error_class": exception.__class__.__name__,
-                "traceback": traceback.format_exc(),
+                "traceback": LazyTraceback(raw_exception),
                 **extra_log_data,
             },
         )
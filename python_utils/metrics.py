@@ -0,0 +1,237 @@
+import bisect
+import math
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Generic, Literal, Sequence, TypeVar, Union
+
+
+# Latency buckets in seconds, from 100µs to 10s
+DEFAULT_LATENCY_BUCKETS: tuple[float, ...] = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# Size buckets in bytes, from 100B to 10MB
+DEFAULT_SIZE_BUCKETS: tuple[float, ...] = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+@dataclass(frozen=True)
+class HistogramSnapshot:
+    buckets: tuple[float, ...]
+    # Per bucket counts, the last one counts the values above the highest bucket
+    bucket_counts: tuple[int, ...]
+    count: int
+    sum: float
+    max: float
+
+    def quantile(self, quantile: float) -> float:
+        if self.count == 0:
+            return math.nan
+
+        rank = quantile * self.count
+        cumulative_count = 0
+        for index, bucket_count in enumerate(self.bucket_counts):
+            cumulative_count += bucket_count
+            if cumulative_count >= rank:
+                if index == len(self.buckets):
+                    return self.max
+                return min(self.buckets[index], self.max)
+        return self.max
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self._bucket_counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._bucket_counts[index] += 1
+            self._count += 1
+            self._sum += value
+            if value > self._max:
+                self._max = value
+
+    def snapshot(self) -> HistogramSnapshot:
+        with self._lock:
+            return HistogramSnapshot(
+                self.buckets, tuple(self._bucket_counts), self._count, self._sum, self._max
+            )
+
+
+class Counter:
+    def __init__(self) -> None:
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def increment(self, amount: int = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+
+class Gauge:
+    def __init__(self) -> None:
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def increment(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def decrement(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+MetricType = Literal["counter", "gauge", "histogram"]
+Metric = Union[Counter, Gauge, Histogram]
+M = TypeVar("M", Counter, Gauge, Histogram)
+
+
+class MetricFamily(Generic[M]):
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        metric_type: MetricType,
+        label_names: Sequence[str],
+        create_metric: Callable[[], M],
+    ) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.metric_type = metric_type
+        self.label_names = tuple(label_names)
+        self.create_metric = create_metric
+        self._metrics: dict[tuple[str, ...], M] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *label_values: str) -> M:
+        # Existing metrics are looked up without lock, the lock is only taken to add a label combination
+        metric = self._metrics.get(label_values)
+        if metric is None:
+            if len(label_values) != len(self.label_names):
+                raise ValueError(f"Metric {self.name} expects labels {self.label_names}")
+            with self._lock:
+                metric = self._metrics.setdefault(label_values, self.create_metric())
+        return metric
+
+    def get_metrics(self) -> list[tuple[tuple[str, ...], M]]:
+        with self._lock:
+            return list(self._metrics.items())
+
+
+def _escape_label_value(label_value: str) -> str:
+    return label_value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_names: Sequence[str], label_values: Sequence[str]) -> str:
+    if len(label_names) == 0:
+        return ""
+    labels = ",".join(
+        f'{label_name}="{_escape_label_value(label_value)}"'
+        for label_name, label_value in zip(label_names, label_values)
+    )
+    return "{" + labels + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._families: dict[str, MetricFamily[Any]] = {}
+        self._lock = threading.Lock()
+
+    def _get_family(
+        self,
+        name: str,
+        help_text: str,
+        metric_type: MetricType,
+        label_names: Sequence[str],
+        create_metric: Callable[[], M],
+    ) -> MetricFamily[M]:
+        # Registering a metric twice returns the existing family, e.g. for two apps sharing a registry
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = MetricFamily(name, help_text, metric_type, label_names, create_metric)
+                self._families[name] = family
+            elif family.metric_type != metric_type or family.label_names != tuple(label_names):
+                raise ValueError(f"Metric {name} is already registered with another type or labels")
+            return family
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> MetricFamily[Counter]:
+        return self._get_family(name, help_text, "counter", label_names, Counter)
+
+    def gauge(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> MetricFamily[Gauge]:
+        return self._get_family(name, help_text, "gauge", label_names, Gauge)
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ) -> MetricFamily[Histogram]:
+        return self._get_family(name, help_text, "histogram", label_names, lambda: Histogram(buckets))
+
+    def render_prometheus(self) -> str:
+        # Prometheus text exposition format, version 0.0.4
+        lines: list[str] = []
+        with self._lock:
+            families = list(self._families.values())
+
+        for family in families:
+            lines.append(f"# HELP {family.name} {family.help_text}")
+            lines.append(f"# TYPE {family.name} {family.metric_type}")
+            for label_values, metric in family.get_metrics():
+                if isinstance(metric, Histogram):
+                    snapshot = metric.snapshot()
+                    cumulative_count = 0
+                    for bucket, bucket_count in zip((*snapshot.buckets, math.inf), snapshot.bucket_counts):
+                        cumulative_count += bucket_count
+                        labels = _format_labels(
+                            (*family.label_names, "le"), (*label_values, _format_value(bucket))
+                        )
+                        lines.append(f"{family.name}_bucket{labels} {cumulative_count}")
+                    labels = _format_labels(family.label_names, label_values)
+                    lines.append(f"{family.name}_sum{labels} {_format_value(snapshot.sum)}")
+                    lines.append(f"{family.name}_count{labels} {snapshot.count}")
+                else:
+                    labels = _format_labels(family.label_names, label_values)
+                    lines.append(f"{family.name}{labels} {_format_value(metric.value)}")
+
+        return "\n".join(lines) + "\n"
@@ -1,5 +1,3 @@
-import traceback
-
 from dataclasses import fields
 from logging import Logger
 from sqlalchemy.exc import IntegrityError
@@ -8,6 +6,7 @@ from typing import Generic, Optional, Type, TypeVar
 from uuid import UUID
 
 from python_utils.entity import Entity
+from python_utils.loggers import LazyTraceback
 
 
 TypeEntity = TypeVar("TypeEntity", bound=Entity)
@@ -34,7 +33,7 @@ class SQLAlchemyCRUDRepository(Generic[TypeEntity]):
         try:
             self.session.add(entity)
             self.session.flush()
-        except IntegrityError:
+        except IntegrityError as integrity_error:
             exception = (
                 self.constraint_exception()
                 if self.constraint_exception is not None
@@ -42,7 +41,7 @@ class SQLAlchemyCRUDRepository(Generic[TypeEntity]):
             )
             self.logger.exception(
                 str(exception),
-                extra={"traceback": traceback.format_exc()},
+                extra={"traceback": LazyTraceback(integrity_error)},
             )
             raise exception
         except Exception as raw_exception:
@@ -53,7 +52,7 @@ class SQLAlchemyCRUDRepository(Generic[TypeEntity]):
                 extra={
                     "raw_exception": raw_exception,
                     "exception_class": raw_exception.__class__.__name__,
-                    "traceback": traceback.format_exc(),
+                    "traceback": LazyTraceback(raw_exception),
                 },
             )
             raise exception
@@ -70,12 +69,10 @@ class SQLAlchemyCRUDRepository(Generic[TypeEntity]):
                 if self.not_found_exception is not None
                 else self.default_exception()
             )
-            self.logger.exception(
+            # No exception is being handled here, so there is no traceback to log
+            self.logger.error(
                 str(exception),
-                extra={
-                    "entity_id": entity_id,
-                    "traceback": traceback.format_exc(),
-                },
+                extra={"entity_id": entity_id},
             )
             raise exception
         return entity
@@ -90,7 +87,7 @@ class SQLAlchemyCRUDRepository(Generic[TypeEntity]):
                     entity, attribute_name, getattr(new_entity, attribute_name)
                 )
             self.session.flush()
-        except IntegrityError:
+        except IntegrityError as integrity_error:
             exception = (
                 self.constraint_exception()
                 if self.constraint_exception is not None
@@ -98,7 +95,7 @@ class SQLAlchemyCRUDRepository(Generic[TypeEntity]):
             )
             self.logger.exception(
                 str(exception),
-                extra={"traceback": traceback.format_exc()},
+                extra={"traceback": LazyTraceback(integrity_error)},
             )
             raise exception
         except Exception as raw_exception:
@@ -109,7 +106,7 @@ class SQLAlchemyCRUDRepository(Generic[TypeEntity]):
                 extra={
                     "raw_exception": raw_exception,
                     "exception_class": raw_exception.__class__.__name__,
-                    "traceback": traceback.format_exc(),
+                    "traceback": LazyTraceback(raw_exception),
                 },
             )
             raise exception
@@ -126,7 +123,7 @@ class SQLAlchemyCRUDRepository(Generic[TypeEntity]):
                 extra={
                     "raw_exception": raw_exception,
                     "exception_class": raw_exception.__class__.__name__,
-                    "traceback": traceback.format_exc(),
+                    "traceback": LazyTraceback(raw_exception),
                 },
             )
             raise exception
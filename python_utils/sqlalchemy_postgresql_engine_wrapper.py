@@ -1,6 +1,7 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.pool import QueuePool
+from typing import Optional
 
 
 class SqlAlchemyPostgresqlEngineWrapper:
@@ -12,6 +13,8 @@ class SqlAlchemyPostgresqlEngineWrapper:
         sql_port: int,
         sql_database: str,
         pool_size: int,
+        replica_sql_host: Optional[str] = None,
+        replica_sql_port: Optional[int] = None,
     ):
         self.engine = create_engine(
             f"postgresql+psycopg2://{sql_user}:{sql_password}@{sql_host}:{sql_port}/{sql_database}",
@@ -19,6 +22,22 @@ class SqlAlchemyPostgresqlEngineWrapper:
             pool_size=pool_size,
         )
 
+        # Read-only sessions use the replica when there is one, the primary otherwise
+        self.replica_engine = self.engine
+        if replica_sql_host is not None:
+            self.replica_engine = create_engine(
+                f"postgresql+psycopg2://{sql_user}:{sql_password}@{replica_sql_host}:{replica_sql_port or sql_port}/{sql_database}",
+                poolclass=QueuePool,
+                pool_size=pool_size,
+            )
+        self._read_only_session_maker = sessionmaker(
+            self.replica_engine.execution_options(postgresql_readonly=True)
+        )
+
     def create_session(self) -> Session:
         session = sessionmaker(self.engine)()
         return session
+
+    def create_read_only_session(self) -> Session:
+        session = self._read_only_session_maker()
+        return session
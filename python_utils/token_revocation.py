@@ -0,0 +1,214 @@
+import math
+import threading
+import time
+from sqlalchemy import BigInteger, Column, Float, LargeBinary, MetaData, Table, delete, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from typing import Optional, Protocol
+
+from python_utils.loggers import get_logger
+from python_utils.sqlalchemy_postgresql_engine_wrapper import SqlAlchemyPostgresqlEngineWrapper
+
+
+logger = get_logger(__name__)
+
+
+class BloomFilter:
+    def __init__(self, expected_items: int, false_positive_rate: float = 0.001) -> None:
+        if expected_items <= 0:
+            raise ValueError("Bloom filter expected items must be positive")
+        if not 0 < false_positive_rate < 1:
+            raise ValueError("Bloom filter false positive rate must be between 0 and 1")
+
+        self.expected_items = expected_items
+        self.size = max(8, math.ceil(-expected_items * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / expected_items * math.log(2)))
+        self.count = 0
+        self._bits = bytearray(math.ceil(self.size / 8))
+
+    def _get_positions(self, digest: bytes) -> list[int]:
+        # Items are already cryptographic digests, so two slices of them are enough for double hashing
+        first_hash = int.from_bytes(digest[:8], "little")
+        second_hash = int.from_bytes(digest[8:16], "little") | 1
+        return [(first_hash + index * second_hash) % self.size for index in range(self.hash_count)]
+
+    def add(self, digest: bytes) -> None:
+        for position in self._get_positions(digest):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, digest: bytes) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._get_positions(digest))
+
+
+class RevocationStore(Protocol):
+    def revoke(self, token_digest: bytes, expires_at: Optional[float]) -> None: ...
+
+    def is_revoked(self, token_digest: bytes) -> bool: ...
+
+    # Returns the digests revoked after the given cursor and the cursor to use for the next call. Digests that were
+    # already returned may be returned again.
+    def get_revoked_since(self, cursor: int) -> tuple[list[bytes], int]: ...
+
+
+class InMemoryRevocationStore:
+    def __init__(self) -> None:
+        self._expirations: dict[bytes, Optional[float]] = {}
+        self._revocation_log: list[bytes] = []
+        self._lock = threading.Lock()
+
+    def revoke(self, token_digest: bytes, expires_at: Optional[float]) -> None:
+        with self._lock:
+            if token_digest in self._expirations:
+                return
+            self._expirations[token_digest] = expires_at
+            self._revocation_log.append(token_digest)
+
+    def is_revoked(self, token_digest: bytes) -> bool:
+        if token_digest not in self._expirations:
+            return False
+        expires_at = self._expirations[token_digest]
+        return expires_at is None or expires_at > time.time()
+
+    def get_revoked_since(self, cursor: int) -> tuple[list[bytes], int]:
+        with self._lock:
+            token_digests = [
+                token_digest for token_digest in self._revocation_log[cursor:] if self.is_revoked(token_digest)
+            ]
+            return token_digests, len(self._revocation_log)
+
+
+class SqlAlchemyPostgresqlRevocationStore:
+    def __init__(
+        self,
+        engine_wrapper: SqlAlchemyPostgresqlEngineWrapper,
+        table_name: str = "revoked_tokens",
+        # Ids are assigned on insert, not on commit: the rows below the cursor are read again, so that a revocation
+        # committed after a higher id was synced is not skipped. Such a revocation is only missed, until the next
+        # full rebuild, when more than sync_overlap_rows revocations are inserted between its own insert and commit.
+        sync_overlap_rows: int = 1000,
+    ) -> None:
+        self.engine_wrapper = engine_wrapper
+        self.sync_overlap_rows = sync_overlap_rows
+        self.table = Table(
+            table_name,
+            MetaData(),
+            Column("id", BigInteger, primary_key=True, autoincrement=True),
+            Column("token_digest", LargeBinary(32), nullable=False, unique=True),
+            Column("expires_at", Float[float](), nullable=True),
+        )
+
+    def create_table(self) -> None:
+        self.table.metadata.create_all(self.engine_wrapper.engine)
+
+    def _not_expired(self):
+        return or_(self.table.c.expires_at.is_(None), self.table.c.expires_at > time.time())
+
+    def revoke(self, token_digest: bytes, expires_at: Optional[float]) -> None:
+        statement = (
+            insert(self.table)
+            .values(token_digest=token_digest, expires_at=expires_at)
+            .on_conflict_do_nothing(index_elements=[self.table.c.token_digest])
+        )
+        with self.engine_wrapper.create_session() as session:
+            session.execute(statement)
+            session.commit()
+
+    def is_revoked(self, token_digest: bytes) -> bool:
+        statement = select(self.table.c.id).where(self.table.c.token_digest == token_digest, self._not_expired())
+        with self.engine_wrapper.create_session() as session:
+            return session.execute(statement).first() is not None
+
+    def get_revoked_since(self, cursor: int) -> tuple[list[bytes], int]:
+        statement = (
+            select(self.table.c.id, self.table.c.token_digest)
+            .where(self.table.c.id > cursor - self.sync_overlap_rows, self._not_expired())
+            .order_by(self.table.c.id)
+        )
+        with self.engine_wrapper.create_session() as session:
+            rows = session.execute(statement).all()
+        if len(rows) == 0:
+            return [], cursor
+        return [row.token_digest for row in rows], max(cursor, rows[-1].id)
+
+    def purge_expired(self) -> None:
+        statement = delete(self.table).where(self.table.c.expires_at <= time.time())
+        with self.engine_wrapper.create_session() as session:
+            session.execute(statement)
+            session.commit()
+
+
+class TokenRevocationList:
+    def __init__(
+        self,
+        store: RevocationStore,
+        expected_revocations: int = 100_000,
+        false_positive_rate: float = 0.001,
+        sync_interval_seconds: float = 30,
+    ) -> None:
+        self.store = store
+        self.expected_revocations = expected_revocations
+        self.false_positive_rate = false_positive_rate
+        self.sync_interval_seconds = sync_interval_seconds
+
+        self._bloom_filter = BloomFilter(expected_revocations, false_positive_rate)
+        self._cursor = 0
+        self._sync_lock = threading.Lock()
+        self._sync_thread: Optional[threading.Thread] = None
+        self._stop_sync_event = threading.Event()
+
+        self.sync()
+
+    def revoke(self, token_digest: bytes, expires_at: Optional[float] = None) -> None:
+        self.store.revoke(token_digest, expires_at)
+        self._bloom_filter.add(token_digest)
+
+    # Most tokens are not revoked: the bloom filter answers for them without reaching the store
+    def may_be_revoked(self, token_digest: bytes) -> bool:
+        return token_digest in self._bloom_filter
+
+    def is_revoked(self, token_digest: bytes) -> bool:
+        if not self.may_be_revoked(token_digest):
+            return False
+        return self.store.is_revoked(token_digest)
+
+    def sync(self) -> None:
+        with self._sync_lock:
+            token_digests, self._cursor = self.store.get_revoked_since(self._cursor)
+            bloom_filter = self._bloom_filter
+            if bloom_filter.count + len(token_digests) > bloom_filter.expected_items:
+                # Bloom filters cannot forget items: rebuild from the store to drop expired revocations
+                token_digests, self._cursor = self.store.get_revoked_since(0)
+                expected_items = max(self.expected_revocations, 2 * len(token_digests))
+                bloom_filter = BloomFilter(expected_items, self.false_positive_rate)
+            for token_digest in token_digests:
+                # Digests returned again by the store must not fill the filter up
+                if token_digest not in bloom_filter:
+                    bloom_filter.add(token_digest)
+            self._bloom_filter = bloom_filter
+
+    def _sync_periodically(self) -> None:
+        while not self._stop_sync_event.wait(self.sync_interval_seconds):
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(
+                    "Token revocation list sync failed",
+                    extra={"error": str(e), "error_class": e.__class__.__name__},
+                )
+
+    def start_sync(self) -> None:
+        if self._sync_thread is not None:
+            return
+        self._stop_sync_event.clear()
+        self._sync_thread = threading.Thread(
+            target=self._sync_periodically, name="token-revocation-sync", daemon=True
+        )
+        self._sync_thread.start()
+
+    def stop_sync(self) -> None:
+        if self._sync_thread is None:
+            return
+        self._stop_sync_event.set()
+        self._sync_thread.join()
+        self._sync_thread = None
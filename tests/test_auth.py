@@ -1,11 +1,18 @@
 import pytest
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
 from datetime import datetime, timedelta, timezone
 from fastapi import HTTPException
 from jwt import encode  # pyright: ignore
 from jwt.exceptions import ExpiredSignatureError
 from pytest_mock import MockerFixture
 
-from python_utils.auth import Auth, AuthException
+from python_utils import auth as auth_module
+from python_utils.auth import Auth, AuthException, AuthKey, KeyRing, TokenCache, TokenPair
+from python_utils.token_revocation import InMemoryRevocationStore, TokenRevocationList
 
 
 @pytest.fixture
@@ -13,6 +20,28 @@ def auth():
     return Auth("secret_key", "public_key")
 
 
+def get_private_key_pem(algorithm: str) -> bytes:
+    if algorithm == "RS256":
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    elif algorithm == "ES256":
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    else:
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    return private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+
+
+def get_public_key_pem(private_key_pem: bytes) -> bytes:
+    private_key = serialization.load_pem_private_key(private_key_pem, password=None)
+    return private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+
+
 def test_invalid_token_data_keys():
     with pytest.raises(AuthException) as e:
         Auth("secret_key", "public_key", [])
@@ -99,7 +128,7 @@ def test_refresh_access_token_invalid_refresh_token(auth: Auth):
 
 def test_refresh_access_token_missing_data(auth: Auth):
     expire = datetime.now(timezone.utc) + timedelta(days=30)
-    bad_token = encode({"expire": expire.isoformat()}, "secret_key", algorithm="HS256")
+    bad_token = encode({"exp": expire}, "secret_key", algorithm="HS256")
     with pytest.raises(AuthException) as e:
         auth.refresh_access_token(bad_token)
     assert str(e.value) == "Missing username in token"
@@ -132,7 +161,369 @@ async def test_get_current_user_expired_token(auth: Auth, mocker: MockerFixture)
 @pytest.mark.asyncio
 async def test_get_current_user_invalid_credentials(auth: Auth):
     expire = datetime.now(timezone.utc) + timedelta(days=30)
-    bad_token = encode({"expire": expire.isoformat()}, "secret_key", algorithm="HS256")
+    bad_token = encode({"exp": expire}, "secret_key", algorithm="HS256")
     with pytest.raises(HTTPException) as e:
         await auth.get_current_user(bad_token)
     assert str(e.value) == "401: Invalid authentication credentials"
+
+
+def test_decode_token_uses_cache(auth: Auth, mocker: MockerFixture):
+    token = auth.create_access_token({"username": "username"})
+    decode_spy = mocker.spy(auth_module, "decode")
+
+    first_payload = auth.decode_token(token)
+    second_payload = auth.decode_token(token)
+
+    assert first_payload == second_payload
+    assert decode_spy.call_count == 1
+    assert auth.token_cache is not None
+    assert auth.token_cache.get_stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_decode_token_without_cache(mocker: MockerFixture):
+    auth = Auth("secret_key", "public_key", token_cache_size=0)
+    token = auth.create_access_token({"username": "username"})
+    decode_spy = mocker.spy(auth_module, "decode")
+
+    auth.decode_token(token)
+    auth.decode_token(token)
+
+    assert auth.token_cache is None
+    assert decode_spy.call_count == 2
+
+
+def test_decode_token_invalid_token_not_cached(auth: Auth):
+    with pytest.raises(AuthException):
+        auth.decode_token("invalid_token")
+    assert auth.token_cache is not None
+    assert len(auth.token_cache) == 0
+
+
+def test_token_cache_eviction():
+    token_cache = TokenCache(max_size=2)
+    token_cache.set(b"token_1", {"username": "1"})
+    token_cache.set(b"token_2", {"username": "2"})
+    token_cache.get(b"token_1")
+    token_cache.set(b"token_3", {"username": "3"})
+
+    assert len(token_cache) == 2
+    assert token_cache.get(b"token_1") == {"username": "1"}
+    assert token_cache.get(b"token_2") is None
+    assert token_cache.get(b"token_3") == {"username": "3"}
+
+
+def test_token_cache_capped_at_token_expiration(mocker: MockerFixture):
+    token_cache = TokenCache(ttl_seconds=300)
+    mocker.patch("python_utils.auth.time.time", return_value=1000.0)
+    token_cache.set(b"token", {"username": "username"}, token_expires_at=1010.0)
+    assert token_cache.get(b"token") == {"username": "username"}
+
+    mocker.patch("python_utils.auth.time.time", return_value=1010.0)
+    assert token_cache.get(b"token") is None
+    assert len(token_cache) == 0
+
+
+def test_token_cache_ignores_expired_token():
+    token_cache = TokenCache()
+    token_cache.set(b"token", {"username": "username"}, token_expires_at=0.0)
+    assert len(token_cache) == 0
+
+
+@pytest.mark.parametrize("algorithm", ["RS256", "ES256", "EdDSA"])
+def test_key_ring_asymmetric_algorithms(algorithm: str):
+    private_key_pem = get_private_key_pem(algorithm)
+    signing_auth = Auth(
+        None, "public_key", key_ring=KeyRing([AuthKey("key_1", algorithm, signing_key=private_key_pem)], "key_1")
+    )
+    verifying_auth = Auth(
+        None,
+        "public_key",
+        key_ring=KeyRing([AuthKey("key_1", algorithm, verifying_key=get_public_key_pem(private_key_pem))]),
+    )
+
+    token = signing_auth.create_access_token({"username": "username"})
+
+    assert signing_auth.algorithm == algorithm
+    assert verifying_auth.decode_token(token)["username"] == "username"
+    with pytest.raises(AuthException) as e:
+        verifying_auth.create_access_token({"username": "username"})
+    assert str(e.value) == "No active signing key"
+
+
+def test_key_ring_rotation(auth: Auth):
+    old_token = auth.create_access_token({"username": "username"})
+
+    auth.key_ring.add_key(AuthKey("key_2", "HS512", signing_key="new_secret_key"), activate=True)
+    new_token = auth.create_access_token({"username": "username"})
+
+    assert auth.algorithm == "HS512"
+    auth.validate_token(old_token)
+    auth.validate_token(new_token)
+
+    auth.key_ring.remove_key("default")
+    with pytest.raises(AuthException) as e:
+        auth.validate_token(old_token)
+    assert str(e.value) == "Invalid token"
+    auth.validate_token(new_token)
+
+
+def test_key_ring_replaced_key_invalidates_cache(auth: Auth):
+    token = auth.create_access_token({"username": "username"})
+    auth.validate_token(token)
+
+    auth.key_ring.add_key(AuthKey("default", "HS256", signing_key="other_secret_key"))
+    with pytest.raises(AuthException) as e:
+        auth.validate_token(token)
+    assert str(e.value) == "Invalid token"
+
+
+def test_key_ring_token_without_kid_uses_default_key(auth: Auth):
+    token = encode({"username": "username", "exp": time.time() + 60}, "secret_key", algorithm="HS256")
+    assert auth.decode_token(token)["username"] == "username"
+
+
+def test_key_ring_unknown_kid(auth: Auth):
+    token = encode({"username": "username"}, "secret_key", algorithm="HS256", headers={"kid": "unknown"})
+    with pytest.raises(AuthException) as e:
+        auth.validate_token(token)
+    assert str(e.value) == "Invalid token"
+
+
+def test_key_ring_algorithm_mismatch(auth: Auth):
+    token = encode({"username": "username"}, "secret_key", algorithm="HS384", headers={"kid": "default"})
+    with pytest.raises(AuthException) as e:
+        auth.validate_token(token)
+    assert str(e.value) == "Invalid token"
+
+
+def test_key_ring_verify_only_key_cannot_be_activated():
+    public_key_pem = get_public_key_pem(get_private_key_pem("ES256"))
+    key_ring = KeyRing([AuthKey("key_1", "ES256", verifying_key=public_key_pem)])
+    with pytest.raises(AuthException) as e:
+        key_ring.activate_key("key_1")
+    assert str(e.value) == "Key key_1 cannot sign tokens"
+
+
+def test_auth_key_invalid():
+    with pytest.raises(AuthException) as e:
+        AuthKey("key_1", "none", signing_key="secret_key")
+    assert str(e.value) == "Unsupported algorithm none"
+
+    with pytest.raises(AuthException) as e:
+        AuthKey("key_1", "HS256")
+    assert str(e.value) == "Missing signing or verifying key"
+
+
+def test_auth_without_secret_key_or_key_ring():
+    with pytest.raises(AuthException) as e:
+        Auth(None, "public_key")
+    assert str(e.value) == "Missing secret key or key ring"
+
+
+@pytest.mark.asyncio
+async def test_revoke_token():
+    auth = Auth("secret_key", "public_key", revocation_list=TokenRevocationList(InMemoryRevocationStore()))
+    token = auth.create_access_token({"username": "username"})
+    other_token = auth.create_access_token({"username": "other_username"})
+    auth.validate_token(token)
+
+    auth.revoke_token(token)
+
+    with pytest.raises(AuthException) as e:
+        auth.validate_token(token)
+    assert str(e.value) == "Token revoked"
+    with pytest.raises(HTTPException):
+        await auth.get_current_user(token)
+    assert await auth.get_current_user(other_token) == "other_username"
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_checks_revocation_store_off_the_event_loop():
+    class RecordingRevocationStore(InMemoryRevocationStore):
+        def __init__(self) -> None:
+            super().__init__()
+            self.threads: list[threading.Thread] = []
+
+        def is_revoked(self, token_digest: bytes) -> bool:
+            self.threads.append(threading.current_thread())
+            return super().is_revoked(token_digest)
+
+    store = RecordingRevocationStore()
+    auth = Auth("secret_key", "public_key", revocation_list=TokenRevocationList(store))
+    token = auth.create_access_token({"username": "username"})
+    auth.revoke_token(token)
+
+    with pytest.raises(HTTPException):
+        await auth.get_current_user(token)
+    assert len(store.threads) == 1
+    assert store.threads[0] is not threading.current_thread()
+
+
+def test_revoke_token_without_revocation_list(auth: Auth):
+    token = auth.create_access_token({"username": "username"})
+    with pytest.raises(AuthException) as e:
+        auth.revoke_token(token)
+    assert str(e.value) == "Token revocation is not enabled"
+
+
+def test_token_claims(auth: Auth):
+    token_data = {"username": "username"}
+    payload = auth.decode_token(auth.create_access_token(token_data))
+
+    assert token_data == {"username": "username"}
+    assert isinstance(payload["exp"], int)
+    assert payload["iat"] == payload["nbf"]
+    assert payload["exp"] - payload["iat"] == auth.access_token_expire_seconds
+    assert "expire" not in payload
+
+
+def test_validate_token_really_expired(auth: Auth):
+    token = encode({"username": "username", "exp": int(time.time()) - 10}, "secret_key", algorithm="HS256")
+    with pytest.raises(AuthException) as e:
+        auth.validate_token(token)
+    assert str(e.value) == "Token expired"
+
+
+def test_validate_token_expired_within_leeway():
+    auth = Auth("secret_key", "public_key", leeway_seconds=30)
+    token = encode({"username": "username", "exp": int(time.time()) - 10}, "secret_key", algorithm="HS256")
+    auth.validate_token(token)
+
+
+def test_validate_token_not_yet_valid(auth: Auth):
+    now = int(time.time())
+    token = encode({"username": "username", "nbf": now + 60, "exp": now + 120}, "secret_key", algorithm="HS256")
+    with pytest.raises(AuthException) as e:
+        auth.validate_token(token)
+    assert str(e.value) == "Invalid token"
+
+
+def test_validate_token_issued_by_a_host_ahead_of_the_verifier(auth: Auth, mocker: MockerFixture):
+    # The verifying host's clock is slightly behind the issuing one's: iat and nbf are in its future
+    mocker.patch.object(auth_module.time, "time", return_value=time.time() + 2)
+    token = auth.create_access_token({"username": "username"})
+    mocker.stopall()
+
+    auth.validate_token(token)
+    with pytest.raises(AuthException) as e:
+        Auth("secret_key", "public_key", leeway_seconds=0).validate_token(token)
+    assert str(e.value) == "Invalid token"
+
+
+def test_validate_token_legacy_expire_rejected(auth: Auth):
+    expire = datetime.now(timezone.utc) + timedelta(days=30)
+    legacy_token = encode({"username": "username", "expire": expire.isoformat()}, "secret_key", algorithm="HS256")
+    with pytest.raises(AuthException) as e:
+        auth.validate_token(legacy_token)
+    assert str(e.value) == "Invalid token"
+
+
+def test_validate_token_legacy_expire_accepted_in_migration_mode():
+    auth = Auth("secret_key", "public_key", accept_legacy_expire=True)
+    expire = datetime.now(timezone.utc) + timedelta(days=30)
+    legacy_token = encode({"username": "username", "expire": expire.isoformat()}, "secret_key", algorithm="HS256")
+    assert auth.decode_token(legacy_token)["username"] == "username"
+    auth.validate_token(auth.create_access_token({"username": "username"}))
+
+
+def test_validate_token_legacy_expire_expired_in_migration_mode():
+    auth = Auth("secret_key", "public_key", accept_legacy_expire=True)
+    expire = datetime.now(timezone.utc) - timedelta(seconds=10)
+    legacy_token = encode({"username": "username", "expire": expire.isoformat()}, "secret_key", algorithm="HS256")
+    with pytest.raises(AuthException) as e:
+        auth.validate_token(legacy_token)
+    assert str(e.value) == "Token expired"
+
+    token_without_expiration = encode({"username": "username"}, "secret_key", algorithm="HS256")
+    with pytest.raises(AuthException) as e:
+        auth.validate_token(token_without_expiration)
+    assert str(e.value) == "Invalid token"
+
+
+def test_issue_token_pair(auth: Auth):
+    token_data = {"username": "username"}
+    token_pair = auth.issue_token_pair(token_data)
+
+    access_payload = auth.decode_token(token_pair.access_token)
+    refresh_payload = auth.decode_token(token_pair.refresh_token)
+    assert token_data == {"username": "username"}
+    assert access_payload["username"] == refresh_payload["username"] == "username"
+    assert access_payload["iat"] == refresh_payload["iat"]
+    assert access_payload["exp"] - access_payload["iat"] == auth.access_token_expire_seconds
+    assert refresh_payload["exp"] - refresh_payload["iat"] == auth.refresh_token_expire_seconds
+    auth.refresh_access_token(token_pair.refresh_token)
+
+
+def test_issue_token_pair_missing_data(auth: Auth):
+    with pytest.raises(AuthException) as e:
+        auth.issue_token_pair({})
+    assert str(e.value) == "Missing required data in token"
+
+
+def test_issue_many(auth: Auth, mocker: MockerFixture):
+    token_pairs = auth.issue_many({"username": f"user_{index}"} for index in range(5))
+
+    assert not isinstance(token_pairs, list)
+    mocker.patch.object(auth_module.time, "time", return_value=time.time() - 60)
+    first_token_pair = next(token_pairs)
+    mocker.stopall()
+    token_pairs = [first_token_pair, *token_pairs]
+    assert len(token_pairs) == 5
+    assert all(isinstance(token_pair, TokenPair) for token_pair in token_pairs)
+    assert [auth.decode_token(token_pair.access_token)["username"] for token_pair in token_pairs] == [
+        f"user_{index}" for index in range(5)
+    ]
+    # Pairs consumed later are issued at the time they are consumed
+    issued_ats = [auth.decode_token(token_pair.access_token)["iat"] for token_pair in token_pairs]
+    assert issued_ats[1] - issued_ats[0] >= 59
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_offloads_asymmetric_verification():
+    private_key_pem = get_private_key_pem("ES256")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        auth = Auth(
+            None,
+            "public_key",
+            key_ring=KeyRing([AuthKey("key_1", "ES256", signing_key=private_key_pem)], "key_1"),
+            verification_executor=executor,
+        )
+        token = auth.create_access_token({"username": "username"})
+
+        assert await auth.get_current_user(token) == "username"
+        assert await auth.get_current_user(token) == "username"
+
+    stats = auth.verification_stats.get_stats()
+    assert stats["offloaded_count"] == 1
+    assert stats["inline_count"] == 0
+    assert stats["queue_depth"] == 0
+    assert stats["max_queue_depth"] == 1
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_verifies_symmetric_tokens_inline():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        auth = Auth("secret_key", "public_key", verification_executor=executor)
+        token = auth.create_access_token({"username": "username"})
+
+        assert await auth.get_current_user(token) == "username"
+
+    stats = auth.verification_stats.get_stats()
+    assert stats["offloaded_count"] == 0
+    assert stats["inline_count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_decode_token_async_offloaded_errors():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        auth = Auth("secret_key", "public_key", verification_executor=executor, offload_cost_threshold=0)
+        token = encode({"username": "username", "exp": int(time.time()) - 10}, "secret_key", algorithm="HS256")
+
+        with pytest.raises(AuthException) as e:
+            await auth.decode_token_async(token)
+        assert str(e.value) == "Token expired"
+        with pytest.raises(AuthException) as e:
+            await auth.decode_token_async("invalid_token")
+        assert str(e.value) == "Invalid token"
+
+    assert auth.verification_stats.get_stats()["offloaded_count"] == 1
@@ -0,0 +1,162 @@
+import pytest
+import threading
+from typing import Any
+
+from python_utils.command_queue import CommandQueue, CommandQueueFullException
+from python_utils.domain import CommandContextCreator, Domain
+
+
+class ConcreteCommandContext:
+    def rollback(self) -> None:
+        pass
+
+    def commit(self) -> None:
+        pass
+
+
+class DomainForTesting(Domain[ConcreteCommandContext]):
+    def __init__(
+        self,
+        command: Any,
+        command_context_creator: CommandContextCreator[ConcreteCommandContext],
+    ) -> None:
+        super().__init__(command_context_creator)
+
+        self.some_command = self._bind_command(command)
+
+
+def test_command_queue_runs_bound_commands():
+    threads: list[threading.Thread] = []
+
+    def some_command(_: ConcreteCommandContext, value: int):
+        threads.append(threading.current_thread())
+        return value * 2
+
+    domain = DomainForTesting(some_command, ConcreteCommandContext)
+    with CommandQueue(worker_count=2) as command_queue:
+        futures = [command_queue.submit(domain.some_command, index) for index in range(10)]  # pyright: ignore
+        results = [future.result(timeout=5) for future in futures]
+
+    assert results == [index * 2 for index in range(10)]
+    assert threading.current_thread() not in threads
+    assert command_queue.get_stats()["completed"] == 10
+
+
+def test_command_queue_exception():
+    def some_command(_: ConcreteCommandContext):
+        raise Exception("Some command exception")
+
+    domain = DomainForTesting(some_command, ConcreteCommandContext)
+    with CommandQueue(worker_count=1) as command_queue:
+        future = command_queue.submit(domain.some_command)  # pyright: ignore
+        with pytest.raises(Exception) as exception_info:
+            future.result(timeout=5)
+
+    assert str(exception_info.value) == "Some command exception"
+    assert command_queue.get_stats()["failed"] == 1
+
+
+def test_command_queue_priority():
+    release = threading.Event()
+    order: list[str] = []
+
+    with CommandQueue(worker_count=1) as command_queue:
+        blocking_future = command_queue.submit(release.wait)
+        futures = [
+            command_queue.submit_with_priority(5, order.append, "low"),
+            command_queue.submit_with_priority(1, order.append, "high"),
+            command_queue.submit(order.append, "first default"),
+            command_queue.submit(order.append, "second default"),
+        ]
+        release.set()
+        blocking_future.result(timeout=5)
+        for future in futures:
+            future.result(timeout=5)
+
+    assert order == ["first default", "second default", "high", "low"]
+
+
+def test_command_queue_reject_when_full():
+    release = threading.Event()
+    with CommandQueue(worker_count=1, max_size=1, backpressure="reject") as command_queue:
+        started = threading.Event()
+
+        def blocking_command():
+            started.set()
+            release.wait()
+
+        command_queue.submit(blocking_command)
+        started.wait()
+        command_queue.submit(lambda: None)
+        with pytest.raises(CommandQueueFullException):
+            command_queue.submit(lambda: None)
+        release.set()
+
+    assert command_queue.get_stats()["rejected"] == 1
+
+
+def test_command_queue_block_timeout():
+    release = threading.Event()
+    with CommandQueue(worker_count=1, max_size=1, block_timeout_seconds=0.01) as command_queue:
+        started = threading.Event()
+
+        def blocking_command():
+            started.set()
+            release.wait()
+
+        command_queue.submit(blocking_command)
+        started.wait()
+        command_queue.submit(lambda: None)
+        with pytest.raises(CommandQueueFullException):
+            command_queue.submit(lambda: None)
+        release.set()
+
+
+def test_command_queue_shutdown_drains_queue():
+    results: list[int] = []
+    command_queue = CommandQueue(worker_count=2)
+    command_queue.start()
+    for index in range(20):
+        command_queue.submit(results.append, index)
+    command_queue.shutdown()
+
+    assert sorted(results) == list(range(20))
+
+
+@pytest.mark.asyncio
+async def test_command_queue_submit_async():
+    def some_command(_: ConcreteCommandContext, value: int):
+        return value + 1
+
+    domain = DomainForTesting(some_command, ConcreteCommandContext)
+    with CommandQueue(worker_count=1) as command_queue:
+        assert await command_queue.submit_async(domain.some_command, 1) == 2  # pyright: ignore
+        assert await command_queue.submit_with_priority_async(1, domain.some_command, 2) == 3  # pyright: ignore
+
+
+def test_command_queue_submit_before_start():
+    command_queue = CommandQueue(worker_count=1)
+    with pytest.raises(RuntimeError):
+        command_queue.submit(lambda: None)
+
+
+def test_command_queue_submit_after_shutdown():
+    with CommandQueue(worker_count=1) as command_queue:
+        pass
+
+    with pytest.raises(RuntimeError):
+        command_queue.submit(lambda: None)
+    with pytest.raises(RuntimeError):
+        command_queue.start()
+
+
+@pytest.mark.asyncio
+async def test_command_queue_submit_async_before_start_and_after_shutdown():
+    command_queue = CommandQueue(worker_count=1)
+    with pytest.raises(RuntimeError):
+        await command_queue.submit_async(lambda: None)
+
+    command_queue.start()
+    command_queue.shutdown()
+    with pytest.raises(RuntimeError):
+        await command_queue.submit_async(lambda: None)
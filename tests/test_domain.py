@@ -1,15 +1,27 @@
+import logging
 import pytest
+import threading
+import time
 from pytest_mock import MockerFixture
-from typing import Any, Protocol
+from typing import Any, Optional, Protocol
 
 
 from python_utils.domain import (
+    AsyncCommandContext,
+    AsyncCommandContextCreator,
+    AsyncDomain,
     Domain,
     CommandCommitException,
     CommandContextCreator,
     CommandRollbackException,
     CommandContext,
+    CommandBatchAbortedException,
+    RetryPolicy,
+    is_transient_database_error,
 )
+from python_utils.idempotency import IdempotencyStore, InMemoryIdempotencyStore
+from python_utils.loggers import set_log_level
+from unittest.mock import AsyncMock
 
 
 class DomainCommandContext(CommandContext, Protocol):
@@ -110,3 +122,621 @@ def test__command_rollback_failed(mocker: MockerFixture):
 
     command_context.commit.assert_not_called()  # pyright: ignore
     command_context.rollback.assert_called_once()  # pyright: ignore
+
+
+class AsyncDomainCommandContext(AsyncCommandContext, Protocol):
+    pass
+
+
+class ConcreteAsyncCommandContext:
+    async def rollback(self) -> None:
+        pass
+
+    async def commit(self) -> None:
+        pass
+
+
+class AsyncDomainForTesting(AsyncDomain[ConcreteAsyncCommandContext]):
+    def __init__(
+        self,
+        command: Any,
+        command_context_creator: AsyncCommandContextCreator[ConcreteAsyncCommandContext],
+    ) -> None:
+        super().__init__(command_context_creator)
+
+        self.some_command = self._bind_command(command)
+
+
+@pytest.mark.asyncio
+async def test__async_command_commit(mocker: MockerFixture):
+    command_context = ConcreteAsyncCommandContext()
+    mocker.patch.object(command_context, "commit", new_callable=AsyncMock)
+    mocker.patch.object(command_context, "rollback", new_callable=AsyncMock)
+
+    async def some_command(_: ConcreteAsyncCommandContext, value: int):
+        return value
+
+    domain = AsyncDomainForTesting(some_command, lambda: command_context)
+    assert await domain.some_command(42) == 42  # pyright: ignore
+
+    command_context.commit.assert_awaited_once()  # pyright: ignore
+    command_context.rollback.assert_not_awaited()  # pyright: ignore
+
+
+@pytest.mark.asyncio
+async def test__async_command_rollback(mocker: MockerFixture):
+    command_context = ConcreteAsyncCommandContext()
+    mocker.patch.object(command_context, "commit", new_callable=AsyncMock)
+    mocker.patch.object(command_context, "rollback", new_callable=AsyncMock)
+
+    async def some_command(_: ConcreteAsyncCommandContext):
+        raise Exception("Some command exception")
+
+    domain = AsyncDomainForTesting(some_command, lambda: command_context)
+    with pytest.raises(Exception) as exception_info:
+        await domain.some_command()  # pyright: ignore
+
+    assert str(exception_info.value) == "Some command exception"
+
+    command_context.commit.assert_not_awaited()  # pyright: ignore
+    command_context.rollback.assert_awaited_once()  # pyright: ignore
+
+
+@pytest.mark.asyncio
+async def test__async_command_commit_failed(mocker: MockerFixture):
+    command_context = ConcreteAsyncCommandContext()
+    mocker.patch.object(
+        command_context, "commit", new_callable=AsyncMock, side_effect=Exception("Some commit exception")
+    )
+    mocker.patch.object(command_context, "rollback", new_callable=AsyncMock)
+
+    async def some_command(_: ConcreteAsyncCommandContext):
+        pass
+
+    domain = AsyncDomainForTesting(some_command, lambda: command_context)
+    with pytest.raises(CommandCommitException) as exception_info:
+        await domain.some_command()  # pyright: ignore
+
+    original_exception = exception_info.value.__cause__
+    assert str(original_exception) == "Some commit exception"
+
+    command_context.commit.assert_awaited_once()  # pyright: ignore
+    command_context.rollback.assert_awaited_once()  # pyright: ignore
+
+
+@pytest.mark.asyncio
+async def test__async_command_rollback_failed(mocker: MockerFixture):
+    command_context = ConcreteAsyncCommandContext()
+    mocker.patch.object(command_context, "commit", new_callable=AsyncMock)
+    mocker.patch.object(
+        command_context, "rollback", new_callable=AsyncMock, side_effect=Exception("Some rollback exception")
+    )
+
+    async def some_command(_: ConcreteAsyncCommandContext):
+        raise Exception("Some command exception")
+
+    domain = AsyncDomainForTesting(some_command, lambda: command_context)
+    with pytest.raises(CommandRollbackException) as exception_info:
+        await domain.some_command()  # pyright: ignore
+
+    original_exception = exception_info.value.__cause__
+    assert str(original_exception) == "Some rollback exception"
+    original_original_exception = (original_exception.__cause__)  # pyright: ignore
+    assert str(original_original_exception) == "Some command exception"
+
+    command_context.commit.assert_not_awaited()  # pyright: ignore
+    command_context.rollback.assert_awaited_once()  # pyright: ignore
+
+
+def test__command_metrics(mocker: MockerFixture):
+    command_context = ConcreteCommandContext()
+    commit_mock = mocker.patch.object(command_context, "commit")
+
+    def some_command(_: ConcreteCommandContext, fail: bool = False):
+        if fail:
+            raise Exception("Some command exception")
+
+    domain = DomainForTesting(some_command, lambda: command_context)
+    domain.some_command()  # pyright: ignore
+    domain.some_command()  # pyright: ignore
+    with pytest.raises(Exception):
+        domain.some_command(fail=True)  # pyright: ignore
+    commit_mock.side_effect = Exception("Some commit exception")
+    with pytest.raises(CommandCommitException):
+        domain.some_command()  # pyright: ignore
+
+    snapshot = domain.metrics.snapshot()["some_command"]
+    assert snapshot.success_count == 2
+    assert snapshot.rollback_count == 1
+    assert snapshot.commit_failure_count == 1
+    assert snapshot.latency.count == 4
+    assert snapshot.latency.quantile(0.99) >= 0
+
+
+@pytest.mark.asyncio
+async def test__async_command_metrics():
+    async def some_command(_: ConcreteAsyncCommandContext):
+        pass
+
+    domain = AsyncDomainForTesting(some_command, ConcreteAsyncCommandContext)
+    await domain.some_command()  # pyright: ignore
+
+    snapshot = domain.metrics.snapshot()["some_command"]
+    assert snapshot.success_count == 1
+    assert snapshot.latency.count == 1
+
+
+def test__command_debug_logs_skipped_when_disabled(mocker: MockerFixture):
+    log_command_call_mock = mocker.patch("python_utils.domain._log_command_call")
+    log_command_result_mock = mocker.patch("python_utils.domain._log_command_result")
+
+    def some_command(_: ConcreteCommandContext):
+        pass
+
+    domain = DomainForTesting(some_command, ConcreteCommandContext)
+    domain.some_command()  # pyright: ignore
+
+    log_command_call_mock.assert_not_called()
+    log_command_result_mock.assert_not_called()
+
+    set_log_level(logging.DEBUG, "python_utils.domain")
+    try:
+        domain.some_command()  # pyright: ignore
+    finally:
+        set_log_level(logging.INFO, "python_utils.domain")
+
+    log_command_call_mock.assert_called_once()
+    log_command_result_mock.assert_called_once()
+
+
+def test__batch_commit_once(mocker: MockerFixture):
+    command_context = ConcreteCommandContext()
+    mocker.patch.object(command_context, "commit")
+    mocker.patch.object(command_context, "rollback")
+    command_context_creator = mocker.Mock(return_value=command_context)
+
+    def some_command(_: ConcreteCommandContext, value: int):
+        return value
+
+    domain = DomainForTesting(some_command, command_context_creator)
+    with domain.batch() as command_batch:
+        results = [domain.some_command(index) for index in range(10)]  # pyright: ignore
+
+    assert results == list(range(10))
+    assert command_batch.committed_count == 10
+    command_context_creator.assert_called_once()
+    command_context.commit.assert_called_once()  # pyright: ignore
+    command_context.rollback.assert_not_called()  # pyright: ignore
+    assert domain.metrics.snapshot()["some_command"].success_count == 10
+
+
+def test__batch_commit_in_chunks(mocker: MockerFixture):
+    command_context = ConcreteCommandContext()
+    mocker.patch.object(command_context, "commit")
+
+    def some_command(_: ConcreteCommandContext):
+        pass
+
+    domain = DomainForTesting(some_command, lambda: command_context)
+    with domain.batch(chunk_size=4) as command_batch:
+        for _ in range(10):
+            domain.some_command()  # pyright: ignore
+
+    assert command_batch.committed_count == 10
+    assert command_context.commit.call_count == 3  # pyright: ignore
+
+
+def test__batch_all_or_nothing_rollback(mocker: MockerFixture):
+    command_context = ConcreteCommandContext()
+    mocker.patch.object(command_context, "commit")
+    mocker.patch.object(command_context, "rollback")
+
+    def some_command(_: ConcreteCommandContext, fail: bool = False):
+        if fail:
+            raise Exception("Some command exception")
+
+    domain = DomainForTesting(some_command, lambda: command_context)
+    with pytest.raises(Exception) as exception_info:
+        with domain.batch():
+            domain.some_command()  # pyright: ignore
+            domain.some_command(fail=True)  # pyright: ignore
+
+    assert str(exception_info.value) == "Some command exception"
+    command_context.commit.assert_not_called()  # pyright: ignore
+    command_context.rollback.assert_called_once()  # pyright: ignore
+
+    # Commands are not batched anymore once the batch is over
+    domain.some_command()  # pyright: ignore
+    command_context.commit.assert_called_once()  # pyright: ignore
+
+
+def test__batch_all_or_nothing_aborted(mocker: MockerFixture):
+    command_context = ConcreteCommandContext()
+    mocker.patch.object(command_context, "commit")
+
+    def some_command(_: ConcreteCommandContext, fail: bool = False):
+        if fail:
+            raise Exception("Some command exception")
+
+    domain = DomainForTesting(some_command, lambda: command_context)
+    with pytest.raises(CommandBatchAbortedException):
+        with domain.batch():
+            with pytest.raises(Exception):
+                domain.some_command(fail=True)  # pyright: ignore
+            domain.some_command()  # pyright: ignore
+
+    command_context.commit.assert_not_called()  # pyright: ignore
+
+
+def test__batch_per_chunk_rollback(mocker: MockerFixture):
+    command_context = ConcreteCommandContext()
+    mocker.patch.object(command_context, "commit")
+    mocker.patch.object(command_context, "rollback")
+
+    def some_command(_: ConcreteCommandContext, fail: bool = False):
+        if fail:
+            raise Exception("Some command exception")
+
+    domain = DomainForTesting(some_command, lambda: command_context)
+    with domain.batch(chunk_size=2) as command_batch:
+        domain.some_command()  # pyright: ignore
+        domain.some_command()  # pyright: ignore
+        domain.some_command()  # pyright: ignore
+        with pytest.raises(Exception):
+            domain.some_command(fail=True)  # pyright: ignore
+        domain.some_command()  # pyright: ignore
+
+    assert command_batch.committed_count == 3
+    assert command_context.commit.call_count == 2  # pyright: ignore
+    command_context.rollback.assert_called_once()  # pyright: ignore
+
+
+def test__batch_commit_failed(mocker: MockerFixture):
+    command_context = ConcreteCommandContext()
+    mocker.patch.object(command_context, "commit", side_effect=Exception("Some commit exception"))
+    mocker.patch.object(command_context, "rollback")
+
+    def some_command(_: ConcreteCommandContext):
+        pass
+
+    domain = DomainForTesting(some_command, lambda: command_context)
+    with pytest.raises(CommandCommitException) as exception_info:
+        with domain.batch():
+            domain.some_command()  # pyright: ignore
+
+    assert str(exception_info.value.__cause__) == "Some commit exception"
+    command_context.rollback.assert_called_once()  # pyright: ignore
+
+
+def test__batch_chunk_commit_failed(mocker: MockerFixture):
+    command_context = ConcreteCommandContext()
+    mocker.patch.object(command_context, "commit", side_effect=Exception("Some commit exception"))
+    mocker.patch.object(command_context, "rollback", side_effect=Exception("Some rollback exception"))
+
+    def some_command(_: ConcreteCommandContext):
+        pass
+
+    domain = DomainForTesting(some_command, lambda: command_context)
+    with pytest.raises(CommandRollbackException):
+        with domain.batch(chunk_size=1):
+            domain.some_command()  # pyright: ignore
+
+    assert domain.metrics.snapshot()["some_command"].commit_failure_count == 1
+
+
+class TransientDatabaseError(Exception):
+    pgcode = "40001"
+
+
+class RetryingDomainForTesting(Domain[ConcreteCommandContext]):
+    def __init__(
+        self,
+        command: Any,
+        command_context_creator: CommandContextCreator[ConcreteCommandContext],
+        retry_policy: RetryPolicy,
+        command_retry_policy: Any = None,
+    ) -> None:
+        super().__init__(command_context_creator, retry_policy)
+
+        self.some_command = self._bind_command(command, command_retry_policy)
+
+
+def test__is_transient_database_error():
+    class WrappedError(Exception):
+        orig = TransientDatabaseError()
+
+    commit_exception = CommandCommitException()
+    commit_exception.__cause__ = WrappedError()
+
+    assert is_transient_database_error(TransientDatabaseError())
+    assert is_transient_database_error(commit_exception)
+    assert not is_transient_database_error(Exception())
+
+
+def test__retry_policy_delay():
+    retry_policy = RetryPolicy(base_delay_seconds=0.1, max_delay_seconds=0.3)
+    assert all(0 <= retry_policy.get_delay(1) <= 0.1 for _ in range(100))
+    assert all(0 <= retry_policy.get_delay(10) <= 0.3 for _ in range(100))
+
+
+def test__command_retried_with_new_context(mocker: MockerFixture):
+    command_contexts: list[ConcreteCommandContext] = []
+
+    def create_command_context() -> ConcreteCommandContext:
+        command_contexts.append(ConcreteCommandContext())
+        return command_contexts[-1]
+
+    calls: list[ConcreteCommandContext] = []
+
+    def some_command(command_context: ConcreteCommandContext):
+        calls.append(command_context)
+        if len(calls) < 3:
+            raise TransientDatabaseError()
+        return "result"
+
+    sleep = mocker.Mock()
+    domain = RetryingDomainForTesting(some_command, create_command_context, RetryPolicy(max_attempts=3, sleep=sleep))
+
+    assert domain.some_command() == "result"  # pyright: ignore
+    assert calls == command_contexts
+    assert len(command_contexts) == 3
+    assert sleep.call_count == 2
+    snapshot = domain.metrics.snapshot()["some_command"]
+    assert snapshot.retry_count == 2
+    assert snapshot.rollback_count == 2
+    assert snapshot.success_count == 1
+
+
+def test__command_retry_exhausted(mocker: MockerFixture):
+    def some_command(_: ConcreteCommandContext):
+        raise TransientDatabaseError()
+
+    domain = RetryingDomainForTesting(
+        some_command, ConcreteCommandContext, RetryPolicy(max_attempts=2, sleep=mocker.Mock())
+    )
+    with pytest.raises(TransientDatabaseError):
+        domain.some_command()  # pyright: ignore
+
+    assert domain.metrics.snapshot()["some_command"].retry_count == 1
+
+
+def test__command_not_retried_on_other_errors(mocker: MockerFixture):
+    some_command = mocker.Mock(side_effect=Exception("Some command exception"), __name__="some_command")
+
+    domain = RetryingDomainForTesting(some_command, ConcreteCommandContext, RetryPolicy(sleep=mocker.Mock()))
+    with pytest.raises(Exception):
+        domain.some_command()  # pyright: ignore
+
+    some_command.assert_called_once()
+
+
+def test__command_retry_policy_override(mocker: MockerFixture):
+    some_command = mocker.Mock(side_effect=TransientDatabaseError(), __name__="some_command")
+
+    domain = RetryingDomainForTesting(
+        some_command, ConcreteCommandContext, RetryPolicy(sleep=mocker.Mock()), RetryPolicy(max_attempts=1)
+    )
+    with pytest.raises(TransientDatabaseError):
+        domain.some_command()  # pyright: ignore
+
+    some_command.assert_called_once()
+
+
+def test__command_commit_failure_retried(mocker: MockerFixture):
+    command_context = ConcreteCommandContext()
+    mocker.patch.object(command_context, "commit", side_effect=[TransientDatabaseError(), None])
+    mocker.patch.object(command_context, "rollback")
+
+    def some_command(_: ConcreteCommandContext):
+        pass
+
+    domain = RetryingDomainForTesting(some_command, lambda: command_context, RetryPolicy(sleep=mocker.Mock()))
+    domain.some_command()  # pyright: ignore
+
+    assert command_context.commit.call_count == 2  # pyright: ignore
+    assert domain.metrics.snapshot()["some_command"].commit_failure_count == 1
+
+
+class QueryingDomainForTesting(Domain[ConcreteCommandContext]):
+    def __init__(
+        self,
+        query: Any,
+        command_context_creator: CommandContextCreator[ConcreteCommandContext],
+        query_context_creator: CommandContextCreator[ConcreteCommandContext],
+    ) -> None:
+        super().__init__(command_context_creator, query_context_creator=query_context_creator)
+
+        self.some_query = self._bind_query(query)
+        self.some_command = self._bind_command(query)
+
+
+def test__query_skips_commit(mocker: MockerFixture):
+    command_context_creator = mocker.Mock()
+    query_context = ConcreteCommandContext()
+    mocker.patch.object(query_context, "commit")
+    mocker.patch.object(query_context, "rollback")
+
+    def some_query(_: ConcreteCommandContext, value: int):
+        return value
+
+    domain = QueryingDomainForTesting(some_query, command_context_creator, lambda: query_context)
+    assert domain.some_query(42) == 42  # pyright: ignore
+
+    command_context_creator.assert_not_called()
+    query_context.commit.assert_not_called()  # pyright: ignore
+    query_context.rollback.assert_called_once()  # pyright: ignore
+    assert domain.metrics.snapshot()["some_query"].success_count == 1
+
+
+def test__query_failed(mocker: MockerFixture):
+    query_context = ConcreteCommandContext()
+    mocker.patch.object(query_context, "commit")
+    mocker.patch.object(query_context, "rollback")
+
+    def some_query(_: ConcreteCommandContext):
+        raise Exception("Some query exception")
+
+    domain = QueryingDomainForTesting(some_query, ConcreteCommandContext, lambda: query_context)
+    with pytest.raises(Exception) as exception_info:
+        domain.some_query()  # pyright: ignore
+
+    assert str(exception_info.value) == "Some query exception"
+    query_context.commit.assert_not_called()  # pyright: ignore
+    query_context.rollback.assert_called_once()  # pyright: ignore
+
+
+def test__query_final_rollback_failed(mocker: MockerFixture):
+    query_context = ConcreteCommandContext()
+    mocker.patch.object(query_context, "rollback", side_effect=Exception("Some rollback exception"))
+
+    def some_query(_: ConcreteCommandContext):
+        return "result"
+
+    domain = QueryingDomainForTesting(some_query, ConcreteCommandContext, lambda: query_context)
+    assert domain.some_query() == "result"  # pyright: ignore
+
+
+def test__query_in_batch_uses_batch_context(mocker: MockerFixture):
+    command_context = ConcreteCommandContext()
+    mocker.patch.object(command_context, "commit")
+    query_context_creator = mocker.Mock()
+    contexts: list[ConcreteCommandContext] = []
+
+    def some_query(command_context: ConcreteCommandContext):
+        contexts.append(command_context)
+
+    domain = QueryingDomainForTesting(some_query, lambda: command_context, query_context_creator)
+    with domain.batch():
+        domain.some_command()  # pyright: ignore
+        domain.some_query()  # pyright: ignore
+
+    assert contexts == [command_context, command_context]
+    query_context_creator.assert_not_called()
+    command_context.commit.assert_called_once()  # pyright: ignore
+
+
+class IdempotentDomainForTesting(Domain[ConcreteCommandContext]):
+    def __init__(
+        self,
+        command: Any,
+        command_context_creator: CommandContextCreator[ConcreteCommandContext],
+        idempotency_store: Optional[IdempotencyStore] = None,
+    ) -> None:
+        super().__init__(command_context_creator, idempotency_store=idempotency_store or InMemoryIdempotencyStore())
+
+        self.some_command = self._bind_command(command, idempotent=True)
+
+
+def test__idempotent_command(mocker: MockerFixture):
+    command_context_creator = mocker.Mock(return_value=ConcreteCommandContext())
+    calls: list[int] = []
+
+    def some_command(_: ConcreteCommandContext, value: int):
+        calls.append(value)
+        return len(calls)
+
+    domain = IdempotentDomainForTesting(some_command, command_context_creator)
+    with domain.idempotency_key("key_1"):
+        assert domain.some_command(1) == 1  # pyright: ignore
+        assert domain.some_command(1) == 1  # pyright: ignore
+    with domain.idempotency_key("key_2"):
+        assert domain.some_command(2) == 2  # pyright: ignore
+    assert domain.some_command(3) == 3  # pyright: ignore
+    assert domain.some_command(3) == 4  # pyright: ignore
+
+    assert calls == [1, 2, 3, 3]
+    assert command_context_creator.call_count == 4
+    assert domain.metrics.snapshot()["some_command"].idempotency_hit_count == 1
+
+
+def test__idempotent_command_failure_not_stored():
+    calls: list[bool] = []
+
+    def some_command(_: ConcreteCommandContext, fail: bool):
+        calls.append(fail)
+        if fail:
+            raise Exception("Some command exception")
+        return "result"
+
+    domain = IdempotentDomainForTesting(some_command, ConcreteCommandContext)
+    with domain.idempotency_key("key"):
+        with pytest.raises(Exception):
+            domain.some_command(True)  # pyright: ignore
+        assert domain.some_command(False) == "result"  # pyright: ignore
+
+    assert calls == [True, False]
+
+
+def test__idempotent_command_concurrent_duplicates_wait():
+    started = threading.Event()
+    calls: list[str] = []
+
+    def some_command(_: ConcreteCommandContext):
+        calls.append("call")
+        started.set()
+        time.sleep(0.05)
+        return "result"
+
+    domain = IdempotentDomainForTesting(some_command, ConcreteCommandContext)
+    results: list[str] = []
+
+    def call_command():
+        with domain.idempotency_key("key"):
+            results.append(domain.some_command())  # pyright: ignore
+
+    first_thread = threading.Thread(target=call_command)
+    first_thread.start()
+    started.wait()
+    duplicate_threads = [threading.Thread(target=call_command) for _ in range(3)]
+    for thread in duplicate_threads:
+        thread.start()
+    for thread in [first_thread, *duplicate_threads]:
+        thread.join()
+
+    assert calls == ["call"]
+    assert results == ["result"] * 4
+
+
+def test__idempotent_command_store_failure():
+    class FailingIdempotencyStore(InMemoryIdempotencyStore):
+        def set(self, key: str, result: Any) -> None:
+            raise TypeError("Object of type object is not JSON serializable")
+
+    started = threading.Event()
+    calls: list[str] = []
+    command_result = object()
+
+    def some_command(_: ConcreteCommandContext):
+        calls.append("call")
+        started.set()
+        time.sleep(0.05)
+        return command_result
+
+    domain = IdempotentDomainForTesting(some_command, ConcreteCommandContext, FailingIdempotencyStore())
+    results: list[object] = []
+
+    def call_command():
+        with domain.idempotency_key("key"):
+            results.append(domain.some_command())  # pyright: ignore
+
+    first_thread = threading.Thread(target=call_command)
+    first_thread.start()
+    started.wait()
+    duplicate_thread = threading.Thread(target=call_command)
+    duplicate_thread.start()
+    for thread in [first_thread, duplicate_thread]:
+        thread.join()
+
+    assert calls == ["call"]
+    assert results == [command_result] * 2
+
+
+def test__idempotent_command_requires_store():
+    class DomainWithoutStore(Domain[ConcreteCommandContext]):
+        def __init__(self) -> None:
+            super().__init__(ConcreteCommandContext)
+
+            self.some_command = self._bind_command(lambda _: None, idempotent=True)  # pyright: ignore
+
+    with pytest.raises(ValueError):
+        DomainWithoutStore()
@@ -4,6 +4,7 @@ from fastapi.testclient import TestClient
 from typing import Generator
 
 from python_utils import fastapi_generic_routes
+from python_utils.metrics import MetricsRegistry
 
 
 @pytest.fixture
@@ -39,3 +40,16 @@ def test_health_endpoint(test_client: TestClient):
 def test_force_exception_endpoint(test_client: TestClient):
     with pytest.raises(Exception):
         test_client.get("/force_exception")
+
+
+def test_metrics_endpoint():
+    app = FastAPI()
+    metrics_registry = MetricsRegistry()
+    metrics_registry.counter("some_total", "Some counter").labels().increment()
+    fastapi_generic_routes.load_metrics_route(app, metrics_registry)
+
+    with TestClient(app) as test_client:
+        response = test_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.text == "# HELP some_total Some counter\n# TYPE some_total counter\nsome_total 1\n"
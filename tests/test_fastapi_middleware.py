@@ -1,13 +1,18 @@
+import asyncio
+import logging
 import pytest
 from pytest import LogCaptureFixture
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.testclient import TestClient
-from typing import Generator
+from fastapi.responses import StreamingResponse
+from typing import Any, Generator
 
 from python_utils import (
     fastapi_middleware,
     fastapi_generic_routes,
 )
+from python_utils.loggers import disable_request_log_buffering, enable_request_log_buffering, get_logger
+from python_utils.metrics import MetricsRegistry
 
 
 @pytest.fixture
@@ -89,3 +94,251 @@ def test_log_url_pattern__with_root_path(
             break
     assert error_log_record is not None
     assert error_log_record.request_path_pattern == "/ressource/{ressource_id}"  # pyright: ignore
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__(logging.INFO)
+        self.messages: list[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(record.getMessage())
+
+
+def test_request_log_buffering():
+    handler = RecordingHandler()
+    route_logger = get_logger("test_request_log_buffering", sinks=(handler,))
+
+    fastapi_app = FastAPI()
+    fastapi_middleware.add_middleware(fastapi_app)
+
+    @fastapi_app.get("/ressource/{ressource_id}")
+    async def some_route(ressource_id: str, fail: bool = False):  # pyright: ignore[reportUnusedFunction]
+        route_logger.debug("Debug %s", ressource_id)
+        if fail:
+            raise Exception("Some route exception")
+        return {"ressource_id": ressource_id}
+
+    enable_request_log_buffering(latency_threshold_seconds=60)
+    try:
+        with TestClient(fastapi_app) as test_client:
+            test_client.get("/ressource/ok")
+            test_client.get("/ressource/failed", params={"fail": True})
+        route_logger.debug("Debug outside of a request")
+    finally:
+        disable_request_log_buffering()
+
+    assert handler.messages == ["Debug failed"]
+    assert not route_logger.isEnabledFor(logging.DEBUG)
+
+
+def test_request_log_buffering_slow_request():
+    handler = RecordingHandler()
+    route_logger = get_logger("test_request_log_buffering_slow_request", sinks=(handler,))
+
+    fastapi_app = FastAPI()
+    fastapi_middleware.add_middleware(fastapi_app)
+
+    @fastapi_app.get("/slow")
+    async def slow_route():  # pyright: ignore[reportUnusedFunction]
+        route_logger.debug("Debug slow")
+        route_logger.info("Info slow")
+        return {}
+
+    enable_request_log_buffering(latency_threshold_seconds=0)
+    try:
+        with TestClient(fastapi_app) as test_client:
+            test_client.get("/slow")
+    finally:
+        disable_request_log_buffering()
+
+    assert handler.messages == ["Info slow", "Debug slow"]
+
+
+def test_get_request_route_pattern():
+    fastapi_app = FastAPI()
+
+    @fastapi_app.get("/ressource/{ressource_id}")
+    async def some_route(ressource_id: str):  # pyright: ignore[reportUnusedFunction]
+        return {}
+
+    @fastapi_app.get("/ressource/{ressource_id}/other")
+    async def other_route(ressource_id: str):  # pyright: ignore[reportUnusedFunction]
+        return {}
+
+    @fastapi_app.get("/files/{file_path:path}")
+    async def file_route(file_path: str):  # pyright: ignore[reportUnusedFunction]
+        return {}
+
+    def get_pattern(path: str, has_root_path: bool = False):
+        request = Request({"type": "http", "path": path, "query_string": b"", "headers": []})
+        return fastapi_middleware.get_request_route_pattern(fastapi_app, request, has_root_path=has_root_path)
+
+    assert get_pattern("/ressource/1234") == "/ressource/{ressource_id}"
+    assert get_pattern("/ressource/1234/other") == "/ressource/{ressource_id}/other"
+    assert get_pattern("/files/some/file.txt") == "/files/{file_path:path}"
+    assert get_pattern("/v1/ressource/1234", has_root_path=True) == "/ressource/{ressource_id}"
+    assert get_pattern("/ressource/1234", has_root_path=True) is None
+    assert get_pattern("/unknown") is None
+
+    @fastapi_app.get("/unknown")
+    async def added_route():  # pyright: ignore[reportUnusedFunction]
+        return {}
+
+    assert get_pattern("/unknown") == "/unknown"
+
+
+def test_should_log_path():
+    assert fastapi_middleware.should_log_path("/ressource/1234")
+    assert not fastapi_middleware.should_log_path("/v1/healthz")
+
+    matcher = fastapi_middleware.PathMatcher(prefixes=["/internal/"], suffixes=["/healthz", "/metrics"])
+    assert matcher.match("/internal/debug")
+    assert matcher.match("/v1/metrics")
+    assert not matcher.match("/ressource/1234")
+
+
+def get_request_processed_record(caplog: LogCaptureFixture) -> Any:
+    for record in caplog.records:
+        if record.message == "Request processed":
+            return record
+    return None
+
+
+def test_log_response_body(caplog: LogCaptureFixture):
+    fastapi_app = FastAPI()
+    fastapi_middleware.add_middleware(fastapi_app, max_logged_body_bytes=100)
+
+    @fastapi_app.get("/chunked")
+    async def chunked_route():  # pyright: ignore[reportUnusedFunction]
+        async def get_chunks():
+            yield b'{"values": '
+            yield b"[1, 2, 3]}"
+
+        return StreamingResponse(get_chunks(), media_type="application/json")
+
+    @fastapi_app.get("/large")
+    async def large_route():  # pyright: ignore[reportUnusedFunction]
+        return {"value": "x" * 1000}
+
+    with TestClient(fastapi_app) as test_client, caplog.at_level("INFO"):
+        chunked_response = test_client.get("/chunked")
+        chunked_record = get_request_processed_record(caplog)
+        caplog.clear()
+        large_response = test_client.get("/large")
+        large_record = get_request_processed_record(caplog)
+
+    assert chunked_response.json() == {"values": [1, 2, 3]}
+    assert chunked_record.response_body == {"values": [1, 2, 3]}
+    assert large_response.json() == {"value": "x" * 1000}
+    assert large_record.response_body == "<response body too large - not logged>"
+
+
+def test_middleware_is_pure_asgi():
+    fastapi_app = FastAPI()
+    fastapi_middleware.add_middleware(fastapi_app)
+
+    @fastapi_app.get("/text")
+    async def text_route():  # pyright: ignore[reportUnusedFunction]
+        async def get_chunks():
+            yield "first "
+            yield "second"
+
+        return StreamingResponse(get_chunks(), media_type="text/plain")
+
+    with TestClient(fastapi_app) as test_client:
+        response = test_client.get("/text")
+
+    assert [middleware.cls for middleware in fastapi_app.user_middleware] == [
+        fastapi_middleware.RequestLoggingMiddleware
+    ]
+    assert response.text == "first second"
+    assert float(response.headers["X-Process-Time"]) >= 0.0
+
+
+def test_request_metrics():
+    metrics_registry = MetricsRegistry()
+    fastapi_app = FastAPI()
+    fastapi_middleware.add_middleware(fastapi_app, metrics_registry=metrics_registry)
+    fastapi_generic_routes.load_routes(fastapi_app, "test_app", "1.2.3")
+    fastapi_generic_routes.load_metrics_route(fastapi_app, metrics_registry)
+
+    @fastapi_app.get("/ressource/{ressource_id}")
+    async def some_route(ressource_id: str):  # pyright: ignore[reportUnusedFunction]
+        return {"ressource_id": ressource_id}
+
+    with TestClient(fastapi_app) as test_client:
+        for ressource_id in ["1", "2"]:
+            test_client.get(f"/ressource/{ressource_id}")
+        test_client.get("/force_exception")
+        test_client.get("/unknown")
+        for method in ["FOO1", "FOO2"]:
+            test_client.request(method, "/ressource/1")
+        metrics_response = test_client.get("/metrics")
+
+    request_count = metrics_registry.counter("http_requests_total", "", ("method", "route", "status"))
+    assert request_count.labels("GET", "/ressource/{ressource_id}", "200").value == 2
+    assert request_count.labels("GET", "/force_exception", "500").value == 1
+    assert request_count.labels("GET", fastapi_middleware.UNMATCHED_ROUTE, "404").value == 1
+    assert request_count.labels(fastapi_middleware.OTHER_METHOD, "/ressource/{ressource_id}", "405").value == 2
+
+    response_size = metrics_registry.histogram("http_response_size_bytes", "", ("method", "route"))
+    assert response_size.labels("GET", "/ressource/{ressource_id}").snapshot().sum == 2 * len('{"ressource_id":"1"}')
+
+    requests_in_flight = metrics_registry.gauge("http_requests_in_flight", "", ("method", "route"))
+    assert requests_in_flight.labels("GET", "/ressource/{ressource_id}").value == 0
+
+    assert metrics_response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'http_requests_total{method="GET",route="/ressource/{ressource_id}",status="200"} 2' in (
+        metrics_response.text
+    )
+
+
+def get_logged_paths(caplog: LogCaptureFixture) -> list[str]:
+    return [record.request_path for record in caplog.records if record.message == "Request processed"]  # pyright: ignore
+
+
+def create_app_with_log_mode(**kwargs: Any) -> FastAPI:
+    fastapi_app = FastAPI()
+    fastapi_middleware.add_middleware(fastapi_app, **kwargs)
+    fastapi_generic_routes.load_routes(fastapi_app, "test_app", "1.2.3")
+
+    @fastapi_app.get("/slow")
+    async def slow_route():  # pyright: ignore[reportUnusedFunction]
+        await asyncio.sleep(0.05)
+        return {"slow": True}
+
+    return fastapi_app
+
+
+def test_log_mode_errors(caplog: LogCaptureFixture):
+    with TestClient(create_app_with_log_mode(log_mode="errors")) as test_client, caplog.at_level("INFO"):
+        test_client.get("/")
+        test_client.get("/unknown")
+        test_client.get("/force_exception")
+
+    messages = [record.message for record in caplog.records if record.name == fastapi_middleware.__name__]
+    assert get_logged_paths(caplog) == ["/unknown"]
+    assert messages == ["Request received", "Request processed", "Request received", "Request failed"]
+
+
+def test_log_mode_slow(caplog: LogCaptureFixture):
+    fastapi_app = create_app_with_log_mode(log_mode="slow", slow_request_threshold_seconds=0.04)
+    with TestClient(fastapi_app) as test_client, caplog.at_level("INFO"):
+        test_client.get("/")
+        test_client.get("/slow")
+
+    assert get_logged_paths(caplog) == ["/slow"]
+    assert get_request_processed_record(caplog).response_body == {"slow": True}
+
+
+def test_log_mode_sampled(caplog: LogCaptureFixture):
+    with TestClient(create_app_with_log_mode(log_mode="sampled", log_sample_ratio=0)) as test_client:
+        with caplog.at_level("INFO"):
+            test_client.get("/")
+        assert get_logged_paths(caplog) == []
+
+    with TestClient(create_app_with_log_mode(log_mode="sampled", log_sample_ratio=1)) as test_client:
+        with caplog.at_level("INFO"):
+            test_client.get("/")
+        assert get_logged_paths(caplog) == ["/"]
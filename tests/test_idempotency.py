@@ -0,0 +1,102 @@
+import pytest
+from pytest_mock import MockerFixture
+
+from python_utils.idempotency import InMemoryIdempotencyStore, SqlAlchemyPostgresqlIdempotencyStore
+from python_utils.sqlalchemy_postgresql_engine_wrapper import SqlAlchemyPostgresqlEngineWrapper
+from python_utils.testing.database import database_container
+from python_utils.testing.docker import docker_compose_dir
+
+
+def test_in_memory_idempotency_store():
+    store = InMemoryIdempotencyStore()
+    store.set("key_1", {"id": 1})
+    store.set("key_2", None)
+
+    assert store.get("key_1") == (True, {"id": 1})
+    assert store.get("key_2") == (True, None)
+    assert store.get("key_3") == (False, None)
+
+
+def test_in_memory_idempotency_store_eviction():
+    store = InMemoryIdempotencyStore(max_size=2)
+    store.set("key_1", 1)
+    store.set("key_2", 2)
+    store.get("key_1")
+    store.set("key_3", 3)
+
+    assert len(store) == 2
+    assert store.get("key_1") == (True, 1)
+    assert store.get("key_2") == (False, None)
+
+
+def test_in_memory_idempotency_store_ttl(mocker: MockerFixture):
+    store = InMemoryIdempotencyStore(ttl_seconds=10)
+    mocker.patch("python_utils.idempotency.time.time", return_value=1000.0)
+    store.set("key", "result")
+
+    mocker.patch("python_utils.idempotency.time.time", return_value=1009.0)
+    assert store.get("key") == (True, "result")
+    mocker.patch("python_utils.idempotency.time.time", return_value=1010.0)
+    assert store.get("key") == (False, None)
+
+
+def test_in_memory_idempotency_store_backing_store():
+    backing_store = InMemoryIdempotencyStore()
+    store = InMemoryIdempotencyStore(backing_store=backing_store)
+    other_store = InMemoryIdempotencyStore(backing_store=backing_store)
+
+    store.set("key", "result")
+
+    assert backing_store.get("key") == (True, "result")
+    assert other_store.get("key") == (True, "result")
+    assert len(other_store) == 1
+
+
+DOCKER_COMPOSE_FILE = """
+services:
+  postgresql:
+    image: bitnami/postgresql:14
+    ports:
+      - 55434:5432
+    environment:
+      - POSTGRESQL_USERNAME=user
+      - POSTGRESQL_PASSWORD=password
+      - POSTGRESQL_DATABASE=test_db
+"""
+
+
+@pytest.fixture(scope="module")
+def setup_db():
+    with docker_compose_dir(DOCKER_COMPOSE_FILE) as dir_path:
+        with database_container(
+            dir_path, "postgresql", "test_db", "user", "password", "localhost", 55434
+        ):
+            yield
+
+
+def test_postgresql_idempotency_store(setup_db: None):
+    engine_wrapper = SqlAlchemyPostgresqlEngineWrapper(
+        sql_user="user",
+        sql_password="password",
+        sql_host="localhost",
+        sql_port=55434,
+        sql_database="test_db",
+        pool_size=5,
+    )
+    store = SqlAlchemyPostgresqlIdempotencyStore(engine_wrapper)
+    store.create_table()
+
+    store.set("key_1", {"id": 1})
+    store.set("key_1", {"id": 2})
+    expired_store = SqlAlchemyPostgresqlIdempotencyStore(engine_wrapper, ttl_seconds=-1)
+    expired_store.set("key_2", {"id": 3})
+
+    assert store.get("key_1") == (True, {"id": 1})
+    assert store.get("key_2") == (False, None)
+
+    # Expired results are replaced, even before they are purged
+    store.set("key_2", {"id": 4})
+    assert store.get("key_2") == (True, {"id": 4})
+
+    store.purge_expired()
+    assert store.get("key_1") == (True, {"id": 1})
@@ -0,0 +1,205 @@
+import gzip
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+from pytest_mock import MockerFixture
+
+from python_utils.log_sinks import BatchedSocketHandler, BufferedFileHandler
+from python_utils.loggers import CustomJsonFormatter, add_log_sink, get_logger, remove_log_sink, set_log_level
+
+
+def get_log_record(message: str) -> logging.LogRecord:
+    return logging.LogRecord("test", logging.INFO, __file__, 0, message, None, None)
+
+
+def test_buffered_file_handler_flushes_on_size(tmp_path: Path):
+    path = tmp_path / "app.log"
+    handler = BufferedFileHandler(str(path), buffer_size_bytes=1024, flush_interval_seconds=3600)
+    handler.setFormatter(CustomJsonFormatter(fast=True))
+
+    handler.handle(get_log_record("first"))
+    assert path.read_text() == ""
+
+    for index in range(20):
+        handler.handle(get_log_record(f"message {index}"))
+    assert path.read_text() != ""
+
+    handler.close()
+    messages = [json.loads(line)["message"] for line in path.read_text().splitlines()]
+    assert messages == ["first", *[f"message {index}" for index in range(20)]]
+
+
+def test_buffered_file_handler_flushes_on_interval(tmp_path: Path):
+    path = tmp_path / "app.log"
+    handler = BufferedFileHandler(str(path), flush_interval_seconds=0.01)
+    flushed = threading.Event()
+    original_write = handler._write  # pyright: ignore[reportPrivateUsage]
+
+    def write(chunks: list[bytes]) -> None:
+        original_write(chunks)
+        flushed.set()
+
+    handler._write = write  # pyright: ignore[reportPrivateUsage]
+    handler.handle(get_log_record("message"))
+
+    assert flushed.wait(5)
+    assert path.read_text() == "message\n"
+    handler.close()
+
+
+def test_buffered_file_handler_rotation(tmp_path: Path):
+    path = tmp_path / "app.log"
+    handler = BufferedFileHandler(
+        str(path), max_bytes=100, backup_count=2, compress_rotated=True, buffer_size_bytes=1
+    )
+
+    for index in range(10):
+        handler.handle(get_log_record(f"{index}" * 40))
+    handler.close()
+
+    assert sorted(os.listdir(tmp_path)) == ["app.log", "app.log.1.gz", "app.log.2.gz"]
+    # Each record is 41 bytes long, so that files hold 2 records
+    assert path.read_text() == "8" * 40 + "\n" + "9" * 40 + "\n"
+    with gzip.open(tmp_path / "app.log.1.gz", "rt") as rotated_file:
+        assert rotated_file.read() == "6" * 40 + "\n" + "7" * 40 + "\n"
+
+
+def test_buffered_file_handler_write_errors(tmp_path: Path, mocker: MockerFixture):
+    handler = BufferedFileHandler(str(tmp_path / "app.log"), buffer_size_bytes=1, flush_interval_seconds=0.01)
+    write = mocker.patch.object(handler, "_write", side_effect=OSError("No space left on device"))
+    handle_error = mocker.patch.object(handler, "handleError")
+
+    handler.handle(get_log_record("first"))
+    handler.buffer_size_bytes = 1024
+    # The flusher thread keeps running after a failed write
+    for message in ["second", "third"]:
+        dropped_count = handler.dropped_count
+        handler.handle(get_log_record(message))
+        for _ in range(500):
+            if handler.dropped_count > dropped_count:
+                break
+            time.sleep(0.01)
+    handler.close()
+
+    handle_error.assert_called_once()
+    assert write.call_count == 3
+    assert handler.dropped_count == 3
+
+
+def test_batched_socket_handler_udp():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    server.settimeout(5)
+
+    handler = BatchedSocketHandler(server.getsockname(), "udp", flush_interval_seconds=3600)
+    for index in range(10):
+        handler.handle(get_log_record(f"message {index}"))
+    handler.close()
+
+    datagram = server.recv(65_535)
+    server.close()
+    assert datagram.decode().splitlines() == [f"message {index}" for index in range(10)]
+    assert handler.sent_count == 10
+
+
+def test_batched_socket_handler_udp_drops_oversized_records():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    server.settimeout(5)
+
+    handler = BatchedSocketHandler(server.getsockname(), "udp", max_datagram_bytes=100, flush_interval_seconds=3600)
+    for message in ["first" * 10, "x" * 200, "second" * 10]:
+        handler.handle(get_log_record(message))
+    handler.close()
+
+    datagrams = [server.recv(65_535) for _ in range(2)]
+    server.close()
+    assert [datagram.decode() for datagram in datagrams] == ["first" * 10 + "\n", "second" * 10 + "\n"]
+    assert handler.sent_count == 2
+    assert handler.dropped_count == 1
+
+
+def test_batched_socket_handler_tcp():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    server.settimeout(5)
+
+    handler = BatchedSocketHandler(server.getsockname(), "tcp", flush_interval_seconds=3600)
+    for index in range(10):
+        handler.handle(get_log_record(f"message {index}"))
+    handler.close()
+
+    connection, _ = server.accept()
+    data = b""
+    while chunk := connection.recv(65_535):
+        data += chunk
+    connection.close()
+    server.close()
+    assert data.decode().splitlines() == [f"message {index}" for index in range(10)]
+
+
+def test_batched_socket_handler_tcp_timeout():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+
+    # The collector never reads, so that sends block once the socket buffers are full
+    handler = BatchedSocketHandler(
+        server.getsockname(), "tcp", timeout_seconds=0.1, buffer_size_bytes=1, flush_interval_seconds=3600
+    )
+    handler.handle(get_log_record("x" * 64 * 1024 * 1024))
+    handler.close()
+    server.close()
+
+    assert handler.dropped_count == 1
+    assert handler.sent_count == 0
+
+
+def test_batched_socket_handler_drops_when_unreachable():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    address = server.getsockname()
+    server.close()
+
+    handler = BatchedSocketHandler(address, "tcp", flush_interval_seconds=3600)
+    handler.handle(get_log_record("message"))
+    handler.close()
+
+    assert handler.dropped_count == 1
+
+
+def test_add_log_sink(tmp_path: Path):
+    logger = get_logger("test_add_log_sink")
+    path = tmp_path / "app.log"
+    handler = BufferedFileHandler(str(path))
+
+    add_log_sink(handler)
+    try:
+        logger.info("message")
+    finally:
+        remove_log_sink(handler)
+    logger.info("not in the sink")
+    handler.close()
+
+    log_data = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [log["message"] for log in log_data] == ["message"]
+    assert log_data[0]["logger_name"] == "test_add_log_sink"
+
+
+def test_set_log_level_keeps_sink_level(tmp_path: Path):
+    logger = get_logger("test_set_log_level_keeps_sink_level")
+    handler = BufferedFileHandler(str(tmp_path / "app.log"), level=logging.ERROR)
+
+    add_log_sink(handler)
+    try:
+        set_log_level(logging.DEBUG, "test_set_log_level_keeps_sink_level")
+        assert logger.isEnabledFor(logging.DEBUG)
+        assert handler.level == logging.ERROR
+    finally:
+        remove_log_sink(handler)
+        handler.close()
@@ -1,9 +1,32 @@
+import json
+import logging
 import pytest
+import threading
+import traceback
+import uuid
 from logging import Logger
-from typing import Any
+from pytest_mock import MockerFixture
+from typing import Any, Optional
+from starlette.datastructures import Headers, QueryParams
 from unittest.mock import Mock
 
-from python_utils.loggers import log_and_raise
+from python_utils.loggers import (
+    AsyncLogHandler,
+    AsyncLogPipeline,
+    CustomJsonFormatter,
+    LazyTraceback,
+    LogRateLimit,
+    LogRateLimitFilter,
+    disable_async_logging,
+    disable_log_rate_limiting,
+    enable_async_logging,
+    enable_log_rate_limiting,
+    get_logger,
+    log_and_raise,
+    logger_handlers,
+    logger_stdout_handlers,
+    set_log_level,
+)
 
 
 def test_simple_try_except():
@@ -68,3 +91,284 @@ def test_simple_try_except_with_extra_log_data():
     call_kwargs = logger.error.call_args.kwargs
     extra = call_kwargs["extra"]
     assert extra["extra"] == "data"
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self, gate: Optional[threading.Event] = None) -> None:
+        super().__init__()
+        self.gate = gate
+        self.messages: list[str] = []
+        self.thread_names: list[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.gate is not None:
+            self.gate.wait()
+        self.messages.append(record.getMessage())
+        self.thread_names.append(threading.current_thread().name)
+
+
+def test_async_log_pipeline_writes_on_listener_thread():
+    handler = RecordingHandler()
+    pipeline = AsyncLogPipeline()
+    pipeline.start()
+
+    for index in range(10):
+        record = logging.LogRecord("test", logging.INFO, __file__, 0, "message %d", (index,), None)
+        AsyncLogHandler(pipeline, handler).handle(record)
+    pipeline.stop()
+
+    assert handler.messages == [f"message {index}" for index in range(10)]
+    assert set(handler.thread_names) == {"async-log-listener"}
+    assert pipeline.get_stats()["handled"] == 10
+
+
+def test_async_log_pipeline_drops_when_full():
+    release = threading.Event()
+    handler = RecordingHandler(release)
+    pipeline = AsyncLogPipeline(queue_size=2, overflow_policy="drop")
+    pipeline.start()
+
+    for index in range(10):
+        pipeline.enqueue(handler, logging.LogRecord("test", logging.INFO, __file__, 0, str(index), None, None))
+    release.set()
+    pipeline.stop()
+
+    stats = pipeline.get_stats()
+    assert stats["dropped"] > 0
+    assert stats["enqueued"] + stats["dropped"] == 10
+    assert len(handler.messages) == stats["enqueued"]
+
+
+def test_async_log_pipeline_blocks_when_full():
+    handler = RecordingHandler()
+    pipeline = AsyncLogPipeline(queue_size=1, overflow_policy="block")
+    pipeline.start()
+
+    for index in range(100):
+        pipeline.enqueue(handler, logging.LogRecord("test", logging.INFO, __file__, 0, str(index), None, None))
+    pipeline.stop()
+
+    assert pipeline.get_stats()["dropped"] == 0
+    assert handler.messages == [str(index) for index in range(100)]
+
+
+def test_enable_async_logging_moves_existing_loggers():
+    logger = get_logger("test_enable_async_logging")
+    handler = RecordingHandler()
+    logger_handlers["test_enable_async_logging"].append(handler)
+    logger.addHandler(handler)
+
+    pipeline = enable_async_logging()
+    try:
+        assert not any(logger_handler is handler for logger_handler in logger.handlers)
+        logger.info("async message")
+    finally:
+        disable_async_logging()
+
+    assert handler.messages == ["async message"]
+    assert handler.thread_names == ["async-log-listener"]
+    assert pipeline.get_stats()["handled"] >= 1
+    assert any(logger_handler is handler for logger_handler in logger.handlers)
+
+
+def test_get_logger_level():
+    logger = get_logger("test_get_logger_level", logging.WARNING)
+
+    assert not logger.isEnabledFor(logging.INFO)
+    assert logger.isEnabledFor(logging.WARNING)
+
+
+def test_set_log_level():
+    logger = get_logger("test_set_log_level")
+    other_logger = get_logger("test_set_log_level_other")
+    assert not logger.isEnabledFor(logging.DEBUG)
+
+    set_log_level(logging.DEBUG, "test_set_log_level")
+
+    assert logger.isEnabledFor(logging.DEBUG)
+    assert all(handler.level == logging.DEBUG for handler in logger_stdout_handlers["test_set_log_level"])
+    assert not other_logger.isEnabledFor(logging.DEBUG)
+
+    set_log_level(logging.ERROR, "test_set_log_level")
+
+    assert not logger.isEnabledFor(logging.WARNING)
+
+
+def get_log_record() -> logging.LogRecord:
+    record = logging.LogRecord("test", logging.INFO, __file__, 42, "message %s", ("argument",), None)
+    record.request_id = uuid.uuid4()
+    record.command_args = (1, "two")
+    return record
+
+
+def test_fast_json_formatter_matches_default_formatter():
+    record = get_log_record()
+
+    assert CustomJsonFormatter(fast=True).format(record) == CustomJsonFormatter().format(record)
+    assert CustomJsonFormatter(fast=True, indent=4).format(record) == CustomJsonFormatter(indent=4).format(record)
+
+
+def test_fast_json_formatter_encodes_common_types():
+    record = get_log_record()
+    record.headers = Headers({"content-type": "application/json"})
+    record.error = ValueError("some error")
+    record.tags = {"tag"}
+
+    log_data = json.loads(CustomJsonFormatter(fast=True).format(record))
+
+    assert log_data["message"] == "message argument"
+    assert log_data["request_id"] == str(record.request_id)
+    assert log_data["headers"] == {"content-type": "application/json"}
+    assert log_data["error"] == "ValueError: some error"
+    assert log_data["tags"] == ["tag"]
+
+
+def test_fast_json_formatter_keeps_repeated_keys():
+    record = get_log_record()
+    record.query_params = QueryParams("a=1&a=2&b=3")
+    record.headers = Headers(raw=[(b"accept", b"text/html"), (b"accept", b"application/json")])
+
+    log_data = json.loads(CustomJsonFormatter(fast=True).format(record))
+
+    assert log_data["query_params"] == {"a": ["1", "2"], "b": "3"}
+    assert log_data["headers"] == {"accept": ["text/html", "application/json"]}
+
+
+def test_json_formatter_compact():
+    record = get_log_record()
+
+    formatted_record = CustomJsonFormatter(fast=True, compact=True).format(record)
+
+    assert ", " not in formatted_record
+    assert json.loads(formatted_record) == json.loads(CustomJsonFormatter().format(record))
+    assert CustomJsonFormatter(compact=True).format(record) == formatted_record
+
+
+def test_json_formatter_cached_time():
+    log_formatter = CustomJsonFormatter(fast=True)
+    for created in [1_700_000_000.123, 1_700_000_000.456, 1_700_000_001.789]:
+        record = get_log_record()
+        record.created = created
+        record.msecs = (created - int(created)) * 1000
+
+        assert json.loads(log_formatter.format(record))["time"] == log_formatter.formatTime(record)
+
+
+def test_log_rate_limit_filter():
+    rate_limit_filter = LogRateLimitFilter(
+        default_limit=LogRateLimit(rate_per_second=0.001, burst=3),
+        level_limits={logging.CRITICAL: None},
+        summary_interval_seconds=3600,
+    )
+
+    def get_record(level: int, message: str) -> logging.LogRecord:
+        return logging.LogRecord("test", level, __file__, 0, message, None, None)
+
+    error_results = [rate_limit_filter.filter(get_record(logging.ERROR, "Request failed")) for _ in range(10)]
+    other_message_result = rate_limit_filter.filter(get_record(logging.ERROR, "Other message"))
+    critical_results = [rate_limit_filter.filter(get_record(logging.CRITICAL, "Request failed")) for _ in range(10)]
+
+    assert error_results == [True] * 3 + [False] * 7
+    assert other_message_result
+    assert all(critical_results)
+    assert rate_limit_filter.get_stats()["suppressed"] == 7
+
+
+def test_log_rate_limiting_summary():
+    logger = get_logger("test_log_rate_limiting_summary")
+    handler = RecordingHandler()
+    logger.addHandler(handler)
+
+    rate_limit_filter = enable_log_rate_limiting(
+        default_limit=LogRateLimit(rate_per_second=0.001, burst=2), summary_interval_seconds=3600
+    )
+    try:
+        for _ in range(5):
+            logger.error("Some error")
+        rate_limit_filter.emit_summaries()
+    finally:
+        disable_log_rate_limiting()
+        logger.removeHandler(handler)
+
+    assert handler.messages == ["Some error", "Some error", "Suppressed 3 similar records"]
+    assert rate_limit_filter not in logger.filters
+
+
+def raise_nested_exception(depth: int) -> None:
+    if depth == 0:
+        raise ValueError("nested exception")
+    raise_nested_exception(depth - 1)
+
+
+def test_lazy_traceback():
+    try:
+        raise_nested_exception(5)
+    except ValueError:
+        expected_traceback = traceback.format_exc()
+        lazy_traceback = LazyTraceback()
+
+    assert lazy_traceback._rendered is None  # pyright: ignore[reportPrivateUsage]
+    assert str(lazy_traceback) == expected_traceback
+    assert json.loads(json.dumps({"traceback": lazy_traceback}, default=str))["traceback"] == expected_traceback
+
+
+def test_lazy_traceback_is_taken_at_log_time():
+    lazy_tracebacks: list[LazyTraceback] = []
+
+    def log_and_reraise():
+        try:
+            raise_nested_exception(1)
+        except ValueError:
+            lazy_tracebacks.append(LazyTraceback())
+            lazy_tracebacks.append(LazyTraceback())
+            str(lazy_tracebacks[0])
+            raise
+
+    try:
+        log_and_reraise()
+    except ValueError:
+        pass
+
+    # The frames added while the exception propagated to this test are not rendered
+    assert str(lazy_tracebacks[1]) == str(lazy_tracebacks[0])
+    assert "test_lazy_traceback_is_taken_at_log_time" not in str(lazy_tracebacks[1])
+    assert lazy_tracebacks[1].fingerprint == lazy_tracebacks[0].fingerprint
+
+
+def test_lazy_traceback_frame_limit():
+    try:
+        raise_nested_exception(5)
+    except ValueError as exception:
+        lazy_traceback = LazyTraceback(exception, frame_limit=2)
+
+    rendered_traceback = str(lazy_traceback)
+    assert rendered_traceback.count("in raise_nested_exception") == 2
+    assert "test_lazy_traceback_frame_limit" not in rendered_traceback
+    assert rendered_traceback.endswith("ValueError: nested exception\n")
+
+
+def test_lazy_traceback_dedup(mocker: MockerFixture):
+    mocker.patch("python_utils.loggers.global_traceback_dedup", True)
+
+    lazy_tracebacks: list[LazyTraceback] = []
+    for _ in range(2):
+        try:
+            raise_nested_exception(1)
+        except ValueError as exception:
+            lazy_tracebacks.append(LazyTraceback(exception))
+
+    assert lazy_tracebacks[0].fingerprint == lazy_tracebacks[1].fingerprint
+    assert "ValueError: nested exception" in str(lazy_tracebacks[0])
+    assert str(lazy_tracebacks[1]) == f"Traceback already logged, fingerprint {lazy_tracebacks[0].fingerprint}\n"
+
+
+def test_log_and_raise_lazy_traceback():
+    logger: Any = Mock(spec=Logger)
+
+    with pytest.raises(ValueError):
+        with log_and_raise(logger):
+            raise ValueError("original exception")
+
+    lazy_traceback = logger.error.call_args.kwargs["extra"]["traceback"]
+    assert isinstance(lazy_traceback, LazyTraceback)
+    assert str(lazy_traceback).endswith("ValueError: original exception\n")
@@ -0,0 +1,100 @@
+import math
+import pytest
+import threading
+
+from python_utils.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+
+def test_histogram_snapshot():
+    histogram = Histogram(buckets=[0.1, 0.5, 1.0])
+    for value in [0.05, 0.2, 0.3, 0.7, 2.0]:
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot.bucket_counts == (1, 2, 1, 1)
+    assert snapshot.count == 5
+    assert math.isclose(snapshot.sum, 3.25)
+    assert snapshot.max == 2.0
+
+
+def test_histogram_quantile():
+    histogram = Histogram(buckets=[0.1, 0.5, 1.0])
+    for _ in range(98):
+        histogram.observe(0.05)
+    histogram.observe(0.7)
+    histogram.observe(3.0)
+
+    snapshot = histogram.snapshot()
+    assert snapshot.quantile(0.5) == 0.1
+    assert snapshot.quantile(0.99) == 1.0
+    assert snapshot.quantile(1.0) == 3.0
+
+
+def test_histogram_quantile_empty():
+    assert math.isnan(Histogram().snapshot().quantile(0.5))
+
+
+def test_counter():
+    counter = Counter()
+
+    def increment():
+        for _ in range(1000):
+            counter.increment()
+
+    threads = [threading.Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.value == 4000
+
+
+def test_gauge():
+    gauge = Gauge()
+    gauge.increment()
+    gauge.increment(2)
+    gauge.decrement()
+
+    assert gauge.value == 2
+
+
+def test_metrics_registry_labels():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ("method",))
+
+    requests.labels("GET").increment()
+    requests.labels("GET").increment()
+    requests.labels("POST").increment()
+
+    assert requests.labels("GET").value == 2
+    assert registry.counter("requests_total", "Requests", ("method",)) is requests
+    with pytest.raises(ValueError):
+        registry.gauge("requests_total", "Requests", ("method",))
+    with pytest.raises(ValueError):
+        requests.labels("GET", "/")
+
+
+def test_metrics_registry_render_prometheus():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests", ("method", "path")).labels("GET", 'a"b').increment()
+    registry.gauge("in_flight", "In flight").labels().increment()
+    latency = registry.histogram("latency_seconds", "Latency", ("method",), buckets=[0.1, 1.0])
+    for value in [0.05, 0.5, 2.0]:
+        latency.labels("GET").observe(value)
+
+    assert registry.render_prometheus().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{method="GET",path="a\\"b"} 1',
+        "# HELP in_flight In flight",
+        "# TYPE in_flight gauge",
+        "in_flight 1.0",
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{method="GET",le="0.1"} 1',
+        'latency_seconds_bucket{method="GET",le="1.0"} 2',
+        'latency_seconds_bucket{method="GET",le="+Inf"} 3',
+        'latency_seconds_sum{method="GET"} 2.55',
+        'latency_seconds_count{method="GET"} 3',
+    ]
@@ -1,4 +1,5 @@
 import pytest
+from sqlalchemy import text
 
 from python_utils.sqlalchemy_postgresql_engine_wrapper import SqlAlchemyPostgresqlEngineWrapper
 from python_utils.testing.database import database_container
@@ -40,3 +41,19 @@ def test__engine_wrapper_init_and_create_session(setup_db: None):
     session = engine_wrapper.create_session()
     # Assert that the session is created
     assert session is not None
+
+
+def test__engine_wrapper_create_read_only_session(setup_db: None):
+    engine_wrapper = SqlAlchemyPostgresqlEngineWrapper(
+        sql_user="user",
+        sql_password="password",
+        sql_host="localhost",
+        sql_port=55432,
+        sql_database="test_db",
+        pool_size=5,
+        replica_sql_host="localhost",
+    )
+
+    with engine_wrapper.create_read_only_session() as session:
+        transaction_read_only = session.execute(text("SHOW transaction_read_only")).scalar()
+    assert transaction_read_only == "on"
@@ -0,0 +1,168 @@
+import hashlib
+import pytest
+import time
+
+from python_utils.sqlalchemy_postgresql_engine_wrapper import SqlAlchemyPostgresqlEngineWrapper
+from python_utils.testing.database import database_container
+from python_utils.testing.docker import docker_compose_dir
+from python_utils.token_revocation import (
+    BloomFilter,
+    InMemoryRevocationStore,
+    SqlAlchemyPostgresqlRevocationStore,
+    TokenRevocationList,
+)
+
+
+def get_digest(value: str) -> bytes:
+    return hashlib.sha256(value.encode()).digest()
+
+
+def test_bloom_filter():
+    bloom_filter = BloomFilter(expected_items=1000, false_positive_rate=0.01)
+    for index in range(1000):
+        bloom_filter.add(get_digest(f"revoked_{index}"))
+
+    assert all(get_digest(f"revoked_{index}") in bloom_filter for index in range(1000))
+    false_positives = sum(get_digest(f"valid_{index}") in bloom_filter for index in range(10000))
+    assert false_positives < 300
+
+
+def test_bloom_filter_invalid_parameters():
+    with pytest.raises(ValueError):
+        BloomFilter(expected_items=0)
+    with pytest.raises(ValueError):
+        BloomFilter(expected_items=10, false_positive_rate=1)
+
+
+def test_in_memory_revocation_store():
+    store = InMemoryRevocationStore()
+    store.revoke(get_digest("token_1"), None)
+    store.revoke(get_digest("token_2"), time.time() - 1)
+
+    assert store.is_revoked(get_digest("token_1"))
+    assert not store.is_revoked(get_digest("token_2"))
+    assert not store.is_revoked(get_digest("token_3"))
+
+    token_digests, cursor = store.get_revoked_since(0)
+    assert token_digests == [get_digest("token_1")]
+    assert cursor == 2
+    assert store.get_revoked_since(cursor) == ([], 2)
+
+
+def test_token_revocation_list():
+    revocation_list = TokenRevocationList(InMemoryRevocationStore(), expected_revocations=100)
+    revocation_list.revoke(get_digest("token_1"))
+
+    assert revocation_list.is_revoked(get_digest("token_1"))
+    assert not revocation_list.is_revoked(get_digest("token_2"))
+
+
+def test_token_revocation_list_sync_from_shared_store():
+    store = InMemoryRevocationStore()
+    store.revoke(get_digest("token_1"), None)
+    revocation_list = TokenRevocationList(store, expected_revocations=100)
+    other_revocation_list = TokenRevocationList(store, expected_revocations=100)
+
+    other_revocation_list.revoke(get_digest("token_2"))
+    assert revocation_list.is_revoked(get_digest("token_1"))
+    assert not revocation_list.is_revoked(get_digest("token_2"))
+
+    revocation_list.sync()
+    assert revocation_list.is_revoked(get_digest("token_2"))
+
+
+def test_token_revocation_list_rebuild_when_full():
+    store = InMemoryRevocationStore()
+    revocation_list = TokenRevocationList(store, expected_revocations=2)
+    for index in range(5):
+        store.revoke(get_digest(f"token_{index}"), None)
+
+    revocation_list.sync()
+
+    assert all(revocation_list.is_revoked(get_digest(f"token_{index}")) for index in range(5))
+
+
+def test_token_revocation_list_sync_ignores_digests_returned_again():
+    class OverlappingRevocationStore(InMemoryRevocationStore):
+        def get_revoked_since(self, cursor: int) -> tuple[list[bytes], int]:
+            return super().get_revoked_since(max(0, cursor - 1))
+
+    store = OverlappingRevocationStore()
+    store.revoke(get_digest("token_1"), None)
+    revocation_list = TokenRevocationList(store, expected_revocations=100)
+    for _ in range(3):
+        revocation_list.sync()
+
+    assert revocation_list._bloom_filter.count == 1  # pyright: ignore[reportPrivateUsage]
+    assert revocation_list.is_revoked(get_digest("token_1"))
+
+
+def test_token_revocation_list_periodic_sync():
+    store = InMemoryRevocationStore()
+    revocation_list = TokenRevocationList(store, expected_revocations=100, sync_interval_seconds=0.01)
+    revocation_list.start_sync()
+    store.revoke(get_digest("token_1"), None)
+
+    for _ in range(100):
+        if revocation_list.is_revoked(get_digest("token_1")):
+            break
+        time.sleep(0.01)
+
+    revocation_list.stop_sync()
+    assert revocation_list.is_revoked(get_digest("token_1"))
+
+
+DOCKER_COMPOSE_FILE = """
+services:
+  postgresql:
+    image: bitnami/postgresql:14
+    ports:
+      - 55433:5432
+    environment:
+      - POSTGRESQL_USERNAME=user
+      - POSTGRESQL_PASSWORD=password
+      - POSTGRESQL_DATABASE=test_db
+"""
+
+
+@pytest.fixture(scope="module")
+def setup_db():
+    with docker_compose_dir(DOCKER_COMPOSE_FILE) as dir_path:
+        with database_container(
+            dir_path, "postgresql", "test_db", "user", "password", "localhost", 55433
+        ):
+            yield
+
+
+def test_postgresql_revocation_store(setup_db: None):
+    engine_wrapper = SqlAlchemyPostgresqlEngineWrapper(
+        sql_user="user",
+        sql_password="password",
+        sql_host="localhost",
+        sql_port=55433,
+        sql_database="test_db",
+        pool_size=5,
+    )
+    store = SqlAlchemyPostgresqlRevocationStore(engine_wrapper)
+    store.create_table()
+
+    store.revoke(get_digest("token_1"), None)
+    store.revoke(get_digest("token_1"), None)
+    store.revoke(get_digest("token_2"), time.time() - 1)
+
+    assert store.is_revoked(get_digest("token_1"))
+    assert not store.is_revoked(get_digest("token_2"))
+
+    token_digests, cursor = store.get_revoked_since(0)
+    assert token_digests == [get_digest("token_1")]
+    assert store.get_revoked_since(cursor) == ([get_digest("token_1")], cursor)
+
+    # A revocation committed late, with an id below the cursor, is still synced
+    with engine_wrapper.create_session() as session:
+        session.execute(store.table.insert().values(id=cursor - 1, token_digest=get_digest("token_3")))
+        session.commit()
+    assert get_digest("token_3") in store.get_revoked_since(cursor)[0]
+
+    store.purge_expired()
+    revocation_list = TokenRevocationList(store, expected_revocations=100)
+    assert revocation_list.is_revoked(get_digest("token_1"))